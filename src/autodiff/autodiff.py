@@ -7,13 +7,151 @@ from autodiff import visualizer
 # our dependencies
 import numpy as np
 import imageio
+import hashlib
+import os
+import threading
 import warnings
+import weakref
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# the names that are exported by import *
+# sum, prod and compile are left out because they would replace the builtins of the
+# importing module, and are available as add_n, mul_n and compile_graph instead
+__all__ = ['Node', 'var', 'const', 'get_function', 'get_reduction', 'register_operation',
+           'get_operation_fingerprint', 'set_flatten_reductions', 'set_interning', 'cse', 'structural_hash',
+           'simplify', 'sin', 'cos', 'exp', 'tan', 'add', 'log', 'ln', 'arcsin', 'arccos', 'arctan', 'sinh',
+           'cosh', 'tanh', 'logistic', 'sqrt', 'add_n', 'mul_n', 'evaluate', 'hessian', 'hvp',
+           'sparse_jacobian', 'CSRMatrix', 'CompiledFunction', 'EvaluationCache', 'evaluate_many',
+           'compile_graph', 'evict_cache', 'save', 'load', 'StoredGraph', 'StoredNode']
+
+# these are the keyword arguments of evaluate that are not variable names
+evaluate_keywords = {'wrt', 'plot', 'seed_dict', 'mode', 'output', 'out', 'order', 'direction'}
+
+# when this is enabled, chained + and * operations are collapsed into n-ary sum and prod nodes
+flatten_reductions = False
+
+# every variable name is assigned a bit, so that the set of variables that a node
+# depends on can be stored as an integer bitmask on the node
+# only the first mask_max_bits names get a bit, so the masks stay small.  Nodes that depend
+# on a variable without a bit have no mask, and their variables are found by traversal
+variable_bits = {}
+variable_names = []
+mask_max_bits = 256
+
+# when this is enabled, structurally identical nodes are only created once
+# the table only holds weak references, so nodes are freed when they are no longer used
+interning = False
+intern_table = weakref.WeakValueDictionary()
+
+# the on-disk cache of compiled graphs, see compile_graph
+# the format version is part of every cache key and is increased when the format changes
+cache_format_version = 1
+default_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'autodiff')
+cache_max_bytes = 256 * 1024 * 1024
+
+# the registry of operations, which maps the name of each operation to its function,
+# derivative, kernel, partials, second derivative and Taylor rule.  Nodes refer to their operation by name, so that
+# graphs can be pickled without pickling the functions themselves.
+operations = {}
+
+# the names under which operations were registered, keyed by the arguments of register_operation,
+# so that registering the same functions again returns the existing operation
+registered_operations = {}
+
+# the names of the registered operations, keyed by their name, function and derivative,
+# so that nodes that are built directly from these functions reuse the operation, see Node.__init__
+operation_index = {}
+
+
+# this function computes a fingerprint of the functions of a registered operation
+def get_operation_fingerprint(op):
+    """This function returns a hash of the code of the functions of a registered operation.
+    This is stored with compiled graphs in the on-disk cache, so that entries that were
+    compiled with a different version of an operation are detected and rebuilt.
+
+    arguments:
+    op -- the name of the registered operation
+    """
+    if op not in operations:
+        raise ValueError(f'Unknown operation: {op}')
+
+    def add_code(digest, code):
+        digest.update(code.co_code)
+        digest.update(repr(code.co_names).encode())
+        for constant in code.co_consts:
+            # nested functions have code objects, whose representation contains an address
+            if hasattr(constant, 'co_code'):
+                add_code(digest, constant)
+            else:
+                digest.update(repr(constant).encode())
+
+    digest = hashlib.sha256(op.encode())
+    for function in operations[op]:
+        code = getattr(function, '__code__', None)
+        if code is not None:
+            add_code(digest, code)
+            # the derivative that is taken from a kernel refers to the kernel through its closure
+            for cell in getattr(function, '__closure__', None) or ():
+                if hasattr(cell.cell_contents, '__code__'):
+                    add_code(digest, cell.cell_contents.__code__)
+        else:
+            digest.update(repr(function).encode())
+    return digest.hexdigest()
+
+
+# this function adds an operation to the registry
+def register_operation(name, function, derivative, value_and_derivative=None, partials=None,
+                       second_derivative=None, taylor=None):
+    """This function adds an operation to the registry of operations and returns the name
+    under which it was registered.  Registering the same functions under the same name again
+    returns the existing operation.  If a different operation is already registered under the
+    same name, a number is appended to the name.  Operations have to be registered in the
+    same order in every process that a graph is sent to, which is the case for operations
+    that are created when a module is imported.  Pickled graphs store the fingerprints of
+    their operations, so a graph that refers to a different operation under the same name
+    raises a ValueError instead of silently using it.
+
+    arguments:
+    name -- the name of the operation
+    function -- the function to use for computing the value
+    derivative -- the function to use for computing the derivative, or None to take it from
+                  value_and_derivative
+    value_and_derivative -- optionally, the function that computes the value and the derivative together
+    partials -- for reductions, the function that computes the partial derivatives
+    second_derivative -- optionally, the function that computes the derivatives of the partial
+                         derivatives, see get_function.  This is needed by hessian and hvp.
+    taylor -- optionally, the function that propagates truncated Taylor series, see get_function.
+              This is needed by the Taylor mode of evaluate.
+    """
+    key = (name, function, derivative, value_and_derivative, partials, second_derivative, taylor)
+    if key in registered_operations:
+        return registered_operations[key]
+
+    if derivative is None:
+        # the derivative is taken from the kernel
+        def derivative(*args):
+            return value_and_derivative(*args)[1]
+
+    entry = (function, derivative, value_and_derivative, partials, second_derivative, taylor)
+    op = name
+    count = 1
+    while op in operations and operations[op] != entry:
+        count += 1
+        op = f'{name}#{count}'
+    operations[op] = entry
+    registered_operations[key] = op
+    operation_index.setdefault((name, function, derivative), op)
+    return op
 
 
 # this is a closure that allows to define a new function
 # that can be used with autodiff
 # for each function, a primary function and its derivative is supplied
-def get_function(function_name, function, derivative):
+# optionally, a kernel that computes both at once can be supplied instead of the derivative
+def get_function(function_name, function, derivative=None, value_and_derivative=None, second_derivative=None,
+                 taylor=None):
     """This is a closure that generates the necessary
       function to do node insertions into a binary graph
       and set up the necessary valuation and derivative
@@ -32,8 +170,37 @@ def get_function(function_name, function, derivative):
                     derivative of the left value, and derivative of
                     the right value.  These are combined together
                     to perform the chain rule for the computation
-                    of our derivative.
+                    of our derivative.  This can be omitted if
+                    value_and_derivative is supplied.
+      value_and_derivative -- optionally, a function object that computes
+                    the value and the derivative together and returns
+                    them as a tuple.  This takes the same arguments as
+                    the derivative, so intermediate results such as
+                    np.exp(x) can be shared between the value and the
+                    derivative.  It is used whenever the derivative of
+                    a node is needed, and the function is used when
+                    only the value is needed.
+      second_derivative -- optionally, a function object that computes
+                    the derivatives of the partial derivatives of the
+                    function in the direction of the derivatives of its
+                    children.  For unary functions this takes x and xp
+                    and returns f''(x) * xp.  For binary functions this
+                    takes x, y, xp and yp and returns a tuple with the
+                    derivatives of the partial derivatives with respect
+                    to x and y.  This is needed by hessian and hvp.
+      taylor -- optionally, a function object that computes the
+                    coefficients of the truncated Taylor series of the
+                    function from the coefficients of the series of its
+                    children, see Node.eval_taylor.  It takes one array
+                    of coefficients for each child, and returns the
+                    array of coefficients of the result.  This is needed
+                    by the Taylor mode of evaluate.
     """
+    if derivative is None and value_and_derivative is None:
+        raise ValueError(f'Please supply a derivative for the function: {function_name}')
+
+    op = register_operation(function_name, function, derivative, value_and_derivative,
+                            second_derivative=second_derivative, taylor=taylor)
 
     # generate the function that can be used to elementary mathematical functions
     def inner_function(item, other_item=None):
@@ -47,28 +214,181 @@ def get_function(function_name, function, derivative):
            item -- This is the left node or numeric value (both are supported)
            other_item -- This is the right node or numeric value
         """
-        new_node = Node(None, None, function, derivative, function_name)
         # we support Node objects or numeric values
-        # if a numeric value is passed, we turn it into a constant Node
-        if isinstance(item, Node):
-            new_node.left = item
-        else:
-            new_node.left = Node(value=item)
-        # some functions are binary and supply an other_item.
-        # if this item is a Node, we set that to the right child node
-        # if it is a numeric value, we create a new constant node
-        if other_item is not None:
-            if isinstance(other_item, Node):
-                new_node.right = other_item
-            else:
-                new_node.right = Node(value=other_item)
+        # if a numeric value is passed, it is turned into a constant Node.
+        # some functions are binary and supply an other_item, which becomes
+        # the right child node
+        new_node = Node.create(op, function_name, item, other_item)
+        return new_node
+
+    # return the inner function
+    return inner_function
+
 
+# this is a closure that allows to define a new n-ary reduction function
+# for each function, a primary function, its derivative, and its partial derivatives are supplied
+def get_reduction(function_name, function, derivative, partials, second_derivative=None, taylor=None):
+    """This is a closure that generates the necessary function to insert
+      an n-ary reduction node, such as a sum or product over many terms, into
+      the graph.  Instead of a long chain of binary nodes, a reduction node
+      has a list of operands and computes its value and derivative in a single
+      vectorized numpy operation over all of them.
+
+      arguments:
+      function -- the function object to use for evaluation
+                  This function takes a single array with the values
+                  of the operands stacked along the first axis.
+      derivative -- the function object to use for evaluation
+                    of the derivative using the chain rule
+                    This function takes two arrays, the values and the
+                    derivatives of the operands stacked along the first axis.
+      partials -- the function object that returns the partial derivatives
+                  with respect to each operand, stacked along the first axis.
+                  This is used by the reverse mode.
+      second_derivative -- optionally, the function object that computes the
+                  derivatives of the partial derivatives in the direction of
+                  the derivatives of the operands.  This takes the same two
+                  arrays as the derivative, and returns the derivatives stacked
+                  along the first axis.  This is needed by hessian and hvp.
+      taylor -- optionally, the function object that computes the coefficients
+                  of the truncated Taylor series of the reduction from the
+                  coefficients of the operands, stacked along the first axis.
+                  This is needed by the Taylor mode of evaluate.
+    """
+    op = register_operation(function_name, function, derivative, partials=partials,
+                            second_derivative=second_derivative, taylor=taylor)
+
+    def inner_function(items):
+        """This inner function is what is generated
+           and returned through the closure.  This inner function
+           creates a reduction node over the given items.
+
+           arguments:
+           items -- a list of nodes or numeric values (both are supported)
+        """
+        if not (isinstance(items, list) or isinstance(items, tuple)) or len(items) == 0:
+            raise ValueError(f'Please supply a non-empty list of nodes or numeric values to {function_name}')
+
+        new_node = Node.create_reduction(op, function_name, items)
         return new_node
 
     # return the inner function
     return inner_function
 
 
+# this function is used to switch the flattening of chained + and * operations on and off
+def set_flatten_reductions(enabled):
+    """This function enables or disables the collapsing of chained + and * operations into
+    n-ary sum and prod nodes.  With this enabled, x + y + z creates a single sum node with
+    three operands instead of two nested binary nodes.  This is useful for long sums, such as
+    loss functions over many residuals.
+
+    arguments:
+    enabled -- True to collapse chained operations, False for binary nodes
+    """
+    global flatten_reductions
+    flatten_reductions = enabled
+
+
+# this function is used to switch the interning of nodes on and off
+def set_interning(enabled):
+    """This function enables or disables the interning (hash-consing) of nodes.  With this
+    enabled, creating a node that is structurally identical to an existing node, that is,
+    the same function applied to the same children, the same constant or the same variable,
+    returns the existing node.  For example, sin(x) * sin(x) then has a single sin node that
+    is only evaluated once.
+
+    arguments:
+    enabled -- True to intern new nodes, False to always create new nodes
+    """
+    global interning
+    interning = enabled
+    if not enabled:
+        intern_table.clear()
+
+
+# this function merges the structurally identical nodes of an existing graph
+def cse(node):
+    """This function performs common subexpression elimination on a graph that has already
+    been built.  Structurally identical nodes are merged, and the root node of the merged
+    graph is returned.  The given graph is not modified: nodes whose children were merged
+    are replaced by new nodes, like in simplify, and the subtrees that are unchanged are
+    shared with the given graph.  This does not depend on the interning mode.
+
+    arguments:
+    node -- the root node of the graph
+    """
+    if not isinstance(node, Node):
+        raise ValueError('Please specify a node for common subexpression elimination')
+
+    table = {}
+    canonical = {}
+    # the children come before their parents, so they are already merged
+    for item in Node.topological_order(node):
+        merged = Node.replace_children(item, canonical)
+        key = Node.get_key(merged)
+        if key is None:
+            canonical[id(item)] = merged
+        else:
+            canonical[id(item)] = table.setdefault(key, merged)
+    return canonical[id(node)]
+
+
+# this function computes a hash of the structure of a graph
+def structural_hash(node):
+    """This function returns a hash of the structure of a graph as a hexadecimal string.  The
+    hash is computed from the names of the operations, the names of the functions, the
+    constants, the variable names and the connections between the nodes, so it is the same
+    in every process for graphs that are built in the same way.  The values of the last
+    evaluation are not included.
+
+    arguments:
+    node -- the root node of the graph
+    """
+    if not isinstance(node, Node):
+        raise ValueError('Please specify a node to hash')
+
+    digest = hashlib.sha256()
+    for record in Node.to_records(node):
+        if record[0] == 'const':
+            # the type is included since 1 and 1.0 behave differently
+            record = ('const', type(record[1]).__name__, repr(record[1]))
+        elif record[0] == 'op':
+            # the functions of the operations are checked separately, see load_cached
+            record = record[:5]
+        digest.update(repr(record).encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+# this function folds constants and removes operations that don't change their input
+def simplify(node):
+    """This function returns a smaller graph that computes the same values as the given graph.
+    Every subtree that only contains constants is folded into a single constant, and the
+    following identities are applied: x * 1, 1 * x, x / 1, x ** 1, x - 0, x + (-0.0), -(-x) are
+    replaced by x, and x - x is replaced by 0 if x is a variable.  For all finite inputs, the
+    simplified graph gives bitwise identical values and raises the same errors as the given
+    graph.  This is why x + 0 is not simplified (it turns -0.0 into 0.0), and why x - x is not
+    simplified when x is computed by a function, which could raise an error or give nan.
+    x - x is also only replaced if this doesn't remove a variable from the graph.  The given
+    graph is not modified, and the subtrees that are unchanged are shared with it.
+
+    arguments:
+    node -- the root node of the graph
+    """
+    if not isinstance(node, Node):
+        raise ValueError('Please specify a node to simplify')
+
+    simplified = Node.simplify_graph(node, cancel=True)
+    vars = set()
+    simplified_vars = set()
+    Node.get_variables(node, vars)
+    Node.get_variables(simplified, simplified_vars)
+    if simplified_vars != vars:
+        simplified = Node.simplify_graph(node, cancel=False)
+    return simplified
+
+
 # this is a helper function that creates a variable node
 def var(var_name):
     """This is a helper function that generates a Node that is a variable type
@@ -76,7 +396,7 @@ def var(var_name):
             arguments:
             var_name -- This is the name of the variable to create
       """
-    return Node(var_name=var_name)
+    return Node.intern(Node(var_name=var_name))
 
 
 # this is a helper function that creates a constant
@@ -90,34 +410,444 @@ def const(value):
         value -- This is the value for the new constant
           """
     if isinstance(value, int) or isinstance(value, float):
-        return Node(value=value)
+        return Node.intern(Node(value=value))
     else:
         raise ValueError("Only integers and floating point numbers are supported for constants.")
 
 
+# the value and derivative of exp, the derivative is the value itself
+def _exp_kernel(x, xp):
+    """This function returns the value and the derivative of exp.
+
+    arguments:
+    x -- the value of the child node
+    xp -- the derivative of the child node
+    """
+    value = np.exp(x)
+    return value, xp * value
+
+
+# the value and derivative of tan, the derivative is 1 + tan(x)^2
+def _tan_kernel(x, xp):
+    """This function returns the value and the derivative of tan.
+
+    arguments:
+    x -- the value of the child node
+    xp -- the derivative of the child node
+    """
+    value = np.tan(x)
+    return value, xp * (1 + value ** 2)
+
+
+# the value and derivative of tanh, the derivative is 1 - tanh(x)^2
+def _tanh_kernel(x, xp):
+    """This function returns the value and the derivative of tanh.
+
+    arguments:
+    x -- the value of the child node
+    xp -- the derivative of the child node
+    """
+    value = np.tanh(x)
+    # this is 1 - value^2, factored so that it stays accurate when value is close to 1
+    return value, xp * (1 - value) * (1 + value)
+
+
+# the value and derivative of the log to any base
+def _log_kernel(x, y, xp, yp):
+    """This function returns the value and the derivative of the log of x to the base y.
+
+    arguments:
+    x -- the value of the left node
+    y -- the value of the right node (the base)
+    xp -- the derivative of the left node
+    yp -- the derivative of the right node
+    """
+    log_x = np.log(x)
+    log_y = np.log(y)
+    return log_x / log_y, (xp * log_y / x - (log_x * yp / y)) / (log_y ** 2)
+
+
+# the value and derivative of the logistic function
+def _logistic_kernel(x, xp):
+    """This function returns the value and the derivative of the logistic function.
+
+    arguments:
+    x -- the value of the child node
+    xp -- the derivative of the child node
+    """
+    exp_x = np.exp(x)
+    denominator = 1 + exp_x
+    return exp_x / denominator, exp_x * xp / (denominator ** 2)
+
+
+# the value and derivative of sqrt
+def _sqrt_kernel(x, xp):
+    """This function returns the value and the derivative of sqrt.
+
+    arguments:
+    x -- the value of the child node
+    xp -- the derivative of the child node
+    """
+    value = np.sqrt(x)
+    return value, xp / (2 * value)
+
+
+# the derivatives of the partial derivatives of the log to any base
+def _log_second(x, y, xp, yp):
+    """This function returns the derivatives of the partial derivatives of the log of x to
+    the base y in the direction of the derivatives of x and y.
+
+    arguments:
+    x -- the value of the left node
+    y -- the value of the right node (the base)
+    xp -- the derivative of the left node
+    yp -- the derivative of the right node
+    """
+    log_x = np.log(x)
+    log_y = np.log(y)
+    cross = -1 / (x * y * log_y ** 2)
+    return (-xp / (x ** 2 * log_y) + cross * yp,
+            cross * xp + log_x * (log_y + 2) / (y ** 2 * log_y ** 3) * yp)
+
+
+# the arithmetic of truncated Taylor series, which is used by the Taylor mode, see Node.eval_taylor
+# a series is an array with the coefficients of 1, t, t^2, ... along the first axis
+# every coefficient of a result only depends on the coefficients of the same or lower degree,
+# so each function costs O(k^2) operations for a series of degree k
+def _taylor_constant(value, like):
+    """This function returns the series of a constant, with the same length as another series.
+
+    arguments:
+    value -- the constant
+    like -- the other series
+    """
+    result = np.zeros(np.shape(like))
+    result[0] = value
+    return result
+
+
+# the coefficients multiplied by their degrees, which are the coefficients of t times the derivative
+def _taylor_scaled(a):
+    """This function returns the coefficients of a series multiplied by their degrees.
+
+    arguments:
+    a -- the series
+    """
+    return a * np.arange(len(a)).reshape((-1,) + (1,) * (np.ndim(a) - 1))
+
+
+# the product of two series
+def _taylor_mul(a, b):
+    """This function returns the product of two series, with the Cauchy product formula.
+
+    arguments:
+    a -- the left series
+    b -- the right series
+    """
+    result = np.zeros(np.broadcast_shapes(np.shape(a), np.shape(b)))
+    for j in range(len(result)):
+        result[j] = np.sum(a[:j + 1] * b[j::-1], axis=0)
+    return result
+
+
+# the quotient of two series
+def _taylor_div(a, b):
+    """This function returns the quotient of two series, whose coefficients are found one
+    degree at a time from the product of the quotient and the denominator.
+
+    arguments:
+    a -- the numerator
+    b -- the denominator
+    """
+    result = np.zeros(np.broadcast_shapes(np.shape(a), np.shape(b)))
+    for j in range(len(result)):
+        result[j] = (a[j] - np.sum(b[1:j + 1] * result[j - 1::-1][:j], axis=0)) / b[0]
+    return result
+
+
+# the series of a function whose derivative is known as a series
+def _taylor_integrate(a, g, value):
+    """This function returns the series of f(a), where the series of f'(a) is g, by integrating
+    f'(a) * a' term by term.
+
+    arguments:
+    a -- the series of the argument
+    g -- the series of the derivative of the function at the argument
+    value -- the value of the function at the first coefficient of the argument
+    """
+    scaled = _taylor_scaled(a)
+    result = np.zeros(np.broadcast_shapes(np.shape(a), np.shape(g)))
+    result[0] = value
+    for j in range(1, len(result)):
+        result[j] = np.sum(scaled[1:j + 1] * g[j - 1::-1], axis=0) / j
+    return result
+
+
+# the series of exp
+def _taylor_exp(a):
+    """This function returns the series of exp(a), which is its own derivative.
+
+    arguments:
+    a -- the series of the argument
+    """
+    scaled = _taylor_scaled(a)
+    result = np.zeros(np.shape(a))
+    result[0] = np.exp(a[0])
+    for j in range(1, len(result)):
+        result[j] = np.sum(scaled[1:j + 1] * result[j - 1::-1], axis=0) / j
+    return result
+
+
+# the series of the natural log
+def _taylor_ln(a):
+    """This function returns the series of ln(a), whose derivative times a is the derivative of a.
+
+    arguments:
+    a -- the series of the argument
+    """
+    result = np.zeros(np.shape(a))
+    result[0] = np.log(a[0])
+    scaled = _taylor_scaled(result)
+    for j in range(1, len(result)):
+        result[j] = (a[j] - np.sum(scaled[1:j] * a[j - 1:0:-1], axis=0) / j) / a[0]
+        scaled[j] = j * result[j]
+    return result
+
+
+# the series of tanh
+def _taylor_tanh(a):
+    """This function returns the series of tanh(a), whose derivative is (1 - tanh(a)^2) times
+    the derivative of a.  Unlike sinh(a) / cosh(a), this doesn't overflow for large arguments.
+
+    arguments:
+    a -- the series of the argument
+    """
+    scaled = _taylor_scaled(a)
+    result = np.zeros(np.shape(a))
+    result[0] = np.tanh(a[0])
+    # the series of 1 - tanh(a)^2, which is known up to the degree of the last coefficient
+    g = np.zeros(np.shape(a))
+    g[0] = 1 - result[0] ** 2
+    for j in range(1, len(result)):
+        result[j] = np.sum(scaled[1:j + 1] * g[j - 1::-1], axis=0) / j
+        g[j] = -np.sum(result[:j + 1] * result[j::-1], axis=0)
+    return result
+
+
+# the series of sin and cos, or of sinh and cosh
+def _taylor_sin_cos(a, hyperbolic=False):
+    """This function returns the series of sin(a) and cos(a), which are computed together since
+    each is the derivative of the other, up to the sign.  With hyperbolic=True, the series of
+    sinh(a) and cosh(a) are returned instead.
+
+    arguments:
+    a -- the series of the argument
+    hyperbolic -- whether to compute the hyperbolic functions
+    """
+    scaled = _taylor_scaled(a)
+    sine = np.zeros(np.shape(a))
+    cosine = np.zeros(np.shape(a))
+    sine[0] = np.sinh(a[0]) if hyperbolic else np.sin(a[0])
+    cosine[0] = np.cosh(a[0]) if hyperbolic else np.cos(a[0])
+    sign = 1 if hyperbolic else -1
+    for j in range(1, len(sine)):
+        sine[j] = np.sum(scaled[1:j + 1] * cosine[j - 1::-1], axis=0) / j
+        cosine[j] = sign * np.sum(scaled[1:j + 1] * sine[j - 1::-1], axis=0) / j
+    return sine, cosine
+
+
+# the series of sqrt
+def _taylor_sqrt(a):
+    """This function returns the series of sqrt(a), whose coefficients are found one degree at
+    a time from its square.
+
+    arguments:
+    a -- the series of the argument
+    """
+    result = np.zeros(np.shape(a))
+    result[0] = np.sqrt(a[0])
+    for j in range(1, len(result)):
+        result[j] = (a[j] - np.sum(result[1:j] * result[j - 1:0:-1], axis=0)) / (2 * result[0])
+    return result
+
+
+# the series of the derivative of arcsin
+def _taylor_arcsin_deriv(a):
+    """This function returns the series of 1 / sqrt(1 - a^2), the derivative of arcsin.
+
+    arguments:
+    a -- the series of the argument
+    """
+    one = _taylor_constant(1, a)
+    return _taylor_div(one, _taylor_sqrt(one - _taylor_mul(a, a)))
+
+
 # user the helper closure above, this is how we define functions
 # each function can now be defined in a single line
 # for each function, we supply the primary function and its derivative
 # lambda functions can be used here
-sin = get_function('sin', np.sin, lambda x, xp: xp * np.cos(x))
-cos = get_function('cos', np.cos, lambda x, xp: -xp * np.sin(x))
-exp = get_function('exp', np.exp, lambda x, xp: xp * np.exp(x))
-tan = get_function('tan', np.tan, lambda x, xp: xp * (1 / np.cos(x)) ** 2)
-add = get_function('add', lambda x, y: x + y, lambda x, y, xp, yp: xp + yp)
+# for functions where the value and the derivative have terms in common, we supply a kernel
+# that computes both at once, see the kernels above
+# the second derivatives are used by hessian and hvp
+sin = get_function('sin', np.sin, value_and_derivative=lambda x, xp: (np.sin(x), xp * np.cos(x)),
+                   second_derivative=lambda x, xp: -xp * np.sin(x), taylor=lambda a: _taylor_sin_cos(a)[0])
+cos = get_function('cos', np.cos, value_and_derivative=lambda x, xp: (np.cos(x), -xp * np.sin(x)),
+                   second_derivative=lambda x, xp: -xp * np.cos(x), taylor=lambda a: _taylor_sin_cos(a)[1])
+exp = get_function('exp', np.exp, value_and_derivative=_exp_kernel, second_derivative=lambda x, xp: xp * np.exp(x),
+                   taylor=_taylor_exp)
+tan = get_function('tan', np.tan, value_and_derivative=_tan_kernel,
+                   second_derivative=lambda x, xp: 2 * xp * np.tan(x) / np.cos(x) ** 2,
+                   taylor=lambda a: _taylor_div(*_taylor_sin_cos(a)))
+add = get_function('add', lambda x, y: x + y, lambda x, y, xp, yp: xp + yp,
+                   second_derivative=lambda x, y, xp, yp: (0, 0), taylor=lambda a, b: a + b)
 
 # compute the log to any base (the second argument is the base)
-log = get_function('log', lambda x, y: np.log(x) / np.log(y), lambda x, y, xp, yp:
-(xp * np.log(y) / x - (np.log(x) * yp / y)) / (np.log(y) ** 2))
-ln = get_function('ln', lambda x: np.log(x), lambda x, xp: xp / x)
-arcsin = get_function('arcsin', lambda x: np.arcsin(x), lambda x, xp: xp / (np.sqrt(1 - x ** 2)))
-arccos = get_function('arccos', lambda x: np.arccos(x), lambda x, xp: - xp / (np.sqrt(1 - x ** 2)))
-arctan = get_function('arctan', lambda x: np.arctan(x), lambda x, xp: xp / (x ** 2 + 1))
-sinh = get_function('sinh', lambda x: np.sinh(x), lambda x, xp: xp * np.cosh(x))
-cosh = get_function('cosh', lambda x: np.cosh(x), lambda x, xp: xp * np.sinh(x))
-tanh = get_function('tanh', lambda x: np.tanh(x), lambda x, xp: xp * (1 / np.cosh(x)) ** 2)
-logistic = get_function('logistic', lambda x: np.exp(x) / (1 + np.exp(x)), lambda x, xp:
-np.exp(x) * xp / ((1 + np.exp(x)) ** 2))
-sqrt = get_function('sqrt', lambda x: np.sqrt(x), lambda x, xp: xp / (2 * np.sqrt(x)))
+log = get_function('log', lambda x, y: np.log(x) / np.log(y), value_and_derivative=_log_kernel,
+                   second_derivative=_log_second, taylor=lambda a, b: _taylor_div(_taylor_ln(a), _taylor_ln(b)))
+ln = get_function('ln', lambda x: np.log(x), value_and_derivative=lambda x, xp: (np.log(x), xp / x),
+                  second_derivative=lambda x, xp: -xp / x ** 2, taylor=_taylor_ln)
+arcsin = get_function('arcsin', lambda x: np.arcsin(x), lambda x, xp: xp / (np.sqrt(1 - x ** 2)),
+                      second_derivative=lambda x, xp: xp * x / (1 - x ** 2) ** 1.5,
+                      taylor=lambda a: _taylor_integrate(a, _taylor_arcsin_deriv(a), np.arcsin(a[0])))
+arccos = get_function('arccos', lambda x: np.arccos(x), lambda x, xp: - xp / (np.sqrt(1 - x ** 2)),
+                      second_derivative=lambda x, xp: -xp * x / (1 - x ** 2) ** 1.5,
+                      taylor=lambda a: _taylor_integrate(a, -_taylor_arcsin_deriv(a), np.arccos(a[0])))
+arctan = get_function('arctan', lambda x: np.arctan(x), lambda x, xp: xp / (x ** 2 + 1),
+                      second_derivative=lambda x, xp: -2 * xp * x / (x ** 2 + 1) ** 2,
+                      taylor=lambda a: _taylor_integrate(
+                          a, _taylor_div(_taylor_constant(1, a), _taylor_constant(1, a) + _taylor_mul(a, a)),
+                          np.arctan(a[0])))
+sinh = get_function('sinh', lambda x: np.sinh(x), value_and_derivative=lambda x, xp: (np.sinh(x), xp * np.cosh(x)),
+                    second_derivative=lambda x, xp: xp * np.sinh(x), taylor=lambda a: _taylor_sin_cos(a, True)[0])
+cosh = get_function('cosh', lambda x: np.cosh(x), value_and_derivative=lambda x, xp: (np.cosh(x), xp * np.sinh(x)),
+                    second_derivative=lambda x, xp: xp * np.cosh(x), taylor=lambda a: _taylor_sin_cos(a, True)[1])
+tanh = get_function('tanh', lambda x: np.tanh(x), value_and_derivative=_tanh_kernel,
+                    second_derivative=lambda x, xp: -2 * xp * np.tanh(x) / np.cosh(x) ** 2,
+                    taylor=_taylor_tanh)
+logistic = get_function('logistic', lambda x: np.exp(x) / (1 + np.exp(x)),
+                        value_and_derivative=_logistic_kernel,
+                        second_derivative=lambda x, xp: xp * np.exp(x) * (1 - np.exp(x)) / (1 + np.exp(x)) ** 3,
+                        taylor=lambda a: _taylor_div(_taylor_exp(a), _taylor_constant(1, a) + _taylor_exp(a)))
+sqrt = get_function('sqrt', lambda x: np.sqrt(x), value_and_derivative=_sqrt_kernel,
+                    second_derivative=lambda x, xp: -xp / (4 * x * np.sqrt(x)), taylor=_taylor_sqrt)
+
+
+# the products of all of the other operands, used for the derivative of a product
+# we use prefix and suffix products so that zeros don't cause any problems
+def _other_products(values):
+    """This function returns, for each operand of a product, the product of all of the
+    other operands.  This is computed with cumulative products in both directions, so
+    no division is needed.
+
+    arguments:
+    values -- the values of the operands stacked along the first axis
+    """
+    ones = np.ones_like(values[:1])
+    prefix = np.cumprod(np.concatenate([ones, values[:-1]]), axis=0)
+    suffix = np.cumprod(np.concatenate([ones, values[:0:-1]]), axis=0)[::-1]
+    return prefix * suffix
+
+
+# the derivative of a product over many operands
+def _prod_deriv(x, xp):
+    """This function computes the derivative of a product of many operands using the
+    product rule, in a single vectorized operation.
+
+    arguments:
+    x -- the values of the operands stacked along the first axis
+    xp -- the derivatives of the operands stacked along the first axis
+    """
+    others = _other_products(x)
+    # the derivatives can have an extra axis when several derivatives are computed at once
+    others = others.reshape(others.shape[:1] + (1,) * (np.ndim(xp) - np.ndim(others)) + others.shape[1:])
+    return np.sum(others * xp, axis=0)
+
+
+# the derivatives of the partial derivatives of a product over many operands
+def _prod_second(x, xp):
+    """This function computes the derivatives of the partial derivatives of a product of
+    many operands, which are the products of all of the other operands, in the direction
+    of the derivatives of the operands.  Like _other_products, this uses prefix and suffix
+    products, whose derivatives are accumulated with the product rule.
+
+    arguments:
+    x -- the values of the operands stacked along the first axis
+    xp -- the derivatives of the operands stacked along the first axis
+    """
+    xp = np.asarray(xp, dtype=float)
+    # the derivatives can have an extra axis when several derivatives are computed at once
+    x = np.asarray(x, dtype=float)
+    x = x.reshape(x.shape[:1] + (1,) * (xp.ndim - x.ndim) + x.shape[1:])
+    xp = np.broadcast_to(xp, np.broadcast_shapes(x.shape, xp.shape))
+    count = len(x)
+    prefix = np.ones_like(xp)
+    prefix_deriv = np.zeros_like(xp)
+    suffix = np.ones_like(xp)
+    suffix_deriv = np.zeros_like(xp)
+    for i in range(1, count):
+        prefix[i] = prefix[i - 1] * x[i - 1]
+        prefix_deriv[i] = prefix_deriv[i - 1] * x[i - 1] + prefix[i - 1] * xp[i - 1]
+        j = count - 1 - i
+        suffix[j] = suffix[j + 1] * x[j + 1]
+        suffix_deriv[j] = suffix_deriv[j + 1] * x[j + 1] + suffix[j + 1] * xp[j + 1]
+    return prefix_deriv * suffix + prefix * suffix_deriv
+
+
+# the series of a product over many operands
+def _taylor_prod(a):
+    """This function returns the series of the product of many operands.
+
+    arguments:
+    a -- the series of the operands stacked along the first axis
+    """
+    result = a[0]
+    for operand in a[1:]:
+        result = _taylor_mul(result, operand)
+    return result
+
+
+# n-ary reductions over a list of nodes or numeric values
+add_n = get_reduction('sum', lambda x: np.sum(x, axis=0), lambda x, xp: np.sum(xp, axis=0),
+                      lambda x: np.ones_like(x), lambda x, xp: np.zeros(len(x)), lambda a: np.sum(a, axis=0))
+mul_n = get_reduction('prod', lambda x: np.prod(x, axis=0), _prod_deriv, _other_products, _prod_second,
+                      _taylor_prod)
+
+# the short names shadow the builtins, so they are not exported by import *, see __all__
+sum = add_n
+prod = mul_n
+
+
+# the operations of the operator overloads are named after the overloads
+# the second derivatives of the linear operations are 0
+register_operation('__mul__', np.multiply, lambda x, y, xp, yp: x * yp + y * xp,
+                   second_derivative=lambda x, y, xp, yp: (yp, xp), taylor=_taylor_mul)
+register_operation('__truediv__', lambda x, y: x / y, lambda x, y, xp, yp: ((y * xp - x * yp) / (y ** 2)),
+                   second_derivative=lambda x, y, xp, yp: (-yp / y ** 2, (2 * x * yp / y - xp) / y ** 2),
+                   taylor=_taylor_div)
+register_operation('__rtruediv__', lambda x, y: y / x, lambda x, y, xp, yp: ((x * yp - y * xp) / (x ** 2)),
+                   second_derivative=lambda x, y, xp, yp: ((2 * y * xp / x - yp) / x ** 2, -xp / x ** 2),
+                   taylor=lambda a, b: _taylor_div(b, a))
+register_operation('__add__', np.add, lambda x, y, xp, yp: xp + yp,
+                   second_derivative=lambda x, y, xp, yp: (0, 0), taylor=lambda a, b: a + b)
+register_operation('__sub__', np.subtract, lambda x, y, xp, yp: xp - yp,
+                   second_derivative=lambda x, y, xp, yp: (0, 0), taylor=lambda a, b: a - b)
+register_operation('__rsub__', lambda x, y: y - x, lambda x, y, xp, yp: yp - xp,
+                   second_derivative=lambda x, y, xp, yp: (0, 0), taylor=lambda a, b: b - a)
+# the comparisons are piecewise constant, so their series is constant
+register_operation('__lt__', lambda x, y: (x < y) * 1, lambda x, y, xp, yp: 0,
+                   second_derivative=lambda x, y, xp, yp: (0, 0),
+                   taylor=lambda a, b: _taylor_constant(a[0] < b[0], a))
+register_operation('__gt__', lambda x, y: (x > y) * 1, lambda x, y, xp, yp: 0,
+                   second_derivative=lambda x, y, xp, yp: (0, 0),
+                   taylor=lambda a, b: _taylor_constant(a[0] > b[0], a))
+register_operation('__le__', lambda x, y: (x <= y) * 1, lambda x, y, xp, yp: 0,
+                   second_derivative=lambda x, y, xp, yp: (0, 0),
+                   taylor=lambda a, b: _taylor_constant(a[0] <= b[0], a))
+register_operation('__ge__', lambda x, y: (x >= y) * 1, lambda x, y, xp, yp: 0,
+                   second_derivative=lambda x, y, xp, yp: (0, 0),
+                   taylor=lambda a, b: _taylor_constant(a[0] >= b[0], a))
+register_operation('__neg__', lambda x: -x, lambda x, xp: -xp, second_derivative=lambda x, xp: 0,
+                   taylor=lambda a: -a)
 
 
 # here is our main class
@@ -136,8 +866,23 @@ class Node:
     symbolic variables that act as placeholders for later evaluation.
     These nodes form a recursive binary tree that is used to perform the computations
     of the primary and forward traces.
+
+    The nodes use __slots__ instead of a __dict__, and the type of a node is one of the
+    integers Node.VAR, Node.CONST and Node.INTER, so large graphs take as little memory as
+    possible.  The functions of a node are not stored on it, but looked up in the registry
+    of operations by the name of its operation.  Everything that is only needed for
+    rendering is kept by the visualizer.
     """
 
+    # the types of nodes
+    VAR = 0
+    CONST = 1
+    INTER = 2
+    type_names = ('var', 'const', 'inter')
+
+    __slots__ = ('var_name', 'value', 'type', 'function_name', 'left', 'right', 'op', 'cache',
+                 'operand_buffer', 'operand_count', 'var_mask', '__weakref__')
+
     # initialize the node
     # we set the node type based on the properties that were passed in
     # we set the nodes left and right children to None
@@ -157,167 +902,761 @@ class Node:
         self.var_name = var_name
         self.value = value
         if not var_name is None:
-            self.type = 'var'
-            self.deriv = None
-        elif value != None:
-            self.type = 'const'
-            self.deriv = None
+            self.type = Node.VAR
+        elif value is not None:
+            self.type = Node.CONST
         else:
-            self.type = 'inter'
-            self.deriv = None
+            self.type = Node.INTER
 
         # A node can have a function and a derivative
         # these are applied as we traverse the graph in reverse order
-        self.function = function
-        self.derivative = derivative
+        # they belong to the registered operation of the node, see register_operation
         self.function_name = function_name
         self.left = None
         self.right = None
 
-        # used for visualization
-        self.order = 0
-        self.depth = 0
-
-    # this function recursively evaluates a binary tree starting at
-    # a root node
-    def evaluate(self, **kwargs):
-        """This is the main function of our Node object to traverse the graph
-           and perform the necessary calculations.  We traverse the binary graph
-           in postorder and update the values and derivatives as we traverse the
-           graph.
+        # the name of the registered operation
+        # nodes that are built directly from the functions of a registered operation reuse it,
+        # and other functions are registered once, see register_operation
+        self.op = None
+        if function is not None:
+            name = function_name or 'function'
+            self.op = operation_index.get((name, function, derivative))
+            if self.op is None:
+                self.op = register_operation(name, function, derivative)
 
-           First, we must ensure that the variables, supplied as named arguments
-           match all of the variables in our graph.  If this is not the case, we
-           raise a ValueError
+        # the cache of the results of evaluate, see enable_cache
+        self.cache = None
 
-           Once this check has passed, we traverse the graph and perform the needed
-           evaluations.
-        """
+        # n-ary reduction nodes have a list of operands instead of left and right children
+        # the operands are the first operand_count items of the buffer, which can be shared
+        # with other reduction nodes, see extend_reduction
+        self.operand_buffer = None
+        self.operand_count = 0
 
-        # see if the user requested plotting
-        if 'plot' in kwargs:
-            plot = kwargs['plot']
+        # the bitmask of the variables that this node depends on, or None if one of them
+        # has no bit, see get_variable_bit
+        # for intermediate nodes, this is set when the children are linked in Node.create
+        if var_name is not None:
+            self.var_mask = Node.get_variable_bit(var_name)
         else:
-            plot = False
+            self.var_mask = 0
 
-        if 'seed_dict' in kwargs:
-            seed_dict = kwargs['seed_dict']
-            if not isinstance(seed_dict, dict):
-                raise ValueError('Please specify a dictionary for the seed_dict argument')
-        else:
-            seed_dict = None
+    # this function creates a new intermediate node
+    @staticmethod
+    def create(op, function_name, left, right=None):
+        """This function creates an intermediate node that applies a registered operation to
+        one or two children.  Numeric values are turned into constant nodes.  The set of
+        variables that the new node depends on is computed from its children when the node
+        is built, so it never has to be recomputed by traversing the graph.
 
-        vars = set()
-        # the first thing we do is determine what variables are defined in
-        # our tree
-        Node.get_variables(self, vars)
+        arguments:
+        op -- the name of the registered operation
+        function_name -- the name of the function used for rendering
+        left -- the left node or numeric value
+        right -- the right node or numeric value, or None for unary functions
+        """
+        new_node = Node(function_name=function_name)
+        Node.set_operation(new_node, op)
+        new_node.left = Node.to_node(left)
+        new_node.var_mask = new_node.left.var_mask
+        if right is not None:
+            new_node.right = Node.to_node(right)
+            new_node.var_mask = Node.merge_masks(new_node.var_mask, new_node.right.var_mask)
+        return Node.intern(new_node)
 
-        # we remove the keywords from the set of supplied variables
-        supplied_vars = set(kwargs.keys()) - {'wrt', 'plot', 'seed_dict'}
+    # this function creates a new reduction node
+    @staticmethod
+    def create_reduction(op, function_name, items):
+        """This function creates an n-ary reduction node that applies a registered
+        operation to a list of nodes or numeric values.  Numeric values are turned into
+        constant nodes.
 
-        if 'wrt' in kwargs:
+        arguments:
+        op -- the name of the registered operation
+        function_name -- the name of the function used for rendering
+        items -- a list of nodes or numeric values
+        """
+        new_node = Node(function_name=function_name)
+        Node.set_operation(new_node, op)
+        new_node.operands = [Node.to_node(item) for item in items]
+        for operand in new_node.operands:
+            new_node.var_mask = Node.merge_masks(new_node.var_mask, operand.var_mask)
+        return Node.intern(new_node)
 
-            # the user may supply a list of strings, a list of variables, or a mix of both
-            # let's convert this uniformly to a list of strings
+    # this function attaches a registered operation to a node
+    @staticmethod
+    def set_operation(node, op):
+        """This function checks that an operation is in the registry and stores its name on
+        the node.
 
-            wrt_pre = kwargs['wrt']
+        arguments:
+        node -- the node
+        op -- the name of the registered operation
+        """
+        if op not in operations:
+            raise ValueError(f'Unknown operation: {op}')
+        node.op = op
 
-            if not (isinstance(wrt_pre, list)):
-                raise ValueError('Incorrect type supplied to wrt. '
-                                 'Please supply a list of variables or strings of variable names')
-            wrt = []
+    # the function that computes the value of the node
+    @property
+    def function(self):
+        """The function of the operation of the node, or None for variables and constants."""
+        return operations[self.op][0] if self.op is not None else None
 
-            for item in wrt_pre:
-                if not (isinstance(item, Node) or isinstance(item, str)):
-                    raise ValueError('Incorrect type supplied to wrt')
-                if isinstance(item, Node):
-                    if not item.var_name:
-                        raise ValueError('Incorrect node type supplied to wrt.  Please supply a variable.')
-                    wrt.append(item.var_name)
-                else:
-                    wrt.append(item)
+    # the function that computes the derivative of the node
+    @property
+    def derivative(self):
+        """The derivative of the operation of the node, or None for variables and constants."""
+        return operations[self.op][1] if self.op is not None else None
 
-            if not set(wrt) <= vars:
-                raise ValueError('Variables specified in wrt do not match the variables in the equation')
-        else:
-            wrt = supplied_vars
+    # the kernel that computes the value and the derivative together
+    @property
+    def value_and_derivative(self):
+        """The kernel of the operation of the node, or None if it has no kernel."""
+        return operations[self.op][2] if self.op is not None else None
 
-        # check to see if the variable types are numeric
-        for key, val in kwargs.items():
-            if key in supplied_vars:
-                if not (isinstance(val, int) or isinstance(val, float)):
-                    raise ValueError(f'Attempting to assign a non-numeric value to variable {key}:{val}')
+    # the function that computes the partial derivatives of a reduction node
+    @property
+    def partials(self):
+        """The partials of the operation of a reduction node, or None for other nodes."""
+        return operations[self.op][3] if self.op is not None else None
 
-        # if the variables do not match, raise an error
-        if supplied_vars != vars:
-            print('variables do not match')
-            print(f'the variables in this tree are {vars}')
+    # nodes are pickled as a flat list of records of the whole graph below them
+    def __reduce__(self):
+        """This function is used by pickle.  The graph below the node is stored as a flat list
+        of records that refer to the operations by name, see to_records.  This avoids
+        pickling functions, which isn't possible for lambdas, and avoids deep recursion for
+        deep graphs.  The values and derivatives of the last evaluation are not stored.
+        """
+        return Node.from_records, (Node.to_records(self),)
 
-            print(f'the variables supplied by evaluate are {supplied_vars}')
-            raise ValueError('Supplied variables do not match those in the equation.')
+    # this function converts a graph to a flat list of records
+    @staticmethod
+    def to_records(root):
+        """This function returns a list with a tuple for every unique node of the graph, in
+        topological order, so the root is last.  Variables are stored as ('var', name),
+        constants as ('const', value), and the other nodes as ('op', op, function_name,
+        child indices, is_reduction, fingerprint), where the child indices refer to earlier
+        records and the fingerprint identifies the functions of the operation, see
+        get_operation_fingerprint.
 
-        # let's reset the values and derivatives in the tree
-        Node.reset(self)
+        arguments:
+        root -- the root node of the graph
+        """
+        order = Node.topological_order(root)
+        index = {id(node): i for i, node in enumerate(order)}
+        fingerprints = {}
+        records = []
+        for node in order:
+            if node.var_name is not None:
+                records.append(('var', node.var_name))
+            elif node.type == Node.CONST:
+                records.append(('const', node.value))
+            else:
+                if node.op is None:
+                    raise ValueError(f'The function {node.function_name} is not a registered operation')
+                children = [index[id(child)] for child in Node.get_children(node)]
+                if node.op not in fingerprints:
+                    fingerprints[node.op] = get_operation_fingerprint(node.op)
+                records.append(('op', node.op, node.function_name, children, node.operands is not None,
+                                fingerprints[node.op]))
+        return records
 
-        # now we recursively traverse through the tree in postorder
-        # computing the value and derivative along the way
-        if plot:
-            # add the depths and an order of the nodes for plotting
-            image, fig, font_size, depth_counts = visualizer.render_first_frame(self)
-            images = [image]
-            Node.eval_post(self, kwargs, wrt, images, self, fig, font_size, depth_counts, seed_dict = seed_dict)
-            file_path = plot
-            print()
-            # pause the video a bit at the end
-            for i in range(6):
-                images.append(images[-1])
+    # this function rebuilds a graph from a flat list of records
+    @staticmethod
+    def from_records(records):
+        """This function rebuilds the graph from the records created by to_records, and returns
+        the root node.  A ValueError is raised if an operation isn't registered in this process,
+        or if it is registered with different functions, which happens when the operations
+        are registered in a different order than in the process that created the records.
 
-            print(f'saving render to {file_path}')
-            imageio.mimsave(file_path, images, fps=2, format='GIF')
-            print()
+        arguments:
+        records -- the list of records
+        """
+        nodes = []
+        checked = set()
+        for record in records:
+            if record[0] == 'var':
+                node = Node.intern(Node(var_name=record[1]))
+            elif record[0] == 'const':
+                node = Node.intern(Node(value=record[1]))
+            else:
+                _, op, function_name, children, is_reduction, fingerprint = record
+                if op not in checked:
+                    if op not in operations:
+                        raise ValueError(f'Unknown operation: {op}.  Operations have to be registered '
+                                         'when a module is imported to be used in other processes.')
+                    if get_operation_fingerprint(op) != fingerprint:
+                        raise ValueError(f'The operation {op} is registered with different functions '
+                                         'in this process')
+                    checked.add(op)
+                children = [nodes[child] for child in children]
+                if is_reduction:
+                    node = Node.create_reduction(op, function_name, children)
+                else:
+                    node = Node.create(op, function_name, *children)
+            nodes.append(node)
+        return nodes[-1]
+
+    # this function converts numeric values to constant nodes
+    @staticmethod
+    def to_node(item):
+        """This function returns the item if it is a node, and a new constant node otherwise.
 
+        arguments:
+        item -- a node or numeric value
+        """
+        if isinstance(item, Node):
+            return item
         else:
-            Node.eval_post(self, kwargs, wrt, seed_dict = seed_dict)
+            return Node.intern(Node(value=item))
 
-        # return the value and the derivative
-        return {'value': self.value, 'derivative': self.deriv}
+    # this function is the pass used by simplify
+    @staticmethod
+    def simplify_graph(root, cancel=True):
+        """This function returns the simplified copy of a graph, see simplify.
 
-    # this is the multiplication operator overload
-    def __mul__(self, other):
-        """This function overloads the multiplication operator
+        arguments:
+        root -- the root node of the graph
+        cancel -- whether to replace x - x by 0
+        """
+        simplified = {}
+        for node in Node.topological_order(root):
+            if not node.function:
+                simplified[id(node)] = node
+                continue
+
+            # rebuild the node on top of its simplified children
+            new_node = Node.replace_children(node, simplified)
+            if new_node.var_mask == 0:
+                new_node = Node.fold_constant(new_node)
+            else:
+                new_node = Node.apply_identities(new_node, cancel)
+            simplified[id(node)] = new_node
+        return simplified[id(root)]
+
+    # this function rebuilds a node on top of new children
+    @staticmethod
+    def replace_children(node, replacements):
+        """This function returns the node if none of its children are replaced, and a new node
+        that applies the same operation to the replacements of its children otherwise.  The
+        given node is not modified, so the graphs that share it are not changed.  Nodes
+        without a registered operation can't be rebuilt and are returned unchanged.
 
         arguments:
-        self -- the current node
-        other -- the other node or numeric value (both are supported)
+        node -- the node to rebuild
+        replacements -- a dictionary that maps the id of every child to its replacement
         """
-        # we apply the multiplication function to these two nodes
-        new_node = Node(None, None, np.multiply,
-                        lambda x, y, xp, yp: x * yp + y * xp, 'x')
-        # set the child nodes
-        new_node.left = self
-        if isinstance(other, Node):
-            new_node.right = other
-        else:
-            new_node.right = Node(value=other)
-        return new_node
+        if node.operands is not None:
+            operands = [replacements[id(operand)] for operand in node.operands]
+            if all(new is old for new, old in zip(operands, node.operands)):
+                return node
+            return Node.create_reduction(node.op, node.function_name, operands)
 
-    # this is the divide operator overload
-    def __truediv__(self, other):
-        """This function overloads the true divide operator
+        if node.left is None:
+            return node
+        left = replacements[id(node.left)]
+        right = replacements[id(node.right)] if node.right is not None else None
+        if (left is node.left and right is node.right) or node.op is None:
+            return node
+        return Node.create(node.op, node.function_name, left, right)
 
-           arguments:
+    # this function replaces a node that only depends on constants by a constant
+    @staticmethod
+    def fold_constant(node):
+        """This function evaluates a node whose children are all constants and returns a new
+        constant node with the result.  If the evaluation fails, the node is returned, so
+        that the error is raised when the graph is evaluated.
+
+        arguments:
+        node -- the node to fold
+        """
+        try:
+            values, _, _ = Node.eval_post(node, {}, [])
+        except ValueError:
+            return node
+        return Node.to_node(values[-1])
+
+    # this function applies the identity rules of simplify to a single node
+    @staticmethod
+    def apply_identities(node, cancel=True):
+        """This function returns the child of the node if the node is an identity operation
+        on that child, a zero constant if the node is x - x for a variable x, and the node
+        otherwise.  Subtrees of constants are folded before the identities are applied.
+
+        arguments:
+        node -- the node to simplify
+        cancel -- whether to replace x - x by 0
+        """
+        operator = node.op
+        left = node.left
+        right = node.right
+        if operator == '__mul__':
+            if Node.is_constant(right, 1):
+                return left
+            if Node.is_constant(left, 1):
+                return right
+        elif operator == '__truediv__' or operator == '__pow__':
+            if Node.is_constant(right, 1):
+                return left
+        elif operator == '__add__':
+            if Node.is_constant(right, 0, negative=True):
+                return left
+            if Node.is_constant(left, 0, negative=True):
+                return right
+        elif operator == '__sub__':
+            if Node.is_constant(right, 0, negative=False):
+                return left
+            # only variables are cancelled, since a function of them could raise an error
+            if cancel and left.type == Node.VAR and Node.get_key(left) == Node.get_key(right):
+                return Node.to_node(0.0)
+        elif operator == '__neg__':
+            if left.op == '__neg__':
+                return left.left
+        return node
+
+    # this function checks whether a node is a given constant
+    @staticmethod
+    def is_constant(node, value, negative=None):
+        """This function checks whether the node is a constant with the given value.
+
+        arguments:
+        node -- the node to check
+        value -- the value to compare to
+        negative -- optionally require the sign bit of the constant to be set (True)
+                    or not set (False), to distinguish 0.0 and -0.0
+        """
+        if node is None or node.type != Node.CONST:
+            return False
+        try:
+            if not node.value == value:
+                return False
+            return negative is None or bool(np.signbit(node.value)) == negative
+        except (TypeError, ValueError):
+            return False
+
+    # this function returns the key that identifies the structure of a node
+    @staticmethod
+    def get_key(node):
+        """This function returns a hashable key that is equal for two nodes exactly when they
+        compute the same thing: the same function applied to the same children, the same
+        variable, or the same constant.  The children are identified by their ids.  None is
+        returned for nodes that can't be compared, such as constants with unhashable values.
+
+        arguments:
+        node -- the node to get the key of
+        """
+        if node.type == Node.VAR:
+            return ('var', node.var_name)
+        elif node.type == Node.CONST:
+            # the representation distinguishes values that compare equal, such as 0.0 and -0.0
+            key = ('const', type(node.value), node.value, repr(node.value))
+            try:
+                hash(key)
+            except TypeError:
+                return None
+            return key
+        elif node.operands is not None:
+            return (node.op, node.function_name, tuple(id(operand) for operand in node.operands))
+        elif node.op is None:
+            return None
+        else:
+            right = id(node.right) if node.right is not None else None
+            return (node.op, node.function_name, id(node.left), right)
+
+    # this function returns the interned copy of a node
+    @staticmethod
+    def intern(node):
+        """This function returns the existing node that is structurally identical to the given
+        node if interning is enabled and there is one, and stores the node otherwise.  While
+        a node is stored in the table, its children are alive, so their ids are not reused.
+
+        arguments:
+        node -- the newly created node
+        """
+        if not interning:
+            return node
+        key = Node.get_key(node)
+        if key is None:
+            return node
+        existing = intern_table.get(key)
+        if existing is not None:
+            return existing
+        intern_table[key] = node
+        return node
+
+    # this function returns the bit that is assigned to a variable name
+    @staticmethod
+    def get_variable_bit(var_name):
+        """This function returns the bitmask with the single bit that is assigned to the
+        given variable name.  A new bit is assigned the first time a name is seen, until
+        mask_max_bits names have a bit.  None is returned for the names after that, so the
+        masks take a bounded amount of memory even for graphs with very many variables.
+
+        arguments:
+        var_name -- the name of the variable
+        """
+        if var_name not in variable_bits:
+            if len(variable_names) >= mask_max_bits:
+                return None
+            variable_bits[var_name] = len(variable_names)
+            variable_names.append(var_name)
+        return 1 << variable_bits[var_name]
+
+    # this function combines the bitmasks of two nodes
+    @staticmethod
+    def merge_masks(first, second):
+        """This function returns the bitmask of the union of the variables of two bitmasks,
+        or None if either of them is None.
+
+        arguments:
+        first -- the first bitmask
+        second -- the second bitmask
+        """
+        if first is None or second is None:
+            return None
+        return first | second
+
+    # this function returns the bitmask for a list of variable names
+    @staticmethod
+    def get_variable_mask(names):
+        """This function returns the bitmask of a collection of variable names.  The names
+        without a bit are left out, see get_activity.
+
+        arguments:
+        names -- the names of the variables
+        """
+        mask = 0
+        for name in names:
+            if name in variable_bits:
+                mask |= 1 << variable_bits[name]
+        return mask
+
+    # this function converts a bitmask to a set of variable names
+    @staticmethod
+    def get_mask_variables(mask):
+        """This function returns the set of the names of the variables in a bitmask.
+
+        arguments:
+        mask -- the bitmask of the variables
+        """
+        return {variable_names[i] for i, bit in enumerate(bin(mask)[:1:-1]) if bit == '1'}
+
+    # this function evaluates a computation graph starting at
+    # a root node
+    def evaluate(self, **kwargs):
+        """This is the main function of our Node object to traverse the graph
+           and perform the necessary calculations.  We traverse the graph
+           in topological order, visiting each unique node exactly once, and update
+           the values and derivatives as we traverse the graph.
+
+           First, we must ensure that the variables, supplied as named arguments
+           match all of the variables in our graph.  If this is not the case, we
+           raise a ValueError
+
+           Once this check has passed, we traverse the graph and perform the needed
+           evaluations.
+
+           By default, the derivatives are computed with the forward mode.  With
+           mode='reverse', the values are computed in a forward sweep and the full
+           gradient is then computed in a single backward sweep that propagates
+           adjoints from the root to the variables.  This is much cheaper for
+           functions of many variables.
+
+           With order=k and direction={...}, the higher order derivatives along the
+           direction are computed instead, with the Taylor mode, see eval_taylor.  The
+           derivative in the result is then a dictionary that maps each order from 1 to k
+           to the directional derivative of that order.
+
+           If seed_dict holds several directions, as a seed matrix (see get_seed_matrix), the
+           tangents carry one lane per direction and the derivative in the result is the array
+           of the directional derivatives, all computed in a single pass.
+
+           The values and derivatives are kept in buffers that belong to the call
+           rather than on the nodes, so a graph can be evaluated from several
+           threads at once.  Only rendering writes them to the nodes.
+
+           If a cache was enabled with enable_cache, the results of earlier calls with
+           the same arguments are returned without traversing the graph.
+        """
+
+        # results of earlier calls with the same arguments can be returned from the cache
+        cache = self.cache
+        cache_key = None
+        if cache is not None and 'plot' not in kwargs:
+            cache_key = EvaluationCache.get_key(kwargs)
+            if cache_key is not None:
+                result = cache.get(cache_key)
+                if result is not None:
+                    return result
+
+        # see if the user requested plotting
+        if 'plot' in kwargs:
+            plot = kwargs['plot']
+        else:
+            plot = False
+
+        mode = Node.parse_mode(kwargs)
+        if plot and mode == 'reverse':
+            raise ValueError('rendering is only supported for the forward mode.')
+
+        if 'output' in kwargs:
+            raise ValueError('The output argument is only supported by the evaluate function for vector outputs.')
+
+        degree, direction = Node.parse_taylor(kwargs)
+        if degree is not None and any(key in kwargs for key in ('plot', 'mode', 'wrt', 'seed_dict')):
+            raise ValueError('The order and direction arguments can not be combined with plot, mode, wrt or seed_dict')
+
+        if 'seed_dict' in kwargs:
+            seed_dict = kwargs['seed_dict']
+            if not isinstance(seed_dict, (dict, np.ndarray)):
+                raise ValueError('Please specify a dictionary or a seed matrix for the seed_dict argument')
+        else:
+            seed_dict = None
+
+        # the graph is a DAG, so we compute a single topological ordering
+        # that is shared by all of the traversals below
+        order = Node.topological_order(self)
+
+        vars = set()
+        # the first thing we do is determine what variables are defined in
+        # our graph
+        Node.get_variables(self, vars)
+
+        # we remove the keywords from the set of supplied variables
+        supplied_vars = set(kwargs.keys()) - evaluate_keywords
+
+        if 'wrt' in kwargs:
+            wrt = Node.parse_wrt(kwargs['wrt'], vars)
+        else:
+            wrt = sorted(supplied_vars)
+
+        # check to see if the variable types are numeric
+        for key, val in kwargs.items():
+            if key in supplied_vars:
+                if not (isinstance(val, int) or isinstance(val, float)):
+                    raise ValueError(f'Attempting to assign a non-numeric value to variable {key}:{val}')
+
+        # if the variables do not match, raise an error
+        if supplied_vars != vars:
+            print('variables do not match')
+            print(f'the variables in this tree are {vars}')
+
+            print(f'the variables supplied by evaluate are {supplied_vars}')
+            raise ValueError('Supplied variables do not match those in the equation.')
+
+        # with a seed matrix, the derivative is the array of the directional derivatives
+        matrix = None if seed_dict is None else Node.get_seed_matrix(seed_dict, wrt)
+        if matrix is not None and plot:
+            raise ValueError('A seed matrix can not be combined with the plot argument')
+
+        # now we traverse through the graph in topological order
+        # computing the value and derivative along the way
+        # the results are kept in buffers that belong to this call, and the nodes are
+        # never written to
+        if degree is not None:
+            if not set(direction) <= vars:
+                raise ValueError('The direction contains variables that are not in the equation')
+            coefficients = Node.eval_taylor(self, kwargs, direction, degree, order=order)
+            value = coefficients[0]
+            # the derivatives are the coefficients times the factorials of their orders
+            deriv = {}
+            factorial = 1
+            for k in range(1, degree + 1):
+                factorial *= k
+                deriv[k] = factorial * coefficients[k]
+
+        elif plot:
+            # add the depths and an order of the nodes for plotting
+            image, fig, font_size, depth_counts, layout = visualizer.render_first_frame(self)
+            images = [image]
+            values, derivs, index = Node.eval_post(self, kwargs, wrt, images, self, fig, font_size, depth_counts,
+                                                   layout, seed_dict=seed_dict, order=order)
+            file_path = plot
+            print()
+            # pause the video a bit at the end
+            for i in range(6):
+                images.append(images[-1])
+
+            print(f'saving render to {file_path}')
+            imageio.mimsave(file_path, images, fps=2, format='GIF')
+            print()
+            value = values[index[id(self)]]
+            deriv = Node.get_derivatives(derivs[index[id(self)]], wrt)
+
+        elif matrix is not None and mode == 'reverse':
+            # the gradient is computed once and projected onto every direction
+            value, gradient = Node.eval_reverse(self, kwargs, wrt, order=order)
+            deriv = Node.get_directional(gradient, wrt, matrix)
+
+        elif matrix is not None:
+            seeds = Node.get_matrix_seeds(wrt, matrix)
+            values, derivs, index = Node.eval_post(self, kwargs, wrt, order=order, seeds=seeds)
+            value = values[index[id(self)]]
+            deriv = np.array(np.broadcast_to(derivs[index[id(self)]], (matrix.shape[1],)), dtype=float)
+
+        elif mode == 'reverse':
+            value, deriv = Node.eval_reverse(self, kwargs, wrt, seed_dict=seed_dict, order=order)
+
+        else:
+            values, derivs, index = Node.eval_post(self, kwargs, wrt, seed_dict=seed_dict, order=order)
+            value = values[index[id(self)]]
+            deriv = Node.get_derivatives(derivs[index[id(self)]], wrt)
+
+        # return the value and the derivative
+        result = {'value': value, 'derivative': deriv}
+        if cache_key is not None:
+            cache.put(cache_key, result)
+        return result
+
+    # this function turns on the caching of the results of evaluate
+    def enable_cache(self, maxsize=128):
+        """This function enables a cache of the results of evaluate for this node.  The cache
+        is keyed on the values of the variables and the wrt, seed_dict and mode arguments,
+        and holds the results of the maxsize most recently used calls.  Calls that are found
+        in the cache return the cached results without traversing the graph.  If a cache is
+        already enabled, it is replaced by an empty one.
+
+        arguments:
+        maxsize -- the maximum number of results to keep
+        """
+        self.cache = EvaluationCache(maxsize)
+
+    # this function turns off the cache
+    def disable_cache(self):
+        """This function disables the cache of the results of evaluate and frees its contents."""
+        self.cache = None
+
+    # this function removes all results from the cache
+    def clear_cache(self):
+        """This function removes all results from the cache, for example after the functions of
+        the graph were changed.  The counters are kept.
+        """
+        if self.cache is None:
+            raise ValueError('The cache is not enabled for this node')
+        self.cache.clear()
+
+    # this function returns the statistics of the cache
+    def cache_info(self):
+        """This function returns a dictionary with the number of hits, misses and evictions
+        of the cache, and its current and maximum size.
+        """
+        if self.cache is None:
+            raise ValueError('The cache is not enabled for this node')
+        return self.cache.info()
+
+    # this function evaluates the graph for a whole batch of input points at once
+    def evaluate_batch(self, **kwargs):
+        """This function evaluates the graph and its derivatives at many input points
+           in a single traversal.  The values of the variables are supplied as numpy arrays
+           (or anything that can be converted to one), and every node's function and derivative
+           is applied once to the whole batch instead of once per point.  Scalars are broadcast
+           against the arrays, so some variables can be held fixed during a parameter sweep.
+
+           The wrt, seed_dict and mode arguments work in the same way as in evaluate.  The results
+           are returned as a dictionary with an array of values and a dictionary of derivative
+           arrays, one for each variable, all with the broadcast shape of the inputs.  With a
+           seed matrix, the derivative is a single array with the directions along the first axis.
+        """
+
+        if 'plot' in kwargs:
+            raise ValueError('rendering is not supported for batch evaluation. '
+                             'Please use evaluate on a single input point.')
+
+        if 'order' in kwargs or 'direction' in kwargs:
+            raise ValueError('The order and direction arguments are only supported by evaluate.')
+
+        mode = Node.parse_mode(kwargs)
+
+        if 'seed_dict' in kwargs:
+            seed_dict = kwargs['seed_dict']
+            if not isinstance(seed_dict, (dict, np.ndarray)):
+                raise ValueError('Please specify a dictionary or a seed matrix for the seed_dict argument')
+        else:
+            seed_dict = None
+
+        order = Node.topological_order(self)
+
+        vars = set()
+        Node.get_variables(self, vars)
+
+        supplied_vars = set(kwargs.keys()) - evaluate_keywords
+
+        if 'wrt' in kwargs:
+            wrt = Node.parse_wrt(kwargs['wrt'], vars)
+        else:
+            wrt = sorted(supplied_vars)
+
+        if supplied_vars != vars:
+            raise ValueError('Supplied variables do not match those in the equation.')
+
+        # convert all of the inputs to floating point arrays
+        var_values = {}
+        for key in supplied_vars:
+            try:
+                var_values[key] = np.asarray(kwargs[key], dtype=float)
+            except (TypeError, ValueError):
+                raise ValueError(f'Attempting to assign a non-numeric value to variable {key}')
+
+        try:
+            shape = np.broadcast_shapes(*[value.shape for value in var_values.values()])
+        except ValueError:
+            raise ValueError('The arrays supplied for the variables can not be broadcast together.')
+
+        matrix = None if seed_dict is None else Node.get_seed_matrix(seed_dict, wrt)
+        if matrix is not None:
+            if mode == 'reverse':
+                value, gradient = Node.eval_reverse(self, var_values, wrt, order=order)
+                deriv = Node.get_directional(gradient, wrt, matrix, shape)
+            else:
+                seeds = Node.get_matrix_seeds(wrt, matrix, len(shape))
+                values, derivs, index = Node.eval_post(self, var_values, wrt, order=order, seeds=seeds)
+                value = values[index[id(self)]]
+                deriv = derivs[index[id(self)]]
+            value = np.array(np.broadcast_to(value, shape), dtype=float)
+            deriv = np.array(np.broadcast_to(deriv, (matrix.shape[1],) + shape), dtype=float)
+            return {'value': value, 'derivative': deriv}
+
+        if mode == 'reverse':
+            value, deriv = Node.eval_reverse(self, var_values, wrt, seed_dict=seed_dict, order=order)
+        else:
+            values, derivs, index = Node.eval_post(self, var_values, wrt, seed_dict=seed_dict, order=order)
+            value = values[index[id(self)]]
+            deriv = Node.get_derivatives(derivs[index[id(self)]], wrt, shape)
+
+        # constants and derivatives that don't depend on the inputs may still be scalars,
+        # so we broadcast everything to the shape of the batch
+        value = np.array(np.broadcast_to(value, shape), dtype=float)
+        deriv = {key: np.array(np.broadcast_to(val, shape), dtype=float) for key, val in deriv.items()}
+        return {'value': value, 'derivative': deriv}
+
+    # this is the multiplication operator overload
+    def __mul__(self, other):
+        """This function overloads the multiplication operator
+
+        arguments:
+        self -- the current node
+        other -- the other node or numeric value (both are supported)
+        """
+        # chained products can be collapsed into a single reduction node
+        if flatten_reductions:
+            return Node._flatten(mul_n, 'prod', self, other)
+
+        # we apply the multiplication function to these two nodes
+        new_node = Node.create('__mul__', 'x', self, other)
+        return new_node
+
+    # this is the divide operator overload
+    def __truediv__(self, other):
+        """This function overloads the true divide operator
+
+           arguments:
            self -- the current node
            other -- the other node or numeric value (both are supported)
            """
         # we apply the division function to these two nodes
-        new_node = Node(None, None, lambda x, y: x / y,
-                        lambda x, y, xp, yp: ((y * xp - x * yp) / (y ** 2)), '/')
-        # set the child nodes
-        new_node.left = self
-        if isinstance(other, Node):
-            new_node.right = other
-        else:
-            new_node.right = Node(value=other)
+        new_node = Node.create('__truediv__', '/', self, other)
         return new_node
 
     # this is the divide operator overload
@@ -329,11 +1668,7 @@ class Node:
            other -- the other node or numeric value (both are supported)
            """
         # we apply the divide function in reverse order
-        new_node = Node(None, None, lambda x, y: y / x,
-                        lambda x, y, xp, yp: ((x * yp - y * xp) / (x ** 2)), '/')
-        # set the child nodes
-        new_node.left = self
-        new_node.right = Node(value=other)
+        new_node = Node.create('__rtruediv__', '/', self, other)
         return new_node
 
     # right multiplication
@@ -356,15 +1691,82 @@ class Node:
            self -- the current node
            other -- the other node or numeric value (both are supported)
            """
+        # chained sums can be collapsed into a single reduction node
+        if flatten_reductions:
+            return Node._flatten(add_n, 'sum', self, other)
+
         # we apply the add function to these two nodes
-        new_node = Node(None, None, np.add, lambda x, y, xp, yp: xp + yp, '+')
-        new_node.left = self
-        if isinstance(other, Node):
-            new_node.right = other
+        new_node = Node.create('__add__', '+', self, other)
+        return new_node
+
+    # this function collapses a binary sum or product into a reduction node
+    @staticmethod
+    def _flatten(reduction, function_name, left, right):
+        """This function returns a reduction node over the operands of a binary sum or
+        product.  If either side is already a reduction node of the same kind, its operands
+        are used instead of the node itself.  If the left side is one, its operand buffer
+        is extended, see extend_reduction, so a chain of n operations costs O(n) instead of
+        copying the operands at every step.
+
+        arguments:
+        reduction -- the function that creates the reduction node, either add_n or mul_n
+        function_name -- the name of the reduction, either 'sum' or 'prod'
+        left -- the left node
+        right -- the right node or numeric value
+        """
+        if left.operands is not None and left.function_name == function_name:
+            return Node.extend_reduction(left, right)
+        if isinstance(right, Node) and right.operands is not None and right.function_name == function_name:
+            return reduction([left] + right.operands)
+        return reduction([left, right])
+
+    # this function creates a reduction node with one more operand than an existing one
+    @staticmethod
+    def extend_reduction(node, item):
+        """This function returns a new reduction node that applies the operation of the given
+        reduction node to its operands and the given item.  If the item is a reduction node
+        of the same kind, its operands are added instead.  The new node shares the operand
+        buffer of the given node if nothing was appended to the buffer yet, so building a
+        chain of nodes that each add an operand takes O(1) time and memory per node.
+        Otherwise, the operands are copied into a new buffer.
+
+        arguments:
+        node -- the reduction node to extend
+        item -- the node or numeric value to add
+        """
+        buffer = node.operand_buffer
+        if len(buffer) != node.operand_count:
+            # another node has already extended the buffer
+            buffer = buffer[:node.operand_count]
+        if isinstance(item, Node) and item.operands is not None and item.function_name == node.function_name:
+            items = list(item.operands)
         else:
-            new_node.right = Node(value=other)
+            items = [Node.to_node(item)]
+        buffer.extend(items)
 
-        return new_node
+        new_node = Node(function_name=node.function_name)
+        Node.set_operation(new_node, node.op)
+        new_node.operand_buffer = buffer
+        new_node.operand_count = len(buffer)
+        new_node.var_mask = node.var_mask
+        for operand in items:
+            new_node.var_mask = Node.merge_masks(new_node.var_mask, operand.var_mask)
+        return Node.intern(new_node)
+
+    # the operands of a reduction node
+    @property
+    def operands(self):
+        """The list of operands of a reduction node, or None for other nodes.  The list must
+        not be modified, since it can be shared with other nodes.
+        """
+        if self.operand_buffer is None or len(self.operand_buffer) == self.operand_count:
+            return self.operand_buffer
+        return self.operand_buffer[:self.operand_count]
+
+    @operands.setter
+    def operands(self, operands):
+        self.operand_buffer = operands
+        self.operand_count = 0 if operands is None else len(operands)
 
     # right addition
     def __radd__(self, other):
@@ -387,13 +1789,7 @@ class Node:
            other -- the other node or numeric value (both are supported)
            """
         # we apply the add function to these two nodes
-        new_node = Node(None, None, np.subtract, lambda x, y, xp, yp: xp - yp, '-')
-        new_node.left = self
-        if isinstance(other, Node):
-            new_node.right = other
-        else:
-            new_node.right = Node(value=other)
-
+        new_node = Node.create('__sub__', '-', self, other)
         return new_node
 
     # right addition
@@ -405,10 +1801,7 @@ class Node:
            other -- the other node or numeric value (both are supported)
            """
         # we apply the add function to these two nodes
-        new_node = Node(None, None, lambda x, y: y - x, lambda x, y, xp, yp: yp - xp, '-')
-        new_node.left = self
-        new_node.right = Node(value=other)
-
+        new_node = Node.create('__rsub__', '-', self, other)
         return new_node
 
     # the general derivative for our power function has certain cases that we need to be
@@ -426,13 +1819,81 @@ class Node:
            xp - the derivative of the left node
            yp - the derivative of the right node
            """
-        if np.isclose(x, 0) or np.isclose(yp, 0):
-            return (x ** (y - 1)) * (y * xp)
-        elif x < 0:
+        # the log term is only needed where the exponent has a nonzero derivative
+        # we evaluate this elementwise so that batches of values are supported
+        simple = np.isclose(x, 0) | np.isclose(yp, 0)
+        if np.any(~simple & (x < 0)):
             raise ValueError('The derivative of a negative value raised to the specified power does not exist')
 
+        if np.all(simple):
+            return (x ** (y - 1)) * (y * xp)
         else:
-            return (x ** (y - 1)) * (y * xp + x * np.log(x) * yp)
+            log_x = np.log(np.where(simple, 1, x))
+            return (x ** (y - 1)) * (y * xp + np.where(simple, 0, x * log_x * yp))
+
+    @staticmethod
+    def _power_second(x, y, xp, yp):
+        """This function computes the derivatives of the partial derivatives of a power in
+        the direction of the derivatives of the base and the exponent.  Like _power_deriv,
+        the log of the base is only used where it exists, and terms whose derivative is 0
+        are left out, so that they don't turn into nan where the power has a singularity.
+
+           arguments:
+           x - the value of the left node
+           y - the value of the right node
+           xp - the derivative of the left node
+           yp - the derivative of the right node
+        """
+        def scale(factor, tangent):
+            return np.where(np.equal(tangent, 0), 0, factor * tangent)
+
+        with np.errstate(all='ignore'):
+            log_x = np.log(np.where(np.greater(x, 0), x, 1))
+            curvature = y * (y - 1)
+            cross = np.power(x, y - 1.0) * (1 + y * log_x)
+            left = scale(np.where(np.equal(curvature, 0), 0, curvature * np.power(x, y - 2.0)), xp)
+            right = scale(np.power(x, y * 1.0) * log_x ** 2, yp)
+            return left + scale(cross, yp), scale(cross, xp) + right
+
+    @staticmethod
+    def _power_taylor(a, b):
+        """This function computes the truncated Taylor series of a power from the series of the
+        base and the exponent.  For a constant exponent r, the coefficients are found one degree
+        at a time from a * p' = r * a' * p, which needs a nonzero base; a zero base is only
+        supported for integer exponents, using repeated products.  Otherwise, the power is
+        computed as exp(b * ln(a)), which needs a positive base.
+
+           arguments:
+           a - the series of the left node
+           b - the series of the right node
+        """
+        if np.any(b[1:] != 0):
+            if np.any(a[0] <= 0):
+                raise ValueError('The derivative of a negative value raised to the specified power does not exist')
+            return _taylor_exp(_taylor_mul(b, _taylor_ln(a)))
+
+        exponent = b[0]
+        if np.all(a[0] != 0):
+            result = np.zeros(np.shape(a))
+            result[0] = a[0] ** exponent
+            for j in range(1, len(result)):
+                weights = exponent * np.arange(1, j + 1) - np.arange(j - 1, -1, -1)
+                weights = weights.reshape((-1,) + (1,) * (np.ndim(a) - 1))
+                result[j] = np.sum(weights * a[1:j + 1] * result[j - 1::-1], axis=0) / (j * a[0])
+            return result
+
+        if exponent < 0 or exponent != int(exponent):
+            raise ValueError('The derivative of 0 raised to the specified power does not exist')
+        # repeated squaring of the base
+        result = _taylor_constant(1, a)
+        power = a
+        exponent = int(exponent)
+        while exponent:
+            if exponent & 1:
+                result = _taylor_mul(result, power)
+            power = _taylor_mul(power, power)
+            exponent >>= 1
+        return result
 
     @staticmethod
     def _power_func(x, y):
@@ -445,11 +1906,25 @@ class Node:
         """
         val = x ** y
         # do we end up with a complex number?
-        if not (isinstance(val, int) or (isinstance(val, float))):
+        # for numpy values this results in a nan, which is caught during evaluation
+        if isinstance(val, complex):
             raise ValueError('Raising {x} to the {y}th power results in a complex number')
 
         return val
 
+    @staticmethod
+    def _power_kernel(x, y, xp, yp):
+        """This function computes the value and the derivative of a power together, so
+        that the power is only dispatched once when the derivative is needed.
+
+           arguments:
+           x - the value of the left node
+           y - the value of the right node
+           xp - the derivative of the left node
+           yp - the derivative of the right node
+        """
+        return Node._power_func(x, y), Node._power_deriv(x, y, xp, yp)
+
     # our generic power function
     # this is a static method that will be called from __pow__ and __rpow__
     @staticmethod
@@ -463,17 +1938,7 @@ class Node:
         right -- the right object which can be a node or a numeric value
         """
 
-        new_node = Node(None, None, Node._power_func, Node._power_deriv, '^')
-        # set the child nodes
-        if isinstance(left, Node):
-            new_node.left = left
-        else:
-            new_node.left = Node(value=left)
-
-        if isinstance(right, Node):
-            new_node.right = right
-        else:
-            new_node.right = Node(value=right)
+        new_node = Node.create('__pow__', '^', left, right)
         return new_node
 
     # the power function
@@ -496,12 +1961,7 @@ class Node:
         other -- the other node or numeric value (both are supported)
         """
         # we apply the add function to these two nodes
-        new_node = Node(None, None, lambda x, y: int(x < y), lambda x, y, xp, yp: 0, '<')
-        new_node.left = self
-        if isinstance(other, Node):
-            new_node.right = other
-        else:
-            new_node.right = Node(value=other)
+        new_node = Node.create('__lt__', '<', self, other)
         return new_node
 
     # overloaded greater than operator
@@ -513,12 +1973,7 @@ class Node:
         other -- the other node or numeric value (both are supported)
         """
         # we apply the add function to these two nodes
-        new_node = Node(None, None, lambda x, y: int(x > y), lambda x, y, xp, yp: 0, '>')
-        new_node.left = self
-        if isinstance(other, Node):
-            new_node.right = other
-        else:
-            new_node.right = Node(value=other)
+        new_node = Node.create('__gt__', '>', self, other)
         return new_node
 
     # overloaded less than or equal operator
@@ -530,12 +1985,7 @@ class Node:
         other -- the other node or numeric value (both are supported)
         """
         # we apply the add function to these two nodes
-        new_node = Node(None, None, lambda x, y: int(x <= y), lambda x, y, xp, yp: 0, '<=')
-        new_node.left = self
-        if isinstance(other, Node):
-            new_node.right = other
-        else:
-            new_node.right = Node(value=other)
+        new_node = Node.create('__le__', '<=', self, other)
         return new_node
 
     # overloaded greater than or equal operator
@@ -547,12 +1997,7 @@ class Node:
         other -- the other node or numeric value (both are supported)
         """
         # we apply the add function to these two nodes
-        new_node = Node(None, None, lambda x, y: int(x >= y), lambda x, y, xp, yp: 0, '>=')
-        new_node.left = self
-        if isinstance(other, Node):
-            new_node.right = other
-        else:
-            new_node.right = Node(value=other)
+        new_node = Node.create('__ge__', '>=', self, other)
         return new_node
 
     # the power function with self as the exponent
@@ -573,10 +2018,7 @@ class Node:
         arguments:
         self -- the current node
         """
-        new_node = Node(None, None, lambda x: -x,
-                        lambda x, xp: -xp, 'negation')
-
-        new_node.left = self
+        new_node = Node.create('__neg__', 'negation', self)
         return new_node
 
     def __str__(self):
@@ -586,16 +2028,12 @@ class Node:
         self -- the current node
         """
 
-        if self.type == 'inter':
-            rv = f'[type:{self.type} ' \
-                 f'value:{self.value} ' \
-                 f'function:{self.function.__name__} ' \
-                 f'depth:{self.depth} ' \
-                 f'order:{self.order}]'
+        if self.type == Node.INTER:
+            rv = f'[type:{Node.type_names[self.type]} ' \
+                 f'function:{self.function.__name__}]'
         else:
-            rv = f' (type:{self.type} name:{self.var_name} ' \
-                 f'value:{self.value} ' \
-                 f'order:{self.order}) '
+            rv = f' (type:{Node.type_names[self.type]} name:{self.var_name} ' \
+                 f'value:{self.value}) '
         return rv
 
     # print the binary tree in preorder
@@ -609,85 +2047,297 @@ class Node:
         """
         self.print_preorder(self)
 
-    # this function is recursively called to reset
-    # all of the variables and derivatives in the tree
+    # this function returns the children of a node
     @staticmethod
-    def reset(root):
-        if root:
-            if root.type != 'const':
-                # we reset the value and deriv for the new graph traversal
-                root.value = None
-                root.deriv = None
-            Node.reset(root.left)
-            Node.reset(root.right)
-
-    # this function is recursively called to get a set
-    # of all variables that are in the tree
-    @staticmethod
-    def get_variables(root, vars):
-        """This function finds a set of all variables that exist in
-        the composite function by searching the binary tree
+    def get_children(root):
+        """This function returns a list of the children of a node.  These are the operands
+        for n-ary reduction nodes, and the left and right nodes otherwise.
 
         arguments:
-        root -- the root node to search from
-        vars -- the current set of variables that were found
+        root -- the node to get the children of
         """
-        if root:
-            if root.var_name is not None:
-                vars.add(root.var_name)
-            Node.get_variables(root.left, vars)
-            Node.get_variables(root.right, vars)
+        if root.operands is not None:
+            return root.operands
+        elif root.right is not None:
+            return [root.left, root.right]
+        elif root.left is not None:
+            return [root.left]
+        else:
+            return []
 
-    # print the tree in preorder recursively
+    # this function stacks the values or derivatives of the operands of a reduction node
     @staticmethod
-    def print_preorder(root):
-        """This prints the binary tree in preorder starting at the given root node
+    def stack(items):
+        """This function stacks a list of values or derivatives into a single array along
+        the first axis.  Scalars are broadcast against arrays so that batches are supported.
 
         arguments:
-        root - the node to print
+        items -- a list of scalars or arrays
         """
-        if root:
-            print(root)
-            Node.print_preorder(root.left)
-            Node.print_preorder(root.right)
+        return np.stack(np.broadcast_arrays(*items))
 
-    # this function is used to print the tree in postorder
-    def print_reverse(self):
-        """This prints the binary tree in post order
+    # this function checks the output buffers supplied to evaluate
+    @staticmethod
+    def check_out(out, num_outputs, num_wrt):
+        """This function checks that the out argument of evaluate is a tuple of a 1-D array
+        for the values and a 2-D array for the Jacobian, both float64 and of the right shapes,
+        and returns the two arrays.  A ValueError is raised otherwise.
 
         arguments:
-        self -- the current node
+        out -- the out argument as supplied by the user
+        num_outputs -- the number of outputs of the function
+        num_wrt -- the number of columns of the Jacobian, the number of variables in wrt
         """
-        Node.print_postorder(self)
+        if not ((isinstance(out, tuple) or isinstance(out, list)) and len(out) == 2):
+            raise ValueError('Please supply a tuple of a values array and a Jacobian array for the out argument')
+        values_out, jacobian_out = out
+        for array, shape in [(values_out, (num_outputs,)), (jacobian_out, (num_outputs, num_wrt))]:
+            if not isinstance(array, np.ndarray) or array.dtype != np.float64 or array.shape != shape:
+                raise ValueError(f'The arrays supplied to out must be float64 arrays of shape {shape}')
+        return values_out, jacobian_out
 
-    # print the tree in postorder recursively
+    # this function computes a topological ordering of the computation graph
+    # since nodes can be reused, our graph is a directed acyclic graph (DAG)
+    # rather than a tree, and every unique node appears exactly once
     @staticmethod
-    def print_postorder(root):
-        """This prints the binary tree in post order starting at the given node
-        This function is called recursively to traverse the tree
+    def topological_order(root):
+        """This function returns a list of the unique nodes in the computation graph
+        in postorder, so that every node appears after all of its children.  Nodes
+        that are shared by several parents (for example y in y * y) are only visited
+        and listed once, so the cost of a traversal grows with the number of unique
+        nodes rather than the number of paths through the graph.
 
         arguments:
-        root -- the node to print
+        root -- the root node to start from.  A list of root nodes can also be supplied,
+                in which case the combined graph of all of the roots is ordered.
         """
-        if root:
-            Node.print_postorder(root.left)
-            Node.print_postorder(root.right)
-            print(root)
+        order = []
+        visited = set()
 
-    # this function traverses the tree in postorder and
-    # computes the primary and tangent traces
-    # keeping track of both the value and the derivative
-    @staticmethod
+        # we use an explicit stack instead of recursion so that very deep graphs
+        # don't hit the recursion limit.  Each entry holds a node and whether its
+        # children have already been pushed onto the stack.
+        if isinstance(root, list):
+            stack = [(node, False) for node in reversed(root)]
+        else:
+            stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+            elif node is not None and id(node) not in visited:
+                visited.add(id(node))
+                stack.append((node, True))
+                for child in reversed(Node.get_children(node)):
+                    stack.append((child, False))
+
+        return order
+
+    # this function reads the mode argument of evaluate
+    @staticmethod
+    def parse_mode(kwargs):
+        """This function returns the differentiation mode requested in the keyword arguments
+        of evaluate, which is either 'forward' (the default) or 'reverse'.
+
+        arguments:
+        kwargs -- the keyword arguments supplied to evaluate
+        """
+        if 'mode' in kwargs:
+            mode = kwargs['mode']
+        else:
+            mode = 'forward'
+
+        if mode not in ('forward', 'reverse'):
+            raise ValueError("Please specify either 'forward' or 'reverse' for the mode argument")
+        return mode
+
+    # this function checks the arguments of the Taylor mode
+    @staticmethod
+    def parse_taylor(kwargs):
+        """This function returns the order and the direction supplied to evaluate for the Taylor
+        mode, or None for both if they weren't supplied.  A ValueError is raised if only one of
+        them is supplied, or if they have the wrong types.
+
+        arguments:
+        kwargs -- the keyword arguments of evaluate
+        """
+        if 'order' not in kwargs and 'direction' not in kwargs:
+            return None, None
+        if 'order' not in kwargs or 'direction' not in kwargs:
+            raise ValueError('Please specify both the order and the direction for higher order derivatives')
+
+        degree = kwargs['order']
+        if not isinstance(degree, int) or isinstance(degree, bool) or degree < 1:
+            raise ValueError('Please specify a positive integer for the order argument')
+        direction = kwargs['direction']
+        if not isinstance(direction, dict):
+            raise ValueError('Please specify a dictionary for the direction argument')
+        for key, value in direction.items():
+            if not (isinstance(value, int) or isinstance(value, float)):
+                raise ValueError(f'Invalid direction for variable {key}:{value}')
+        return degree, direction
+
+    # this function converts the wrt argument to a list of variable names
+    @staticmethod
+    def parse_wrt(wrt_pre, vars):
+        """This function converts the wrt argument of evaluate to a list of variable names.
+        The user may supply a list of strings, a list of variables, or a mix of both.
+        A ValueError is raised for incorrect types or variables that are not in the graph.
+
+        arguments:
+        wrt_pre -- the wrt argument as supplied by the user
+        vars -- the set of variable names in the graph
+        """
+        if not (isinstance(wrt_pre, list)):
+            raise ValueError('Incorrect type supplied to wrt. '
+                             'Please supply a list of variables or strings of variable names')
+        wrt = []
+
+        for item in wrt_pre:
+            if not (isinstance(item, Node) or isinstance(item, str)):
+                raise ValueError('Incorrect type supplied to wrt')
+            if isinstance(item, Node):
+                if not item.var_name:
+                    raise ValueError('Incorrect node type supplied to wrt.  Please supply a variable.')
+                wrt.append(item.var_name)
+            else:
+                wrt.append(item)
+
+        if not set(wrt) <= vars:
+            raise ValueError('Variables specified in wrt do not match the variables in the equation')
+        return wrt
+
+    # this function is called to reset
+    # all of the variables and derivatives in the graph
+    @staticmethod
+    def reset(root, order=None):
+        """This function resets the values of all non-constant nodes in the graph.  Each
+        unique node is reset exactly once.
+
+        arguments:
+        root -- the root node to start from, or a list of root nodes
+        order -- optionally supply a precomputed topological order of the graph
+        """
+        if order is None:
+            order = Node.topological_order(root)
+        for node in order:
+            if node.type != Node.CONST:
+                # we reset the value for the new graph traversal
+                node.value = None
+
+    # this function is called to get a set
+    # of all variables that are in the graph
+    @staticmethod
+    def get_variables(root, vars):
+        """This function finds a set of all variables that exist in
+        the composite function.  The variables of every node are cached as a
+        bitmask when the node is built, so the graph is only searched below the
+        nodes that have no bitmask, see get_variable_bit.
+
+        arguments:
+        root -- the root node to search from
+        vars -- the current set of variables that were found
+        """
+        mask = 0
+        visited = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.var_mask is not None:
+                mask |= node.var_mask
+            elif id(node) not in visited:
+                visited.add(id(node))
+                if node.var_name is not None:
+                    vars.add(node.var_name)
+                else:
+                    stack.extend(Node.get_children(node))
+        vars.update(Node.get_mask_variables(mask))
+
+    # this function determines which nodes depend on the variables in wrt
+    @staticmethod
+    def get_activity(order, index, wrt):
+        """This function returns a list that tells for every node of a topological order
+        whether it depends on any of the variables in wrt, that is, whether the node is active.
+        The activity of a node is taken from its bitmask if it has one, and from the activity
+        of its children otherwise, see get_variable_bit.
+
+        arguments:
+        order -- the topological order of the graph
+        index -- the dictionary that maps the id of each node to its index
+        wrt -- a list of variables to compute the derivatives for
+        """
+        wrt_mask = Node.get_variable_mask(wrt)
+        wrt_names = set(wrt)
+        activity = [False] * len(order)
+        for position, node in enumerate(order):
+            if node.var_mask is not None:
+                activity[position] = bool(node.var_mask & wrt_mask)
+            elif node.var_name is not None:
+                activity[position] = node.var_name in wrt_names
+            else:
+                activity[position] = any(activity[index[id(child)]] for child in Node.get_children(node))
+        return activity
+
+    # print the tree in preorder
+    @staticmethod
+    def print_preorder(root):
+        """This prints the graph in preorder starting at the given root node.
+        Each unique node is printed once.
+
+        arguments:
+        root - the node to print
+        """
+        visited = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node is not None and id(node) not in visited:
+                visited.add(id(node))
+                print(node)
+                stack.extend(reversed(Node.get_children(node)))
+
+    # this function is used to print the tree in postorder
+    def print_reverse(self):
+        """This prints the binary tree in post order
+
+        arguments:
+        self -- the current node
+        """
+        Node.print_postorder(self)
+
+    # print the tree in postorder
+    @staticmethod
+    def print_postorder(root):
+        """This prints the graph in post order starting at the given node.
+        Each unique node is printed once.
+
+        arguments:
+        root -- the node to print
+        """
+        for node in Node.topological_order(root):
+            print(node)
+
+    # this function traverses the graph in topological order and
+    # computes the primary and tangent traces
+    # keeping track of both the value and the derivative
+    @staticmethod
     def eval_post(root, var_values, wrt, images=None, root_render=None,
-                  fig=None, font_size=None, depth_counts=None, seed_dict=None):
-        """This our primary recursive computation engine for lazy evaluation.
-        Our binary tree is traversed and the primary and tangent traces are updated
-        in postorder.  All of the existing symbolic variables are substituted with
-        the values supplied in the call to eval. This function is used internally
-        and is called recursively.
+                  fig=None, font_size=None, depth_counts=None, layout=None, seed_dict=None, order=None,
+                  seeds=None):
+        """This our primary computation engine for lazy evaluation.
+        Our graph is traversed in topological order (postorder with every unique node
+        visited exactly once) and the primary and tangent traces are updated along the way.
+        All of the existing symbolic variables are substituted with the values supplied
+        in the call to eval. This function is used internally.
+
+        The traces are not stored on the nodes.  Every call creates its own lists of values
+        and tangents, indexed by the position of each node in the topological order, so the
+        same graph can be evaluated by several threads at once.  The lists and the dictionary
+        that maps the id of each node to its index are returned.  When rendering, the values
+        and tangents are also copied to the layout of the visualizer.
 
         arguments:
-        root -- the current node
+        root -- the root node of the graph, or a list of root nodes
         var_values -- the list of variable values supplied to the call to eval
         wrt -- a list of variables to compute the derivatives for.  To compute the entire gradient,
                exclude this argument
@@ -696,84 +2346,510 @@ class Node:
         fig -- the current matplotlib figure
         font_size -- this is used internally to store the font size of the render
         depth_counts -- used internally by the visualization engine to determine the layouts of the nodes
+        layout -- the layouts of the nodes created by the visualization engine
         seed_dict -- for more advanced usage, optionally specify a seed dictionary to use
+        order -- optionally supply a precomputed topological order of the graph
+        seeds -- optionally supply the tangents of the variables in wrt directly, instead of
+                 creating them from wrt and seed_dict.  This is used for compressed seeds, see
+                 sparse_jacobian.
         """
-        if root:
-            Node.eval_post(root.left, var_values, wrt, images, root_render, fig, font_size,
-                           depth_counts, seed_dict=seed_dict)
-            Node.eval_post(root.right, var_values, wrt, images, root_render, fig, font_size,
-                           depth_counts, seed_dict=seed_dict)
-            # if a function is attached to this node, we apply it to the
-            # children
-            # this works similar to activation functions in neural networks
-            if root.function:
-                root.deriv = {}
-                if root.right is None:
-                    try:
-                        # disable invalid value warnings since we catch them later
-                        with warnings.catch_warnings():
-                            warnings.simplefilter("ignore")
-                            root.value = root.function(root.left.value)
-                    except:
-                        raise ValueError(f'Incorrect number of arguments supplied to function: {root.function_name}')
-                    if np.isnan(root.value):
-                        raise ValueError(f'Invalid value encountered in function: {root.function_name}')
-
-                    for key in wrt:
-                        root.deriv[key] = root.derivative(root.left.value, root.left.deriv[key])
-                else:
+        if order is None:
+            order = Node.topological_order(root)
+
+        # the tangents have one lane per variable in wrt, and an extra
+        # axis for each axis of the inputs when a batch is evaluated
+        ndim = 0
+        for node in order:
+            if node.var_name is not None:
+                ndim = max(ndim, np.ndim(var_values[node.var_name]))
+        if seeds is None:
+            seeds = Node.get_seeds(wrt, seed_dict, ndim)
+
+        values = [None] * len(order)
+        derivs = [None] * len(order)
+        index = Node.get_index(order)
+        activity = Node.get_activity(order, index, wrt)
+        for node in order:
+            Node.eval_node(node, var_values, seeds, activity, values, derivs, index)
+
+            # append the frame to the movie
+            if images:
+                layout[id(node)].value = values[index[id(node)]]
+                layout[id(node)].deriv = derivs[index[id(node)]]
+                images.extend(visualizer.frame(root_render, fig, font_size, depth_counts, layout, node, wrt))
+
+        return values, derivs, index
+
+    # this function maps the nodes of a topological order to their positions
+    @staticmethod
+    def get_index(order):
+        """This function returns a dictionary that maps the id of every node in the given
+        topological order to its position in the order.
+
+        arguments:
+        order -- the topological order of the graph
+        """
+        return {id(node): i for i, node in enumerate(order)}
+
+    # this function creates the tangent vectors of the variables
+    @staticmethod
+    def get_seeds(wrt, seed_dict=None, ndim=0):
+        """This function creates the tangent vectors that are assigned to the variables
+        before the graph is traversed.  Each tangent vector has one lane per variable in wrt.
+        The tangent of a variable in wrt is 1 (or its value in the seed dictionary) in its
+        own lane and 0 in every other lane.  The function returns a dictionary of tangent vectors.
+        The tangents of other variables and constants are not stored, see eval_node.
+
+        arguments:
+        wrt -- a list of variables to compute the derivatives for
+        seed_dict -- for more advanced usage, optionally specify a seed dictionary to use
+        ndim -- the number of axes of the input values.  The tangents get trailing axes of
+                length 1 so that they broadcast against batches of values.
+        """
+        shape = (len(wrt),) + (1,) * ndim
+        seeds = {}
+        for i, key in enumerate(wrt):
+            seed = 1
+            if seed_dict and key in seed_dict:
+                seed = seed_dict[key]
+                if not (isinstance(seed, int) or isinstance(seed, float)):
+                    raise ValueError('Invalid type passed into the seed dictionary.')
+            seeds[key] = np.zeros(shape)
+            seeds[key][i] = seed
+        return seeds
+
+    # this function converts a seed_dict with several directions to a seed matrix
+    @staticmethod
+    def get_seed_matrix(seed_dict, wrt):
+        """This function returns the seed matrix, with one row per variable in wrt and one
+        column per direction, if the seed_dict argument supplies several directions, and None
+        if it holds a single seed per variable.  Several directions are supplied either as a
+        2-D array whose rows follow the order of wrt, or as a dictionary that maps variables to
+        1-D sequences of the same length.  Variables that are missing from the dictionary get
+        a row of zeros.  With a seed matrix, the tangents have one lane per direction instead
+        of one per variable, so all of the directional derivatives are computed in one pass.
+
+        arguments:
+        seed_dict -- the seed_dict argument as supplied by the user
+        wrt -- a list of variables to compute the derivatives for
+        """
+        if isinstance(seed_dict, dict):
+            if not any(np.ndim(seed) > 0 for seed in seed_dict.values()):
+                return None
+            lengths = {np.shape(seed) for seed in seed_dict.values()}
+            if len(lengths) != 1 or len(next(iter(lengths))) != 1:
+                raise ValueError('Please supply 1-D seeds of the same length for every variable in the seed_dict')
+            matrix = np.zeros((len(wrt),) + next(iter(lengths)))
+            for i, key in enumerate(wrt):
+                if key in seed_dict:
                     try:
-                        # disable invalid value warnings since we catch them later
-                        with warnings.catch_warnings():
-                            warnings.simplefilter("ignore")
-                            root.value = root.function(root.left.value, root.right.value)
-                    except:
-                        raise ValueError(f'Incorrect number of arguments supplied to function: {root.function_name}')
-                    if np.isnan(root.value):
-                        raise ValueError(f'Invalid value encountered in function: {root.function_name}')
-                    for key in wrt:
-                        root.deriv[key] = root.derivative(root.left.value, root.right.value,
-                                                          root.left.deriv[key], root.right.deriv[key])
-            # if we have a variable, we set the node value to the value
-            # that was set in the eval call
-            elif root.var_name:
-                root.value = var_values[root.var_name]
-                # here make a dictionary to store our derivatives
-                root.deriv = {}
-                for key in wrt:
-                    if key == root.var_name:
-                        if seed_dict and key in seed_dict:
-                            if (isinstance(seed_dict[key], int) or isinstance(seed_dict[key], float)):
-                                root.deriv[key] = seed_dict[key]
-                            else:
-                                raise ValueError('Invalid type passed into the seed dictionary.')
+                        matrix[i] = seed_dict[key]
+                    except (TypeError, ValueError):
+                        raise ValueError('Invalid type passed into the seed dictionary.')
+            return matrix
+
+        if np.ndim(seed_dict) != 2 or len(seed_dict) != len(wrt):
+            raise ValueError('Please supply a seed matrix with one row for every variable in wrt')
+        try:
+            return np.array(seed_dict, dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid type passed into the seed dictionary.')
+
+    # this function creates the tangents of the variables from a seed matrix
+    @staticmethod
+    def get_matrix_seeds(wrt, matrix, ndim=0):
+        """This function returns a dictionary with the tangents of the variables in wrt for a
+        seed matrix, which are the rows of the matrix, see get_seed_matrix.
+
+        arguments:
+        wrt -- a list of variables to compute the derivatives for
+        matrix -- the seed matrix
+        ndim -- the number of axes of the input values, see get_seeds
+        """
+        return {key: row.reshape(row.shape + (1,) * ndim) for key, row in zip(wrt, matrix)}
+
+    # this function computes the directional derivatives of a seed matrix from a gradient
+    @staticmethod
+    def get_directional(gradient, wrt, matrix, shape=()):
+        """This function returns the array of the directional derivatives of a node for the
+        directions of a seed matrix, with the directions along the first axis, from its
+        gradient.  This is used by the reverse mode, which computes the gradient first.
+
+        arguments:
+        gradient -- the dictionary of derivatives of the node
+        wrt -- a list of variables to compute the derivatives for
+        matrix -- the seed matrix
+        shape -- the shape of the batch of inputs, if any
+        """
+        directional = np.zeros((matrix.shape[1],) + tuple(shape))
+        for key, row in zip(wrt, matrix):
+            directional = directional + row.reshape(row.shape + (1,) * len(shape)) * gradient[key]
+        return directional
+
+    # this function converts the tangent vector of a node to a dictionary of derivatives
+    @staticmethod
+    def get_derivatives(tangent, wrt, shape=()):
+        """This function returns a dictionary with the derivative of a node with respect to each
+        variable in wrt, taken from the lanes of the tangent vector of the node.
+
+        arguments:
+        tangent -- the tangent vector of the node
+        wrt -- the list of variables used for the evaluation
+        shape -- the shape of the batch of inputs, if any
+        """
+        deriv = np.broadcast_to(tangent, (len(wrt),) + tuple(shape))
+        return {key: deriv[i] for i, key in enumerate(wrt)}
+
+    # this function computes the value and derivative of a single node
+    # from the values and derivatives of its children
+    @staticmethod
+    def eval_node(root, var_values, seeds, activity, values, derivs, index):
+        """This function computes the primary and tangent traces of a single node.
+        The children of the node must already have been evaluated.  The tangent trace
+        is a single vector with one lane per variable that we differentiate with respect to,
+        so the derivative function is called only once for all of the variables.
+
+        A node is active if it depends on a variable in wrt, see get_activity.
+        Nodes that are inactive for every variable in wrt, including constants and the
+        variables that we don't differentiate with respect to, only compute their value.
+        Their tangent is an implicit scalar 0 instead of a stored vector of zeros, which
+        broadcasts against the tangents of the active nodes in the derivative functions.
+
+        arguments:
+        root -- the node to evaluate
+        var_values -- the list of variable values supplied to the call to eval
+        seeds -- a dictionary with the tangent vectors of the variables
+        activity -- the list of the activities of the nodes, see get_activity
+        values -- the list of the values of the nodes, indexed by their position in the topological order
+        derivs -- the list of the tangents of the nodes, indexed in the same way
+        index -- the dictionary that maps the id of each node to its index
+        """
+        position = index[id(root)]
+        active = activity[position]
+        # if a function is attached to this node, we apply it to the
+        # children
+        # this works similar to activation functions in neural networks
+        # the functions are looked up in the registry once per node
+        if root.op is not None:
+            function, derivative, value_and_derivative = operations[root.op][:3]
+            children = Node.get_children(root)
+            child_values = [values[index[id(child)]] for child in children]
+            if root.operands is not None:
+                # reduction nodes are evaluated over all of their operands at once
+                stacked = Node.stack(child_values)
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    value = function(stacked)
+                if np.any(np.isnan(value)):
+                    raise ValueError(f'Invalid value encountered in function: {root.function_name}')
+                deriv = 0
+                if active:
+                    deriv = derivative(stacked, Node.stack([derivs[index[id(child)]] for child in children]))
+            else:
+                # unary functions only use the left child
+                deriv = 0
+                try:
+                    # disable invalid value warnings since we catch them later
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore")
+                        if active and value_and_derivative:
+                            # the kernel computes the value and the derivative together
+                            value, deriv = value_and_derivative(
+                                *child_values, *[derivs[index[id(child)]] for child in children])
                         else:
-                            root.deriv[key] = 1
+                            value = function(*child_values)
+                except ValueError:
+                    raise
+                except:
+                    raise ValueError(f'Incorrect number of arguments supplied to function: {root.function_name}')
+                if np.any(np.isnan(value)):
+                    raise ValueError(f'Invalid value encountered in function: {root.function_name}')
+
+                if active and not value_and_derivative:
+                    deriv = derivative(*child_values, *[derivs[index[id(child)]] for child in children])
+            values[position] = value
+            derivs[position] = deriv
+        # if we have a variable, we set the node value to the value
+        # that was set in the eval call
+        elif root.var_name:
+            values[position] = var_values[root.var_name]
+            if root.var_name in seeds:
+                derivs[position] = seeds[root.var_name]
+            else:
+                derivs[position] = 0
+
+        # if the node is a constant, we set the derivatives to 0
+        elif root.type == Node.CONST:
+            values[position] = root.value
+            derivs[position] = 0
+
+    # this function computes the gradient with the reverse (adjoint) mode
+    @staticmethod
+    def eval_reverse(root, var_values, wrt, seed_dict=None, order=None):
+        """This is our reverse mode computation engine.  We first traverse the graph
+        in topological order to compute the primary trace only.  We then traverse the
+        graph in the opposite order, propagating the adjoint (the derivative of the
+        root with respect to each node) from every node to its children.  The full
+        gradient is available after this single backward sweep, regardless of
+        the number of variables.
+
+        The partial derivatives of each node are obtained from the same derivative
+        functions that are used for the forward mode by seeding a single child
+        with a derivative of 1.  Children that do not depend on any variable in wrt
+        are skipped, so the results match the forward mode.  The value of the root and
+        the gradient, as a dictionary of derivatives, are returned.
+
+        arguments:
+        root -- the root node of the graph
+        var_values -- the list of variable values supplied to the call to eval
+        wrt -- a list of variables to compute the derivatives for
+        seed_dict -- for more advanced usage, optionally specify a seed dictionary to use
+        order -- optionally supply a precomputed topological order of the graph
+        """
+        if order is None:
+            order = Node.topological_order(root)
+
+        # the primary trace
+        values, _, index = Node.eval_post(root, var_values, [], seed_dict=seed_dict, order=order)
+
+        activity = Node.get_activity(order, index, wrt)
+        gradient = Node.eval_adjoints(root, order, activity, wrt, values, index, seed_dict=seed_dict)
+        return values[index[id(root)]], gradient
+
+    # this function performs the backward sweep of the reverse mode
+    @staticmethod
+    def eval_adjoints(root, order, activity, wrt, values, index, seed_dict=None):
+        """This function propagates the adjoints from the root to the variables in a single
+        backward sweep, and returns the gradient of the root as a dictionary of derivatives.
+        The primary trace must already have been computed.  Like the primary trace, the
+        adjoints are kept in a list indexed by the position of each node in the topological order.
+
+        arguments:
+        root -- the node to compute the gradient of.  If a list of nodes is supplied, the
+                gradient of their sum is computed, which is used for compressed seeds, see
+                sparse_jacobian.
+        order -- the topological order of a graph that contains the root
+        activity -- the list of the activities of the nodes, see get_activity.  Nodes that do
+                    not depend on any of the variables in wrt are skipped
+        wrt -- a list of variables to compute the derivatives for
+        values -- the list of the values of the nodes from eval_post
+        index -- the dictionary that maps the id of each node to its index
+        seed_dict -- for more advanced usage, optionally specify a seed dictionary to use
+        """
+        adjoints = [None] * len(order)
+        for item in (root if isinstance(root, list) else [root]):
+            adjoints[index[id(item)]] = (adjoints[index[id(item)]] or 0) + 1
+        for position in range(len(order) - 1, -1, -1):
+            node = order[position]
+            adjoint = adjoints[position]
+            if adjoint is None or not activity[position] or node.op is None:
+                continue
+            entry = operations[node.op]
+            derivative = entry[1]
+            if node.operands is not None:
+                stacked = Node.stack([values[index[id(operand)]] for operand in node.operands])
+                partials = [(operand, partial) for operand, partial in zip(node.operands, entry[3](stacked))
+                            if activity[index[id(operand)]]]
+            elif node.right is None:
+                partials = [(node.left, derivative(values[index[id(node.left)]], 1))]
+            else:
+                left_value = values[index[id(node.left)]]
+                right_value = values[index[id(node.right)]]
+                partials = []
+                if activity[index[id(node.left)]]:
+                    partials.append((node.left, derivative(left_value, right_value, 1, 0)))
+                if activity[index[id(node.right)]]:
+                    partials.append((node.right, derivative(left_value, right_value, 0, 1)))
+            for child, partial in partials:
+                child_position = index[id(child)]
+                if adjoints[child_position] is not None:
+                    adjoints[child_position] = adjoints[child_position] + adjoint * partial
+                else:
+                    adjoints[child_position] = adjoint * partial
+
+        # collect the adjoints of the variables into the gradient
+        # the same variable can appear in several variable nodes
+        gradient = {key: 0 for key in wrt}
+        for node, adjoint in zip(order, adjoints):
+            if node.var_name in gradient and adjoint is not None:
+                gradient[node.var_name] = gradient[node.var_name] + adjoint
+
+        for key in gradient:
+            if seed_dict and key in seed_dict:
+                if not (isinstance(seed_dict[key], int) or isinstance(seed_dict[key], float)):
+                    raise ValueError('Invalid type passed into the seed dictionary.')
+                gradient[key] = gradient[key] * seed_dict[key]
+
+        return gradient
+
+    # this function computes second derivatives with a backward sweep over the tangents
+    @staticmethod
+    def eval_second(root, var_values, wrt, seeds, order=None):
+        """This is our engine for second derivatives.  We first compute the primary and tangent
+        traces with the forward mode, using the given tangents of the variables.  We then
+        propagate two adjoints backwards: the adjoint of the values, which gives the gradient
+        as in the reverse mode, and the adjoint of the tangents, which gives the gradient of
+        the directional derivative of the root in the direction of the tangents.  This is the
+        product of the Hessian and the direction.  If the tangents of the variables have one
+        lane per variable in wrt, as in the forward mode, the lanes give the rows of the Hessian.
+
+        The partial derivatives are obtained from the derivative functions as in eval_adjoints,
+        and their derivatives from the second derivative functions of the operations, see
+        get_function.  The value of the root, the gradient and the second adjoints of the
+        variables in wrt are returned as dictionaries.
+
+        arguments:
+        root -- the root node of the graph
+        var_values -- the list of variable values supplied to the call to eval
+        wrt -- a list of variables to compute the derivatives for
+        seeds -- a dictionary with the tangents of the variables in wrt
+        order -- optionally supply a precomputed topological order of the graph
+        """
+        if order is None:
+            order = Node.topological_order(root)
+
+        # the primary and tangent traces
+        values = [None] * len(order)
+        derivs = [None] * len(order)
+        index = Node.get_index(order)
+        activity = Node.get_activity(order, index, wrt)
+        for node in order:
+            Node.eval_node(node, var_values, seeds, activity, values, derivs, index)
+
+        adjoints = [None] * len(order)
+        second = [0] * len(order)
+        adjoints[index[id(root)]] = 1
+        for position in range(len(order) - 1, -1, -1):
+            node = order[position]
+            adjoint = adjoints[position]
+            if adjoint is None or not activity[position] or node.op is None:
+                continue
+            entry = operations[node.op]
+            derivative, second_derivative = entry[1], entry[4]
+            if second_derivative is None:
+                raise ValueError(f'No second derivative is defined for the function: {node.function_name}')
+
+            children = Node.get_children(node)
+            child_values = [values[index[id(child)]] for child in children]
+            child_derivs = [derivs[index[id(child)]] for child in children]
+            if node.operands is not None:
+                stacked = Node.stack(child_values)
+                partials = entry[3](stacked)
+                partial_derivs = second_derivative(stacked, Node.stack(child_derivs))
+            elif node.right is None:
+                partials = [derivative(child_values[0], 1)]
+                partial_derivs = [second_derivative(child_values[0], child_derivs[0])]
+            else:
+                # like in eval_adjoints, the partials of inactive children are not computed
+                partials = [derivative(*child_values, 1, 0) if activity[index[id(node.left)]] else 0,
+                            derivative(*child_values, 0, 1) if activity[index[id(node.right)]] else 0]
+                partial_derivs = second_derivative(*child_values, *child_derivs)
+
+            for child, partial, partial_deriv in zip(children, partials, partial_derivs):
+                if not activity[index[id(child)]]:
+                    continue
+                child_position = index[id(child)]
+                if adjoints[child_position] is not None:
+                    adjoints[child_position] = adjoints[child_position] + adjoint * partial
+                else:
+                    adjoints[child_position] = adjoint * partial
+                second[child_position] = second[child_position] + second[position] * partial + adjoint * partial_deriv
+
+        # collect the adjoints of the variables
+        gradient = {key: 0 for key in wrt}
+        product = {key: 0 for key in wrt}
+        for node, adjoint, second_adjoint in zip(order, adjoints, second):
+            if node.var_name in gradient and adjoint is not None:
+                gradient[node.var_name] = gradient[node.var_name] + adjoint
+                product[node.var_name] = product[node.var_name] + second_adjoint
+        return values[index[id(root)]], gradient, product
+
+    # this function propagates truncated Taylor series through the graph
+    @staticmethod
+    def eval_taylor(root, var_values, direction, degree, order=None):
+        """This is our engine for higher order directional derivatives (the Taylor mode).  The
+        variables are moved along a line, x + t * direction, and every node computes the
+        coefficients of the Taylor series in t of its value up to the given degree, from the
+        series of its children, with the Taylor rule of its operation, see get_function.  The
+        graph is traversed once, and each rule costs O(degree^2) operations.  The array of
+        coefficients of the root is returned.  The k-th directional derivative is k! times
+        the k-th coefficient.
+
+        arguments:
+        root -- the root node of the graph
+        var_values -- the list of variable values supplied to the call to eval
+        direction -- a dictionary with the direction of each variable.  Missing variables have
+                     a direction of 0.
+        degree -- the degree of the series
+        order -- optionally supply a precomputed topological order of the graph
+        """
+        if order is None:
+            order = Node.topological_order(root)
+
+        series = [None] * len(order)
+        index = Node.get_index(order)
+        for position, node in enumerate(order):
+            if node.op is not None:
+                function, taylor = operations[node.op][0], operations[node.op][5]
+                if taylor is None:
+                    raise ValueError(f'No Taylor rule is defined for the function: {node.function_name}')
+                children = [series[index[id(child)]] for child in Node.get_children(node)]
+                # disable invalid value warnings since we catch them below
+                with np.errstate(all='ignore'):
+                    if node.operands is not None:
+                        result = taylor(Node.stack(children))
+                        value = function(Node.stack([child[0] for child in children]))
                     else:
-                        root.deriv[key] = 0
+                        result = taylor(*children)
+                        value = function(*[child[0] for child in children])
+                # the value is computed with the function of the node, so that it matches the
+                # other modes exactly
+                result[0] = value
+                if np.any(np.isnan(result)):
+                    raise ValueError(f'Invalid value encountered in function: {node.function_name}')
+            elif node.var_name is not None:
+                result = np.zeros(degree + 1)
+                result[0] = var_values[node.var_name]
+                result[1] = direction.get(node.var_name, 0)
+            else:
+                result = np.zeros(degree + 1)
+                result[0] = node.value
+            series[position] = result
+        return series[index[id(root)]]
 
-            # if the node is a constant, we set the derivatives to 0
-            elif root.type == 'const':
-                root.deriv = {}
-                for key in wrt:
-                    root.deriv[key] = 0
 
-            # append the frame to the movie
-            if images:
-                images.extend(visualizer.frame(root_render, fig, font_size, depth_counts, root))
+# the power operation uses the static methods of the node class
+register_operation('__pow__', Node._power_func, Node._power_deriv, Node._power_kernel,
+                   second_derivative=Node._power_second, taylor=Node._power_taylor)
 
 
 # this our main function to evaluate functions with vector outputs
-# for each output, we call the eval method of that node
+# all of the outputs are evaluated together in a single traversal of their combined graph
 # to use the visualizer on a particular output, run the eval member function on that node
 def evaluate(nodes, **kwargs):
     """This function allows one to evaluate vector valued functions by supplying a list of nodes.  Each node in the
        list corresponds to each scalar output of our function.
 
+       The outputs are evaluated together in a single traversal of their combined graph, so any
+       intermediate nodes that are shared between outputs are only computed once.  By default, a
+       list with a dictionary of the value and the derivatives for each output is returned.  With
+       output='array', a dictionary with a 1-D array of the values and a 2-D float64 array with the
+       Jacobian is returned instead.  The columns of the Jacobian follow the order of wrt (or the
+       alphabetical order of the variable names if wrt is not supplied).  The results are written
+       directly into these arrays.  To avoid allocating new arrays in every iteration of a loop,
+       a tuple (values, jacobian) of preallocated float64 arrays of shape (outputs,) and
+       (outputs, len(wrt)) can be supplied with the out argument.  These arrays are then filled
+       in and returned.
+
+       If a seed matrix is supplied with the seed_dict argument (see Node.get_seed_matrix), the
+       derivative of each output is an array of its directional derivatives instead, and with
+       output='array' the derivative has one column per direction.
+
        arguments:
        nodes -- a list of nodes to evaluate
        kwargs -- here the values of the variables can be specified and the wrt argument can be included to only
-                 compute a select set of derivatives.
+                 compute a select set of derivatives.  The seed_dict, mode, output and out arguments
+                 are also supported.
        """
     if not (isinstance(nodes, list) or isinstance(nodes, Node)):
         raise ValueError('Please specify a node or list of nodes as the first argument to eval')
@@ -789,7 +2865,7 @@ def evaluate(nodes, **kwargs):
     if 'wrt' in kwargs:
         wrt_pre = kwargs['wrt']
     else:
-        wrt_pre = list(set(kwargs.keys()) - {'wrt', 'seed_dict'})
+        wrt_pre = sorted(set(kwargs.keys()) - evaluate_keywords)
 
     if not isinstance(wrt_pre, list):
         raise ValueError('Please supply a list of variables or strings for the wrt argument')
@@ -807,18 +2883,59 @@ def evaluate(nodes, **kwargs):
         else:
             wrt.append(item)
 
+    for node in nodes:
+        if not isinstance(node, Node):
+            raise ValueError('Please specify a node or list of nodes as the first argument to eval')
+
+    if 'seed_dict' in kwargs:
+        seed_dict = kwargs['seed_dict']
+        if not isinstance(seed_dict, (dict, np.ndarray)):
+            raise ValueError('Please specify a dictionary or a seed matrix for the seed_dict argument')
+    else:
+        seed_dict = None
+
+    mode = Node.parse_mode(kwargs)
+
+    if 'order' in kwargs or 'direction' in kwargs:
+        raise ValueError('The order and direction arguments are only supported by Node.evaluate.')
+
+    # with a seed matrix, the columns of the derivative are the directions instead of the variables
+    matrix = None if seed_dict is None else Node.get_seed_matrix(seed_dict, wrt)
+    columns = len(wrt) if matrix is None else matrix.shape[1]
+
+    if 'output' in kwargs:
+        output = kwargs['output']
+    else:
+        output = 'dict'
+
+    if output not in ('dict', 'array'):
+        raise ValueError("Please specify either 'dict' or 'array' for the output argument")
+
+    if output == 'array':
+        if 'out' in kwargs:
+            values_out, jacobian_out = Node.check_out(kwargs['out'], len(nodes), columns)
+        else:
+            values_out = np.empty(len(nodes))
+            jacobian_out = np.empty((len(nodes), columns))
+    elif 'out' in kwargs:
+        raise ValueError("The out argument is only supported with output='array'")
+
+    # a single topological order of the combined graph of all of the outputs
+    order = Node.topological_order(nodes)
+
     # let's build a list of varables within each node and then a master set
     # of all available variables to check that the inputs are correct
+    # the variables of each node are cached as a bitmask when the node is built
     vars = []
     for node in nodes:
-        local_vars = set()
-        Node.get_variables(node, local_vars)
-        vars.append(local_vars)
+        lvars = set()
+        Node.get_variables(node, lvars)
+        vars.append(lvars)
 
-    all_vars = set.union(*vars)
+    all_vars = set.union(*[set(lvars) for lvars in vars])
 
     # check to make sure our inputs match the full set of possible variables
-    supplied_vars = set(kwargs.keys()) - {'wrt', 'seed_dict'}
+    supplied_vars = set(kwargs.keys()) - evaluate_keywords
     if not (supplied_vars == all_vars):
         raise ValueError('Please specify values for every variable that is present in this vector valued function, '
                          'and only variables that appear in the function.')
@@ -826,28 +2943,1419 @@ def evaluate(nodes, **kwargs):
     if not set(wrt) <= all_vars:
         raise ValueError('An variable was supplied to wrt that is not in the function')
 
+    # check to see if the variable types are numeric
+    for key in supplied_vars:
+        if not (isinstance(kwargs[key], int) or isinstance(kwargs[key], float)):
+            raise ValueError(f'Attempting to assign a non-numeric value to variable {key}:{kwargs[key]}')
+
+    # evaluate all of the outputs in a single traversal
+    if matrix is not None:
+        if mode == 'reverse':
+            values, _, index = Node.eval_post(nodes, kwargs, [], order=order)
+            activity = Node.get_activity(order, index, wrt)
+            directionals = [Node.get_directional(Node.eval_adjoints(node, order, activity, wrt, values, index),
+                                                 wrt, matrix) for node in nodes]
+        else:
+            values, derivs, index = Node.eval_post(nodes, kwargs, wrt, order=order,
+                                                   seeds=Node.get_matrix_seeds(wrt, matrix))
+            directionals = [np.array(np.broadcast_to(derivs[index[id(node)]], (columns,)), dtype=float)
+                            for node in nodes]
+
+        if output == 'array':
+            for i, (node, directional) in enumerate(zip(nodes, directionals)):
+                values_out[i] = values[index[id(node)]]
+                jacobian_out[i] = directional
+            return {'value': values_out, 'derivative': jacobian_out}
+        return [{'value': values[index[id(node)]], 'derivative': directional}
+                for node, directional in zip(nodes, directionals)]
+
+    if mode == 'reverse':
+        # the primary trace is shared, and each output gets its own backward sweep
+        values, _, index = Node.eval_post(nodes, kwargs, [], order=order)
+        activity = Node.get_activity(order, index, wrt)
+        gradients = [Node.eval_adjoints(node, order, activity, wrt, values, index, seed_dict=seed_dict)
+                     for node in nodes]
+    else:
+        values, derivs, index = Node.eval_post(nodes, kwargs, wrt, seed_dict=seed_dict, order=order)
+        if output == 'array':
+            # the tangent vector of each output is its row of the jacobian
+            # inactive outputs have a scalar 0 tangent, which is broadcast over the row
+            for i, node in enumerate(nodes):
+                values_out[i] = values[index[id(node)]]
+                jacobian_out[i] = derivs[index[id(node)]]
+            return {'value': values_out, 'derivative': jacobian_out}
+        gradients = [Node.get_derivatives(derivs[index[id(node)]], wrt) for node in nodes]
+
+    if output == 'array':
+        # write the results directly into the arrays
+        for i, (node, gradient) in enumerate(zip(nodes, gradients)):
+            values_out[i] = values[index[id(node)]]
+            jacobian_out[i] = [gradient[key] for key in wrt]
+        return {'value': values_out, 'derivative': jacobian_out}
+
     # store our list of results
+    # for each output, we only report the derivatives for the variables that
+    # appear in the graph of that output
     results = []
-    for node, lvars in zip(nodes, vars):
-        # for each node, we determine the variables that belong to the binary tree corresponding
-        # to the node, perform an intersection of the variables, and supply these variables and
-        # (optionally) the wrt parameter to the eval member function of each node to
-        # generate the vector output.
-
-        # grab the variables for this subset
-        var_values = {i: kwargs[i] for i in lvars}
-
-        supplied_wrt = []
-        for w in wrt:
-            if w in lvars:
-                supplied_wrt.append(w)
-
-        # if a seed dictionary is supplied, add this to the arguments to be passed to the
-        # evaluate member function.
-        if 'seed_dict' in kwargs:
-            var_values['seed_dict'] = kwargs['seed_dict']
+    for node, lvars, gradient in zip(nodes, vars, gradients):
+        results.append({'value': values[index[id(node)]],
+                        'derivative': {w: gradient[w] for w in wrt if w in lvars}})
+
+    return results
+
+
+# this function checks the arguments of hessian and hvp and returns the variables
+def parse_second_arguments(node, kwargs, keywords):
+    """This function checks the arguments of hessian and hvp, which take the values of the
+    variables as keyword arguments like Node.evaluate, and returns the set of variables
+    of the graph.
+
+    arguments:
+    node -- the root node of the graph
+    kwargs -- the keyword arguments as supplied by the user
+    keywords -- the keyword arguments that are not variable names
+    """
+    if not isinstance(node, Node):
+        raise ValueError('Please specify a node to differentiate')
+    vars = set()
+    Node.get_variables(node, vars)
+    supplied_vars = set(kwargs.keys()) - keywords
+    if supplied_vars != vars:
+        raise ValueError('Supplied variables do not match those in the equation.')
+    for key in supplied_vars:
+        if not (isinstance(kwargs[key], int) or isinstance(kwargs[key], float)):
+            raise ValueError(f'Attempting to assign a non-numeric value to variable {key}:{kwargs[key]}')
+    return vars
+
+
+# this function computes the Hessian of a node
+def hessian(node, **kwargs):
+    """This function computes the value, the gradient and the Hessian (the matrix of second
+    derivatives) of a node at the supplied values of the variables.  The tangents of the
+    variables are propagated with the forward mode, with one lane per variable, and the
+    gradients of all of the lanes are then computed together with a single backward sweep,
+    see Node.eval_second.  The cost is that of a forward and a backward sweep over vectors
+    with one entry per variable, instead of a gradient for every variable.
+
+    By default, a dictionary with the value, a dictionary with the gradient, and a nested
+    dictionary with the Hessian, such that result['hessian']['x']['y'] is the second
+    derivative with respect to x and y, is returned.  With output='array', the gradient is
+    a 1-D array and the Hessian is a 2-D array, whose rows and columns follow the order of wrt.
+
+    arguments:
+    node -- the node to differentiate
+    wrt -- optionally, a list of variables to compute the derivatives for.  By default,
+           all of the variables are used, in sorted order.
+    output -- 'dict' (the default) or 'array'
+    **kwargs -- the values of the variables
+    """
+    vars = parse_second_arguments(node, kwargs, {'wrt', 'output'})
+    if 'wrt' in kwargs:
+        wrt = Node.parse_wrt(kwargs['wrt'], vars)
+    else:
+        wrt = sorted(vars)
+    output = kwargs.get('output', 'dict')
+    if output not in ('dict', 'array'):
+        raise ValueError("Please specify either 'dict' or 'array' for the output argument")
+
+    value, gradient, rows = Node.eval_second(node, kwargs, wrt, Node.get_seeds(wrt))
+    matrix = np.zeros((len(wrt), len(wrt)))
+    for i, key in enumerate(wrt):
+        matrix[i] = np.reshape(rows[key], -1) if np.ndim(rows[key]) else rows[key]
+
+    if output == 'array':
+        return {'value': value,
+                'derivative': np.array([gradient[key] for key in wrt], dtype=float),
+                'hessian': matrix}
+    return {'value': value,
+            'derivative': gradient,
+            'hessian': {key: {other: matrix[i, j] for j, other in enumerate(wrt)} for i, key in enumerate(wrt)}}
+
+
+# this function computes the product of the Hessian of a node and a vector
+def hvp(node, v, **kwargs):
+    """This function computes the value, the gradient and the product of the Hessian of a
+    node and a direction vector, without forming the Hessian.  The variables get the
+    direction as their tangents, so the forward mode computes the directional derivative of
+    every node, and a single backward sweep then computes its gradient, which is the
+    product of the Hessian and the direction, see Node.eval_second.  The cost is a small
+    multiple of the cost of evaluating the node, regardless of the number of variables.
+
+    A dictionary with the value, a dictionary with the gradient, and a dictionary with the
+    entries of the product, under the key 'hvp', is returned.
+
+    arguments:
+    node -- the node to differentiate
+    v -- the direction, as a dictionary that maps variable names to numbers.  Variables
+         that are missing have a direction of 0.
+    **kwargs -- the values of the variables
+    """
+    vars = parse_second_arguments(node, kwargs, set())
+    if not isinstance(v, dict):
+        raise ValueError('Please specify the direction as a dictionary of variable names and numbers')
+    if not set(v) <= vars:
+        raise ValueError('The direction contains variables that are not in the equation')
+    for key, direction in v.items():
+        if not (isinstance(direction, int) or isinstance(direction, float)):
+            raise ValueError(f'Invalid direction for variable {key}:{direction}')
+
+    wrt = sorted(vars)
+    value, gradient, product = Node.eval_second(node, kwargs, wrt, {key: v.get(key, 0) for key in wrt})
+    return {'value': value, 'derivative': gradient, 'hvp': product}
+
+
+# this function assigns colors to the columns of a sparsity pattern
+def color_columns(rows, num_columns):
+    """This function colors the columns of a sparsity pattern, so that two columns that have a
+    nonzero entry in the same row never get the same color.  The columns of one color can then
+    share a single seed direction, since every row has at most one nonzero entry among them.
+    The columns are colored greedily, the columns with the most nonzero entries first, with the
+    smallest color that isn't used by any column that shares a row.  A list with the color of
+    each column and the number of colors are returned.  To color the rows instead, pass the
+    transposed pattern.
+
+    arguments:
+    rows -- a list with the sorted indices of the nonzero columns of each row
+    num_columns -- the number of columns
+    """
+    columns = [[] for _ in range(num_columns)]
+    for i, row in enumerate(rows):
+        for j in row:
+            columns[j].append(i)
+
+    colors = [0] * num_columns
+    # the colors that are already used in each row
+    row_colors = [set() for _ in rows]
+    num_colors = 0
+    for j in sorted(range(num_columns), key=lambda j: -len(columns[j])):
+        used = set()
+        for i in columns[j]:
+            used |= row_colors[i]
+        color = 0
+        while color in used:
+            color += 1
+        colors[j] = color
+        num_colors = max(num_colors, color + 1)
+        for i in columns[j]:
+            row_colors[i].add(color)
+    return colors, num_colors
+
+
+# this class holds a sparse matrix in the compressed sparse row format
+class CSRMatrix:
+    """This class holds a sparse matrix in the compressed sparse row (CSR) format.  The column
+    indices of the nonzero entries of row i are indices[indptr[i]:indptr[i + 1]], in increasing
+    order, and their values are the same slice of data.  These are the same arrays that
+    scipy.sparse uses, so the matrix can be converted with to_scipy, or passed to
+    scipy.sparse.csr_matrix((data, indices, indptr), shape=shape) directly.  scipy is not
+    needed otherwise.
+    """
+
+    def __init__(self, data, indices, indptr, shape):
+        """This is the constructor of our CSRMatrix class.
+
+        arguments:
+        data -- the values of the nonzero entries
+        indices -- the column indices of the nonzero entries
+        indptr -- the positions in data and indices where each row starts, with a final entry
+                  for the end of the last row
+        shape -- the number of rows and columns
+        """
+        self.data = np.asarray(data, dtype=float)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.indptr = np.asarray(indptr, dtype=np.int32)
+        self.shape = tuple(shape)
+
+    def __repr__(self):
+        """This function returns a string representation of the matrix."""
+        return f'CSRMatrix(shape={self.shape}, nnz={self.nnz})'
+
+    # the number of stored entries
+    @property
+    def nnz(self):
+        """This is the number of stored (structurally nonzero) entries."""
+        return len(self.data)
+
+    # this function converts the matrix to a dense array
+    def toarray(self):
+        """This function returns the matrix as a dense 2-D array."""
+        dense = np.zeros(self.shape)
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        dense[rows, self.indices] = self.data
+        return dense
+
+    # this function converts the matrix to a scipy sparse matrix
+    def to_scipy(self):
+        """This function returns the matrix as a scipy.sparse.csr_matrix.  scipy is only
+        imported here, so it is an optional dependency.
+        """
+        try:
+            from scipy import sparse
+        except ImportError:
+            raise ImportError('scipy is needed to convert the Jacobian to a scipy sparse matrix')
+        return sparse.csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+
+# this function computes a sparse Jacobian with compressed seeds
+def sparse_jacobian(nodes, **kwargs):
+    """This function computes the Jacobian of a vector valued function whose outputs each depend
+    on only a few of the variables.  The sparsity pattern is read from the bitmasks of the
+    variables that each output depends on, without traversing the graph.  The variables are
+    then colored, see color_columns, so that no output depends on two variables of the same
+    color, and all of the variables of a color share a single lane of the tangents.  The
+    forward mode then costs as many lanes as there are colors instead of one per variable, and
+    the derivative of each output with respect to each variable it depends on is read from
+    the lane of its color.
+
+    With mode='reverse', the outputs are colored instead, so that no two outputs of a color
+    depend on the same variable, and a single backward sweep computes the gradient of the sum
+    of the outputs of each color, from which the rows of the Jacobian are read.
 
-        # evaluate the node and append our results
-        results.append(node.evaluate(**var_values, wrt=supplied_wrt))
+    A dictionary with a 1-D array of the values, the Jacobian as a CSRMatrix, and the number of
+    colors is returned.  The columns of the Jacobian follow the order of wrt (or the
+    alphabetical order of the variable names if wrt is not supplied).
 
+    arguments:
+    nodes -- a list of nodes to evaluate
+    kwargs -- the values of the variables, and optionally the wrt and mode arguments
+    """
+    if not isinstance(nodes, list) or not all(isinstance(node, Node) for node in nodes) or not nodes:
+        raise ValueError('Please specify a list of nodes as the first argument to sparse_jacobian')
+    unsupported = (set(kwargs) & evaluate_keywords) - {'wrt', 'mode'}
+    if unsupported:
+        raise ValueError(f'Unsupported arguments for sparse_jacobian: {sorted(unsupported)}')
+    mode = Node.parse_mode(kwargs)
+
+    rows = []
+    for node in nodes:
+        lvars = set()
+        Node.get_variables(node, lvars)
+        rows.append(lvars)
+    all_vars = set().union(*rows)
+    supplied_vars = set(kwargs.keys()) - evaluate_keywords
+    if supplied_vars != all_vars:
+        raise ValueError('Please specify values for every variable that is present in this vector valued function, '
+                         'and only variables that appear in the function.')
+    for key in supplied_vars:
+        if not (isinstance(kwargs[key], int) or isinstance(kwargs[key], float)):
+            raise ValueError(f'Attempting to assign a non-numeric value to variable {key}:{kwargs[key]}')
+    if 'wrt' in kwargs:
+        wrt = Node.parse_wrt(kwargs['wrt'], all_vars)
+    else:
+        wrt = sorted(all_vars)
+
+    # the sparsity pattern, with the columns of each row in increasing order
+    positions = {key: j for j, key in enumerate(wrt)}
+    rows = [sorted(positions[key] for key in lvars if key in positions) for lvars in rows]
+    order = Node.topological_order(nodes)
+
+    data = []
+    if mode == 'reverse':
+        columns = [[] for _ in wrt]
+        for i, row in enumerate(rows):
+            for j in row:
+                columns[j].append(i)
+        colors, num_colors = color_columns(columns, len(nodes))
+        values, _, index = Node.eval_post(nodes, kwargs, [], order=order)
+        activity = Node.get_activity(order, index, wrt)
+        gradients = [Node.eval_adjoints([node for node, color in zip(nodes, colors) if color == c],
+                                        order, activity, wrt, values, index)
+                     for c in range(num_colors)]
+        for i, row in enumerate(rows):
+            data.extend(gradients[colors[i]][wrt[j]] for j in row)
+    else:
+        colors, num_colors = color_columns(rows, len(wrt))
+        # the compressed seeds, with one lane per color
+        seeds = {}
+        for key, color in zip(wrt, colors):
+            seeds[key] = np.zeros(num_colors)
+            seeds[key][color] = 1
+        values, derivs, index = Node.eval_post(nodes, kwargs, wrt, order=order, seeds=seeds)
+        for node, row in zip(nodes, rows):
+            tangent = derivs[index[id(node)]]
+            data.extend(tangent[colors[j]] for j in row)
+
+    indptr = np.cumsum([0] + [len(row) for row in rows])
+    jacobian = CSRMatrix(data, [j for row in rows for j in row], indptr, (len(nodes), len(wrt)))
+    return {'value': np.array([values[index[id(node)]] for node in nodes], dtype=float),
+            'derivative': jacobian,
+            'colors': num_colors}
+
+
+# this class holds a computation graph that has been compiled into a flat tape
+# of instructions.  The graph is only traversed once, when it is compiled.
+class CompiledFunction:
+    """This class stores a computation graph as a flat tape of instructions that can be
+    evaluated many times without traversing the graph.  Every unique node of the graph is
+    assigned an integer slot in preallocated arrays of values and tangents.  Each
+    instruction of the tape is a tuple of an opcode, which indexes the table of unique
+    functions and derivatives of the graph, the output slot and the slots of the
+    left and right children (-1 if the node is unary).  For n-ary reduction nodes, the
+    left entry is an array with the slots of all of the operands and the right entry is -2.
+    The last entry of each instruction is False if the node does not depend on any
+    variable in wrt, in which case its tangent stays zero and the derivative is not called.
+
+    The tangents of each slot are stored as a row vector with one entry per variable in
+    wrt, so each derivative function is only called once per instruction.  Constants
+    and the seeds of the variables are written into the arrays when the graph is compiled.
+
+    In incremental mode, the values and tangents of the last call are kept, and only the
+    instructions that depend on variables whose values changed are executed again.  For
+    this, we keep an index that maps each variable to the sorted positions of the
+    instructions downstream of it.
+
+    Unlike the evaluation of a graph, a compiled function reuses its arrays between calls,
+    so a compiled function should not be called from several threads at once.  Compile the
+    graph once per thread instead.
+    """
+
+    def __init__(self, root, wrt=None, seed_dict=None, incremental=False):
+        """This is the constructor of our CompiledFunction class.  Use the compile_graph
+        function to create compiled functions.
+
+        arguments:
+        root -- the root node of the graph to compile
+        wrt -- a list of variables to compute the derivatives for.  By default, the derivatives
+               for all variables are computed, in alphabetical order of the variable names.
+        seed_dict -- for more advanced usage, optionally specify a seed dictionary to use
+        incremental -- if True, only recompute the nodes that depend on the variables that
+                       changed since the last call
+        """
+        if not isinstance(root, Node):
+            raise ValueError('Please specify a node to compile')
+
+        order = Node.topological_order(root)
+
+        vars = set()
+        Node.get_variables(root, vars)
+        self.variables = vars
+
+        if wrt is None:
+            wrt = sorted(vars)
+        else:
+            wrt = Node.parse_wrt(wrt, vars)
+        self.wrt = wrt
+
+        if seed_dict is not None and not isinstance(seed_dict, dict):
+            raise ValueError('Please specify a dictionary for the seed_dict argument')
+
+        # assign a slot to every unique node
+        slots = {id(node): slot for slot, node in enumerate(order)}
+        self.root_slot = slots[id(root)]
+
+        self.values = np.zeros(len(order))
+        self.tangents = np.zeros((len(order), len(wrt)))
+
+        # the table of unique functions and derivatives that the opcodes refer to
+        opcodes = {}
+        self.ops = []
+        self.function_names = []
+        self.functions = []
+        self.derivatives = []
+        self.kernels = []
+
+        self.var_slots = []
+        self.tape = []
+        activity = Node.get_activity(order, slots, wrt)
+        for slot, node in enumerate(order):
+            if node.function:
+                key = node.op
+                if key not in opcodes:
+                    opcodes[key] = len(self.functions)
+                    self.ops.append(node.op)
+                    self.function_names.append(node.function_name)
+                    self.functions.append(node.function)
+                    self.derivatives.append(node.derivative)
+                    self.kernels.append(node.value_and_derivative)
+                if node.operands is not None:
+                    # for reduction nodes, left holds an array with the slots of the operands
+                    operand_slots = np.array([slots[id(operand)] for operand in node.operands])
+                    self.tape.append((opcodes[key], slot, operand_slots, -2, activity[slot]))
+                else:
+                    right = slots[id(node.right)] if node.right is not None else -1
+                    self.tape.append((opcodes[key], slot, slots[id(node.left)], right, activity[slot]))
+            elif node.var_name is not None:
+                self.var_slots.append((slot, node.var_name))
+                if node.var_name in wrt:
+                    seed = 1
+                    if seed_dict and node.var_name in seed_dict:
+                        seed = seed_dict[node.var_name]
+                        if not (isinstance(seed, int) or isinstance(seed, float)):
+                            raise ValueError('Invalid type passed into the seed dictionary.')
+                    self.tangents[slot, wrt.index(node.var_name)] = seed
+            else:
+                self.values[slot] = node.value
+
+        # the dependency index for incremental evaluation
+        self.incremental = incremental
+        self.last_inputs = None
+        if incremental:
+            self.build_dependents()
+
+    # this function builds the dependency index for incremental evaluation
+    def build_dependents(self):
+        """This function finds, for every variable, the positions of the instructions of the
+        tape that depend on it.  The variables that each slot depends on are propagated
+        through the tape as bitmasks, so the graph itself is not needed.
+        """
+        names = sorted(self.variables)
+        masks = [0] * len(self.values)
+        for slot, name in self.var_slots:
+            masks[slot] = 1 << names.index(name)
+
+        dependents = {name: [] for name in names}
+        for position, (opcode, out, left, right, active) in enumerate(self.tape):
+            if right == -2:
+                mask = 0
+                for slot in left:
+                    mask |= masks[slot]
+            else:
+                mask = masks[left]
+                if right >= 0:
+                    mask |= masks[right]
+            masks[out] = mask
+            while mask:
+                bit = mask & -mask
+                dependents[names[bit.bit_length() - 1]].append(position)
+                mask ^= bit
+        self.dependents = {name: np.array(positions, dtype=int) for name, positions in dependents.items()}
+
+    # this function converts the compiled function to arrays that can be saved
+    def to_arrays(self):
+        """This function returns a dictionary of numpy arrays that describe the compiled
+        function, which can be saved with np.savez and turned back into a compiled function
+        with from_arrays.  The operations are stored by name, together with a fingerprint
+        of their code.
+        """
+        if None in self.ops:
+            raise ValueError('Only graphs of registered operations can be saved')
+
+        # each instruction is stored as a row with the opcode, the output slot, the left and
+        # right slots, the active flag and the number of operands.  For reductions, the
+        # left entry is the position of the first operand in the array of operands.
+        tape = np.zeros((len(self.tape), 6), dtype=np.int64)
+        operands = []
+        for row, (opcode, out, left, right, active) in zip(tape, self.tape):
+            if right == -2:
+                row[:] = (opcode, out, len(operands), right, active, len(left))
+                operands.extend(left)
+            else:
+                row[:] = (opcode, out, left, right, active, 0)
+
+        var_slots = np.array([slot for slot, name in self.var_slots], dtype=np.int64)
+        return {'format': np.array(cache_format_version),
+                'ops': np.array(self.ops, dtype=str),
+                'fingerprints': np.array([get_operation_fingerprint(op) for op in self.ops], dtype=str),
+                'function_names': np.array(self.function_names, dtype=str),
+                'tape': tape,
+                'operands': np.array(operands, dtype=np.int64),
+                'values': self.values,
+                'var_slots': var_slots,
+                'var_names': np.array([name for slot, name in self.var_slots], dtype=str),
+                'var_tangents': self.tangents[var_slots],
+                'variables': np.array(sorted(self.variables), dtype=str),
+                'wrt': np.array(self.wrt, dtype=str),
+                'root_slot': np.array(self.root_slot),
+                'incremental': np.array(self.incremental)}
+
+    # this function creates a compiled function from arrays
+    @staticmethod
+    def from_arrays(arrays):
+        """This function creates a compiled function from the arrays created by to_arrays.
+        The operations are looked up in the registry by name.  A ValueError is raised if the
+        arrays were created with a different format, or if an operation is missing or its
+        code has changed since the arrays were created.
+
+        arguments:
+        arrays -- a dictionary of arrays, or the object returned by np.load
+        """
+        if int(arrays['format']) != cache_format_version:
+            raise ValueError('The compiled function was saved with a different format')
+
+        compiled = CompiledFunction.__new__(CompiledFunction)
+        compiled.ops = [str(op) for op in arrays['ops']]
+        for op, fingerprint in zip(compiled.ops, arrays['fingerprints']):
+            if op not in operations or get_operation_fingerprint(op) != fingerprint:
+                raise ValueError(f'The operation {op} has changed since the function was compiled')
+        compiled.function_names = [str(name) for name in arrays['function_names']]
+        compiled.functions = [operations[op][0] for op in compiled.ops]
+        compiled.derivatives = [operations[op][1] for op in compiled.ops]
+        compiled.kernels = [operations[op][2] for op in compiled.ops]
+
+        operands = arrays['operands']
+        compiled.tape = []
+        for opcode, out, left, right, active, count in arrays['tape'].tolist():
+            if right == -2:
+                left = operands[left:left + count]
+            compiled.tape.append((opcode, out, left, right, bool(active)))
+
+        compiled.values = np.array(arrays['values'], dtype=float)
+        var_slots = arrays['var_slots']
+        compiled.var_slots = [(int(slot), str(name)) for slot, name in zip(var_slots, arrays['var_names'])]
+        compiled.variables = {str(name) for name in arrays['variables']}
+        compiled.wrt = [str(name) for name in arrays['wrt']]
+        compiled.tangents = np.zeros((len(compiled.values), len(compiled.wrt)))
+        compiled.tangents[var_slots] = arrays['var_tangents']
+        compiled.root_slot = int(arrays['root_slot'])
+
+        compiled.incremental = bool(arrays['incremental'])
+        compiled.last_inputs = None
+        if compiled.incremental:
+            compiled.build_dependents()
+        return compiled
+
+    # this function saves the compiled function to a file
+    def save(self, path):
+        """This function saves the compiled function to a .npz file.  The file is written
+        under a temporary name first, so other processes never see a partially written file.
+
+        arguments:
+        path -- the path of the file
+        """
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as file:
+            np.savez(file, **self.to_arrays())
+        os.replace(temporary_path, path)
+
+    # this function loads a compiled function from a file
+    @staticmethod
+    def load(path):
+        """This function loads a compiled function that was saved with save.
+
+        arguments:
+        path -- the path of the file
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            return CompiledFunction.from_arrays(arrays)
+
+    def __call__(self, **kwargs):
+        """This function evaluates the compiled graph for the supplied values of the
+        variables and returns the value and the derivatives in the same format as
+        Node.evaluate.  Only the values of the variables should be supplied.
+        """
+        if len(kwargs) != len(self.variables):
+            raise ValueError('Supplied variables do not match those in the equation.')
+
+        # if an error occurs below, the cached values are incomplete,
+        # so we only keep the last inputs once the evaluation succeeds
+        last_inputs = self.last_inputs
+        self.last_inputs = None
+
+        values = self.values
+        tangents = self.tangents
+        try:
+            for slot, name in self.var_slots:
+                values[slot] = kwargs[name]
+        except KeyError:
+            raise ValueError('Supplied variables do not match those in the equation.')
+        except (TypeError, ValueError):
+            raise ValueError('Attempting to assign a non-numeric value to a variable')
+
+        if self.incremental:
+            tape = self.get_dirty_instructions(kwargs, last_inputs)
+        else:
+            tape = self.tape
+
+        self.run(tape)
+
+        if self.incremental:
+            # the bit patterns are compared so that 0.0 and -0.0 count as different inputs
+            self.last_inputs = {name: np.float64(kwargs[name]).tobytes() for name in self.variables}
+
+        root = self.root_slot
+        return {'value': values[root],
+                'derivative': {key: tangents[root, i] for i, key in enumerate(self.wrt)}}
+
+    # compiled functions can be used in place of nodes
+    evaluate = __call__
+
+    # this function finds the instructions that need to be executed again
+    def get_dirty_instructions(self, inputs, last_inputs):
+        """This function returns the list of instructions that depend on a variable
+        whose value differs from the last call, in the order of the tape.  The whole
+        tape is returned if there are no cached values.
+
+        arguments:
+        inputs -- the values of the variables for this call
+        last_inputs -- the bit patterns of the variables for the last call, or None
+        """
+        if last_inputs is None:
+            return self.tape
+
+        changed = [name for name in self.variables
+                   if np.float64(inputs[name]).tobytes() != last_inputs[name]]
+        if not changed:
+            return []
+        elif len(changed) == 1:
+            positions = self.dependents[changed[0]]
+        else:
+            positions = np.unique(np.concatenate([self.dependents[name] for name in changed]))
+        return [self.tape[position] for position in positions]
+
+    # this function executes a list of instructions
+    def run(self, tape):
+        """This function executes the given instructions in order, updating the arrays of
+        values and tangents.
+
+        arguments:
+        tape -- the list of instructions to execute
+        """
+        values = self.values
+        tangents = self.tangents
+        functions = self.functions
+        derivatives = self.derivatives
+        kernels = self.kernels
+        # disable invalid value warnings since we catch them below
+        with np.errstate(all='ignore'):
+            for opcode, out, left, right, active in tape:
+                try:
+                    if right < 0:
+                        if active and kernels[opcode]:
+                            value, tangents[out] = kernels[opcode](values[left], tangents[left])
+                        else:
+                            value = functions[opcode](values[left])
+                            if active:
+                                tangents[out] = derivatives[opcode](values[left], tangents[left])
+                    elif active and kernels[opcode]:
+                        value, tangents[out] = kernels[opcode](values[left], values[right],
+                                                               tangents[left], tangents[right])
+                    else:
+                        value = functions[opcode](values[left], values[right])
+                        if active:
+                            tangents[out] = derivatives[opcode](values[left], values[right],
+                                                                tangents[left], tangents[right])
+                except TypeError:
+                    raise ValueError(f'Incorrect number of arguments supplied to function: '
+                                     f'{self.function_names[opcode]}')
+                if value != value:
+                    raise ValueError(f'Invalid value encountered in function: {self.function_names[opcode]}')
+                values[out] = value
+
+
+# this class holds the most recently used results of evaluate for a node
+class EvaluationCache:
+    """This class is a least recently used (LRU) cache of the results of Node.evaluate.  The
+    results are stored in an ordered dictionary, with the most recently used results at
+    the end, so the oldest results are evicted first when the cache is full.  Copies of the
+    results are stored and returned, so changing a result doesn't change the cache.  A lock
+    makes the cache safe to use from several threads.
+    """
+
+    def __init__(self, maxsize=128):
+        """This is the constructor of our EvaluationCache class.
+
+        arguments:
+        maxsize -- the maximum number of results to keep
+        """
+        if not isinstance(maxsize, int) or isinstance(maxsize, bool) or maxsize < 1:
+            raise ValueError('Please specify a positive integer for the size of the cache')
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # this function builds the key of a call to evaluate
+    @staticmethod
+    def get_key(kwargs):
+        """This function returns a hashable key for the arguments of a call to evaluate, or
+        None if the arguments can't be used as a key, in which case the call isn't cached.
+        The types of the values are part of the key, since 1 and 1.0 give results of
+        different types, and so are their representations, since values that compare equal,
+        such as 0.0 and -0.0, can give different results.
+
+        arguments:
+        kwargs -- the keyword arguments of the call to evaluate
+        """
+        items = []
+        for name in sorted(kwargs):
+            value = kwargs[name]
+            if name == 'wrt' and isinstance(value, list):
+                value = tuple(value)
+            elif name in ('seed_dict', 'direction') and isinstance(value, dict):
+                # seed matrices give arrays of derivatives, which aren't cached
+                if any(np.ndim(seed) > 0 for seed in value.values()):
+                    return None
+                value = tuple(sorted((key, type(seed), seed) for key, seed in value.items()))
+            items.append((name, type(value), value, repr(value)))
+        key = tuple(items)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    # this function copies a result so that the cached result can't be changed
+    @staticmethod
+    def copy(result):
+        """This function returns a copy of a result of evaluate.
+
+        arguments:
+        result -- the dictionary with the value and the derivatives
+        """
+        return {'value': result['value'], 'derivative': dict(result['derivative'])}
+
+    def get(self, key):
+        """This function returns a copy of the cached result for the key, or None if there is none.
+
+        arguments:
+        key -- the key of the call
+        """
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                self.hits += 1
+                return EvaluationCache.copy(self.results[key])
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        """This function stores a copy of a result, evicting the least recently used results
+        if the cache is full.
+
+        arguments:
+        key -- the key of the call
+        result -- the dictionary with the value and the derivatives
+        """
+        with self.lock:
+            self.results[key] = EvaluationCache.copy(result)
+            self.results.move_to_end(key)
+            while len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """This function removes all of the results from the cache."""
+        with self.lock:
+            self.results.clear()
+
+    def info(self):
+        """This function returns the statistics of the cache."""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self.results), 'maxsize': self.maxsize}
+
+
+# the graph that is evaluated by a worker process of evaluate_many, or the error that
+# was raised when it was rebuilt
+worker_graph = None
+worker_error = None
+
+
+# this function is run once in every worker process of evaluate_many
+def _init_worker(records):
+    """This function rebuilds the graph that the worker process evaluates from its records,
+    see Node.to_records.  The graph is only sent to each worker once.  An error in the
+    initializer would break the pool, so it is stored and raised by _evaluate_points
+    instead, which sends it back to the parent process.
+
+    arguments:
+    records -- the records of the graph
+    """
+    global worker_graph, worker_error
+    try:
+        worker_graph = Node.from_records(records)
+    except ValueError as error:
+        worker_error = error
+
+
+# this function evaluates a chunk of points in a worker process
+def _evaluate_points(points, options):
+    """This function evaluates the graph of the worker process at each of the given points.
+
+    arguments:
+    points -- a list of dictionaries with the values of the variables
+    options -- a dictionary with the wrt, seed_dict and mode arguments of evaluate
+    """
+    if worker_error is not None:
+        raise worker_error
+    return [worker_graph.evaluate(**point, **options) for point in points]
+
+
+# this function evaluates a graph at many points in parallel
+def evaluate_many(node, points, max_workers=None, chunksize=None, **kwargs):
+    """This function evaluates a graph at many input points, using a pool of worker processes
+    to spread the points across the cores.  The graph is pickled and sent to each worker once,
+    and the points are sent in chunks.  A list with the result of node.evaluate at each point
+    is returned, in the order of the points.  The operations of the graph must be registered
+    in the worker processes, which is the case for the built-in functions and for functions
+    created with get_function when a module is imported.  Otherwise, for example with the
+    spawn start method and a function that is created inside another function, a ValueError
+    is raised.
+
+    arguments:
+    node -- the root node of the graph
+    points -- a list of dictionaries with the values of the variables
+    max_workers -- optionally specify the number of worker processes, the default is the number of cores
+    chunksize -- optionally specify the number of points that are sent to a worker at once
+    kwargs -- the wrt, seed_dict and mode arguments of evaluate are supported
+    """
+    if not isinstance(node, Node):
+        raise ValueError('Please specify a node to evaluate')
+    if not isinstance(points, list) or not all(isinstance(point, dict) for point in points):
+        raise ValueError('Please specify a list of dictionaries with the values of the variables')
+    if not set(kwargs.keys()) <= {'wrt', 'seed_dict', 'mode'}:
+        raise ValueError('Only the wrt, seed_dict and mode arguments are supported')
+    if len(points) == 0:
+        return []
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if chunksize is None:
+        # a few chunks per worker balance the load without sending too many messages
+        chunksize = max(1, -(-len(points) // (max_workers * 4)))
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(Node.to_records(node),)) as executor:
+        chunks = [points[i:i + chunksize] for i in range(0, len(points), chunksize)]
+        results = []
+        for chunk_results in executor.map(_evaluate_points, chunks, [kwargs] * len(chunks)):
+            results.extend(chunk_results)
     return results
+
+
+# this function compiles a graph into a flat tape
+def compile_graph(node, wrt=None, seed_dict=None, incremental=False, optimize=False, cache=False, cache_dir=None):
+    """This function compiles a computation graph into a CompiledFunction.  The graph is
+    traversed and linearized once, and the compiled function can then be called many
+    times with only the values of the variables, for example compile_graph(f)(x=1.0).  This avoids
+    the cost of validating the arguments and traversing the graph on every evaluation.
+
+    arguments:
+    node -- the root node of the graph to compile
+    wrt -- a list of variables to compute the derivatives for.  By default, the derivatives
+           for all variables are computed.
+    seed_dict -- for more advanced usage, optionally specify a seed dictionary to use
+    incremental -- if True, the compiled function caches the values and derivatives of
+                   every node, and only recomputes the nodes that depend on the variables
+                   that changed since the last call.  This is useful when only a few of
+                   many variables change between calls.
+    optimize -- if True, the graph is simplified with simplify before it is compiled
+    cache -- if True, the compiled function is stored in an on-disk cache, keyed by the
+             structural hash of the graph and the other arguments.  If the same graph was
+             already compiled, for example by an earlier run of the program, the compiled
+             function is loaded from the cache instead of simplifying and compiling the graph.
+             Entries that were compiled with a different version of an operation are rebuilt,
+             and the least recently used entries are removed once the cache is larger than
+             cache_max_bytes.
+    cache_dir -- the directory of the cache, by default ~/.cache/autodiff
+    """
+    if not cache or not isinstance(node, Node):
+        if optimize and isinstance(node, Node):
+            node = simplify(node)
+        return CompiledFunction(node, wrt=wrt, seed_dict=seed_dict, incremental=incremental)
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir
+    path = os.path.join(cache_dir, get_cache_key(node, wrt, seed_dict, incremental, optimize) + '.npz')
+    compiled = load_cached(path)
+    if compiled is None:
+        if optimize:
+            node = simplify(node)
+        compiled = CompiledFunction(node, wrt=wrt, seed_dict=seed_dict, incremental=incremental)
+        os.makedirs(cache_dir, exist_ok=True)
+        compiled.save(path)
+        evict_cache(cache_dir, cache_max_bytes)
+    return compiled
+
+
+# the short name shadows the builtin, so it is not exported by import *, see __all__
+compile = compile_graph
+
+
+# this function computes the key of a compiled function in the on-disk cache
+def get_cache_key(node, wrt, seed_dict, incremental, optimize):
+    """This function returns the name of the cache entry of a graph compiled with the given
+    arguments of compile_graph.
+
+    arguments:
+    node -- the root node of the graph
+    wrt -- the wrt argument of compile_graph
+    seed_dict -- the seed_dict argument of compile_graph
+    incremental -- the incremental argument of compile_graph
+    optimize -- the optimize argument of compile_graph
+    """
+    if wrt is not None:
+        wrt = tuple(wrt) if isinstance(wrt, list) else wrt
+    if seed_dict is not None:
+        if not isinstance(seed_dict, dict):
+            raise ValueError('Please specify a dictionary for the seed_dict argument')
+        seed_dict = sorted((key, type(seed).__name__, repr(seed)) for key, seed in seed_dict.items())
+    options = (cache_format_version, wrt, seed_dict, bool(incremental), bool(optimize))
+    return hashlib.sha256((structural_hash(node) + repr(options)).encode()).hexdigest()
+
+
+# this function loads a compiled function from the on-disk cache
+def load_cached(path):
+    """This function loads a compiled function from the on-disk cache.  None is returned if
+    there is no entry.  Entries that can't be read or that are stale, because they were
+    written in a different format or with a different version of an operation, are removed
+    and None is returned.  The modification time of the entry is updated, so that the least
+    recently used entries are evicted first.
+
+    arguments:
+    path -- the path of the cache entry
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        compiled = CompiledFunction.load(path)
+    except (ValueError, KeyError, OSError, zipfile.BadZipFile):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    # the entry may have been evicted by another process in the meantime
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return compiled
+
+
+# this function removes the least recently used entries of the on-disk cache
+def evict_cache(cache_dir, max_bytes):
+    """This function removes the least recently used entries of the cache until the total
+    size of the entries is at most max_bytes.
+
+    arguments:
+    cache_dir -- the directory of the cache
+    max_bytes -- the maximum size of the cache in bytes
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.npz'):
+            path = os.path.join(cache_dir, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+
+    total = np.sum([size for _, size, _ in entries])
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+# the kinds of nodes in the array format of a graph
+STORED_VAR = Node.VAR
+STORED_CONST = Node.CONST
+STORED_OP = 2
+STORED_REDUCTION = 3
+
+
+# this function saves a graph in a compact array format
+def save(node, path):
+    """This function saves a graph to a .npz file in the array format of StoredGraph.  The
+    operations are stored by name, so they must be registered when the graph is loaded,
+    see register_operation.
+
+    arguments:
+    node -- the root node of the graph
+    path -- the path of the file
+    """
+    StoredGraph.from_node(node).save(path)
+
+
+# this function loads a graph that was saved with save
+def load(path):
+    """This function loads a graph that was saved with save, and returns it as a StoredGraph.
+    The arrays are read, but no nodes are created until they are needed, see StoredGraph.
+    A ValueError is raised if an operation of the graph isn't registered, or if its code has
+    changed since the graph was saved.
+
+    arguments:
+    path -- the path of the file
+    """
+    with np.load(path, allow_pickle=False) as arrays:
+        return StoredGraph({key: arrays[key] for key in arrays.files})
+
+
+# this class holds a graph as a structure of arrays
+class StoredGraph:
+    """This class holds a graph as a few flat arrays with one entry per unique node, in
+    topological order, instead of one object per node: the kind of each node, the index
+    of its operation in a table of operation names, the index of its function or variable
+    name in a table of strings, and the indices of its children.  For constants, the left
+    entry is the position of the value in the array of constants, and for reductions, the
+    left and right entries are the position and the number of the operands in the array of
+    operands.  This takes a small fraction of the memory of the nodes.
+
+    Graphs are created with from_node or load.  The nodes of the graph are only created when
+    they are needed, for example when the root node is accessed with the root attribute,
+    and view returns lightweight handles that read the arrays directly.  The graph can
+    also be compiled directly from the arrays with compile, without creating any nodes.
+    """
+
+    def __init__(self, arrays):
+        """This is the constructor of our StoredGraph class.  Use from_node or load to create graphs.
+
+        arguments:
+        arrays -- the dictionary of arrays created by to_arrays
+        """
+        if int(arrays['format']) != cache_format_version:
+            raise ValueError('The graph was saved with a different format')
+        self.ops = [str(op) for op in arrays['ops']]
+        for op, fingerprint in zip(self.ops, arrays['fingerprints']):
+            if op not in operations:
+                raise ValueError(f'Unknown operation: {op}')
+            if get_operation_fingerprint(op) != fingerprint:
+                raise ValueError(f'The operation {op} has changed since the graph was saved')
+        self.strings = [str(string) for string in arrays['strings']]
+        self.kinds = arrays['kinds']
+        self.op_indices = arrays['op_indices']
+        self.name_indices = arrays['name_indices']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.operands = arrays['operands']
+        self.constants = arrays['constants']
+        self.constant_is_int = arrays['constant_is_int']
+        self.variables = {self.strings[i] for i in self.name_indices[self.kinds == STORED_VAR]}
+        self.nodes = [None] * len(self.kinds)
+
+    # this function converts a graph of nodes to the array format
+    @staticmethod
+    def from_node(node):
+        """This function returns the StoredGraph of the graph below the given node.  The
+        nodes aren't referenced by the StoredGraph, so they can be freed afterwards.
+
+        arguments:
+        node -- the root node of the graph
+        """
+        if not isinstance(node, Node):
+            raise ValueError('Please specify a node to store')
+
+        order = Node.topological_order(node)
+        index = Node.get_index(order)
+        kinds = np.zeros(len(order), dtype=np.int8)
+        op_indices = np.full(len(order), -1, dtype=np.int32)
+        name_indices = np.full(len(order), -1, dtype=np.int32)
+        left = np.full(len(order), -1, dtype=np.int64)
+        right = np.full(len(order), -1, dtype=np.int64)
+        ops = {}
+        strings = {}
+        operands = []
+        constants = []
+        constant_is_int = []
+        for i, item in enumerate(order):
+            if item.type == Node.VAR:
+                kinds[i] = STORED_VAR
+                name_indices[i] = strings.setdefault(item.var_name, len(strings))
+            elif item.type == Node.CONST:
+                if not (isinstance(item.value, (int, float, np.integer, np.floating))):
+                    raise ValueError('Only graphs with numeric constants can be stored')
+                kinds[i] = STORED_CONST
+                left[i] = len(constants)
+                constants.append(float(item.value))
+                constant_is_int.append(isinstance(item.value, (int, np.integer)))
+            else:
+                if item.op is None:
+                    raise ValueError(f'The function {item.function_name} is not a registered operation')
+                op_indices[i] = ops.setdefault(item.op, len(ops))
+                name_indices[i] = strings.setdefault(item.function_name, len(strings))
+                if item.operands is not None:
+                    kinds[i] = STORED_REDUCTION
+                    left[i] = len(operands)
+                    right[i] = len(item.operands)
+                    operands.extend(index[id(operand)] for operand in item.operands)
+                else:
+                    kinds[i] = STORED_OP
+                    left[i] = index[id(item.left)]
+                    if item.right is not None:
+                        right[i] = index[id(item.right)]
+
+        return StoredGraph({'format': np.array(cache_format_version),
+                            'ops': np.array(list(ops), dtype=str),
+                            'fingerprints': np.array([get_operation_fingerprint(op) for op in ops], dtype=str),
+                            'strings': np.array(list(strings), dtype=str),
+                            'kinds': kinds, 'op_indices': op_indices, 'name_indices': name_indices,
+                            'left': left, 'right': right,
+                            'operands': np.array(operands, dtype=np.int64),
+                            'constants': np.array(constants, dtype=float),
+                            'constant_is_int': np.array(constant_is_int, dtype=bool)})
+
+    # this function returns the arrays of the graph
+    def to_arrays(self):
+        """This function returns the dictionary of arrays that describes the graph, which can
+        be saved with np.savez and turned back into a StoredGraph with its constructor.
+        """
+        return {'format': np.array(cache_format_version),
+                'ops': np.array(self.ops, dtype=str),
+                'fingerprints': np.array([get_operation_fingerprint(op) for op in self.ops], dtype=str),
+                'strings': np.array(self.strings, dtype=str),
+                'kinds': self.kinds, 'op_indices': self.op_indices, 'name_indices': self.name_indices,
+                'left': self.left, 'right': self.right,
+                'operands': self.operands,
+                'constants': self.constants,
+                'constant_is_int': self.constant_is_int}
+
+    # this function saves the graph to a file
+    def save(self, path):
+        """This function saves the graph to a .npz file.  The file is written under a temporary
+        name first, like CompiledFunction.save.
+
+        arguments:
+        path -- the path of the file
+        """
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as file:
+            np.savez(file, **self.to_arrays())
+        os.replace(temporary_path, path)
+
+    # the memory used by the arrays
+    @property
+    def nbytes(self):
+        """This is the number of bytes used by the arrays of the graph."""
+        return (self.kinds.nbytes + self.op_indices.nbytes + self.name_indices.nbytes + self.left.nbytes +
+                self.right.nbytes + self.operands.nbytes + self.constants.nbytes + self.constant_is_int.nbytes)
+
+    def __len__(self):
+        """This function returns the number of unique nodes of the graph."""
+        return len(self.kinds)
+
+    # the root node is created the first time it is accessed
+    @property
+    def root(self):
+        """This is the root node of the graph, which is the last node in topological order."""
+        return self.node(len(self) - 1)
+
+    # this function returns the children of a node in the saved format
+    def get_children(self, i):
+        """This function returns the indices of the children of the node with the given index.
+
+        arguments:
+        i -- the index of the node
+        """
+        kind = self.kinds[i]
+        if kind == STORED_REDUCTION:
+            return self.operands[self.left[i]:self.left[i] + self.right[i]].tolist()
+        elif kind == STORED_OP:
+            return [int(child) for child in (self.left[i], self.right[i]) if child >= 0]
+        return []
+
+    # this function creates the node with the given index
+    def node(self, i):
+        """This function returns the node with the given index in topological order, creating
+        it and the nodes below it that haven't been created yet.
+
+        arguments:
+        i -- the index of the node
+        """
+        # we use an explicit stack so that deep graphs don't hit the recursion limit
+        stack = [(i, False)]
+        while stack:
+            j, expanded = stack.pop()
+            if self.nodes[j] is not None:
+                continue
+            children = self.get_children(j)
+            if not expanded:
+                stack.append((j, True))
+                stack.extend((child, False) for child in children if self.nodes[child] is None)
+                continue
+
+            kind = self.kinds[j]
+            if kind == STORED_VAR:
+                new_node = Node.intern(Node(var_name=self.strings[self.name_indices[j]]))
+            elif kind == STORED_CONST:
+                value = self.constants[self.left[j]]
+                value = int(value) if self.constant_is_int[self.left[j]] else float(value)
+                new_node = Node.to_node(value)
+            else:
+                op = self.ops[self.op_indices[j]]
+                function_name = self.strings[self.name_indices[j]]
+                children = [self.nodes[child] for child in children]
+                if kind == STORED_REDUCTION:
+                    new_node = Node.create_reduction(op, function_name, children)
+                else:
+                    new_node = Node.create(op, function_name, *children)
+            self.nodes[j] = new_node
+        return self.nodes[i]
+
+    # this function returns a handle of a node that reads the arrays
+    def view(self, i=None):
+        """This function returns a StoredNode handle of the node with the given index in
+        topological order, which reads the arrays instead of creating the node.
+
+        arguments:
+        i -- the index of the node.  By default, the handle of the root node is returned.
+        """
+        if i is None:
+            i = len(self) - 1
+        if not -len(self) <= i < len(self):
+            raise ValueError(f'The graph has no node with index {i}')
+        return StoredNode(self, i % len(self))
+
+    # this function evaluates the graph
+    def evaluate(self, **kwargs):
+        """This function evaluates the graph, see Node.evaluate."""
+        return self.root.evaluate(**kwargs)
+
+    # this function compiles the graph directly from the arrays
+    def compile(self, wrt=None, seed_dict=None, incremental=False):
+        """This function compiles the graph into a CompiledFunction without creating any nodes.
+        The arguments are the same as for the compile_graph function.
+
+        arguments:
+        wrt -- a list of variables to compute the derivatives for.  By default, the derivatives
+               for all variables are computed.
+        seed_dict -- for more advanced usage, optionally specify a seed dictionary to use
+        incremental -- if True, only recompute the nodes that depend on the variables that
+                       changed since the last call
+        """
+        if wrt is None:
+            wrt = sorted(self.variables)
+        else:
+            wrt = Node.parse_wrt(wrt, self.variables)
+        if seed_dict is not None and not isinstance(seed_dict, dict):
+            raise ValueError('Please specify a dictionary for the seed_dict argument')
+
+        var_slots = np.flatnonzero(self.kinds == STORED_VAR)
+        var_names = [self.strings[i] for i in self.name_indices[var_slots]]
+        var_tangents = np.zeros((len(var_slots), len(wrt)))
+        for row, name in enumerate(var_names):
+            if name in wrt:
+                seed = 1
+                if seed_dict and name in seed_dict:
+                    seed = seed_dict[name]
+                    if not (isinstance(seed, int) or isinstance(seed, float)):
+                        raise ValueError('Invalid type passed into the seed dictionary.')
+                var_tangents[row, wrt.index(name)] = seed
+
+        values = np.zeros(len(self))
+        const_slots = np.flatnonzero(self.kinds == STORED_CONST)
+        values[const_slots] = self.constants[self.left[const_slots]]
+
+        # a node is active if any of its children is active
+        active = np.zeros(len(self), dtype=bool)
+        active[var_slots] = [name in wrt for name in var_names]
+        op_slots = np.flatnonzero(self.kinds >= STORED_OP)
+        tape = np.zeros((len(op_slots), 6), dtype=np.int64)
+        opcode_names = {}
+        for row, slot in zip(tape, op_slots.tolist()):
+            children = self.get_children(slot)
+            active[slot] = active[children].any()
+            opcode = self.op_indices[slot]
+            opcode_names.setdefault(opcode, self.strings[self.name_indices[slot]])
+            if self.kinds[slot] == STORED_REDUCTION:
+                row[:] = (opcode, slot, self.left[slot], -2, active[slot], self.right[slot])
+            else:
+                row[:] = (opcode, slot, self.left[slot], self.right[slot], active[slot], 0)
+
+        arrays = {'format': np.array(cache_format_version),
+                  'ops': np.array(self.ops, dtype=str),
+                  'fingerprints': np.array([get_operation_fingerprint(op) for op in self.ops], dtype=str),
+                  'function_names': np.array([opcode_names.get(opcode, op) for opcode, op in enumerate(self.ops)],
+                                             dtype=str),
+                  'tape': tape,
+                  'operands': self.operands,
+                  'values': values,
+                  'var_slots': var_slots,
+                  'var_names': np.array(var_names, dtype=str),
+                  'var_tangents': var_tangents,
+                  'variables': np.array(sorted(self.variables), dtype=str),
+                  'wrt': np.array(wrt, dtype=str),
+                  'root_slot': np.array(len(self) - 1),
+                  'incremental': np.array(incremental)}
+        return CompiledFunction.from_arrays(arrays)
+
+
+# this class is a handle of a node in a StoredGraph
+class StoredNode:
+    """This class is a lightweight handle of a node in a StoredGraph.  It only holds the graph
+    and the index of the node, and reads the attributes of the node from the arrays of the
+    graph, so any number of handles can be created without creating nodes.  The attributes
+    have the same names as those of Node.
+    """
+    __slots__ = ('graph', 'index')
+
+    def __init__(self, graph, index):
+        """This is the constructor of our StoredNode class.  Use StoredGraph.view to create handles.
+
+        arguments:
+        graph -- the StoredGraph
+        index -- the index of the node in topological order
+        """
+        self.graph = graph
+        self.index = index
+
+    def __eq__(self, other):
+        """This function checks whether two handles refer to the same node of the same graph."""
+        return isinstance(other, StoredNode) and self.graph is other.graph and self.index == other.index
+
+    def __hash__(self):
+        """This function returns a hash that is consistent with __eq__."""
+        return hash((id(self.graph), self.index))
+
+    def __repr__(self):
+        """This function returns a string representation of the handle."""
+        return f'StoredNode(index={self.index}, type={Node.type_names[self.type]})'
+
+    # the type of the node, which is one of Node.VAR, Node.CONST and Node.INTER
+    @property
+    def type(self):
+        """This is the type of the node: Node.VAR, Node.CONST or Node.INTER."""
+        return min(int(self.graph.kinds[self.index]), Node.INTER)
+
+    @property
+    def var_name(self):
+        """This is the name of the variable, or None if the node isn't a variable."""
+        if self.graph.kinds[self.index] != STORED_VAR:
+            return None
+        return self.graph.strings[self.graph.name_indices[self.index]]
+
+    @property
+    def value(self):
+        """This is the value of the constant, or None if the node isn't a constant."""
+        graph = self.graph
+        if graph.kinds[self.index] != STORED_CONST:
+            return None
+        position = graph.left[self.index]
+        return int(graph.constants[position]) if graph.constant_is_int[position] else float(graph.constants[position])
+
+    @property
+    def op(self):
+        """This is the name of the registered operation, or None for variables and constants."""
+        if self.graph.kinds[self.index] < STORED_OP:
+            return None
+        return self.graph.ops[self.graph.op_indices[self.index]]
+
+    @property
+    def function_name(self):
+        """This is the name of the function used for rendering, or None for variables and constants."""
+        if self.graph.kinds[self.index] < STORED_OP:
+            return None
+        return self.graph.strings[self.graph.name_indices[self.index]]
+
+    @property
+    def left(self):
+        """This is the handle of the left child, or None."""
+        if self.graph.kinds[self.index] != STORED_OP:
+            return None
+        return StoredNode(self.graph, int(self.graph.left[self.index]))
+
+    @property
+    def right(self):
+        """This is the handle of the right child, or None."""
+        if self.graph.kinds[self.index] != STORED_OP or self.graph.right[self.index] < 0:
+            return None
+        return StoredNode(self.graph, int(self.graph.right[self.index]))
+
+    @property
+    def operands(self):
+        """This is the list of handles of the operands of a reduction, or None."""
+        if self.graph.kinds[self.index] != STORED_REDUCTION:
+            return None
+        return [StoredNode(self.graph, child) for child in self.graph.get_children(self.index)]
+
+    # this function creates the node that the handle refers to
+    def node(self):
+        """This function returns the node that the handle refers to, creating it if needed."""
+        return self.graph.node(self.index)
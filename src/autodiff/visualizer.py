@@ -9,10 +9,56 @@ import sys
 import numpy as np
 
 
+class NodeLayout:
+    """This class holds the rendering information of a node: its depth and order, its label,
+    its position in the plot, and the value and derivative that are shown for it.  This is
+    kept out of the nodes themselves, so nodes stay small and rendering never writes to
+    the graph.
+    """
+    __slots__ = ('depth', 'order', 'label', 'plot_x', 'plot_y', 'value', 'deriv')
+
+    def __init__(self, value=None):
+        """This is the constructor of our NodeLayout class.
+
+        arguments:
+        value -- the value shown for the node, which is only known up front for constants
+        """
+        self.depth = 0
+        self.order = 0
+        self.label = None
+        self.plot_x = 0
+        self.plot_y = 0
+        self.value = value
+        self.deriv = None
+
+
+def get_order(root):
+    """This function returns the unique nodes of the graph in postorder, so that every
+    node appears after its children.  All of the rendering functions below iterate over
+    this order instead of recursing through the graph, so deep graphs don't hit the
+    recursion limit and shared nodes are only rendered once.
+
+    arguments:
+    root -- the root of our graph
+    """
+    return type(root).topological_order(root)
+
+
+def get_children(node):
+    """This function returns the children of a node.  For n-ary reduction nodes these
+    are all of the operands.
+
+    arguments:
+    node -- the node to get the children of
+    """
+    return type(node).get_children(node)
+
+
 def render_first_frame(root):
     """This function renders the first frame of our animation.  For the first frame, the node depths and
         positions for plotting in the binary tree are calculated, we create a matplotlib figure for animation,
-        and prepare for future frames.  The node depths and positions are stored in each node object.
+        and prepare for future frames.  The node depths and positions are stored in a layout dictionary
+        that maps the id of each node to its NodeLayout, which is returned with the figure.
 
        arguments:
        root -- the root of our binary tree
@@ -21,8 +67,9 @@ def render_first_frame(root):
     print('rendering forward computation graph')
 
     depth_counts = []
-    get_depths_order_and_labels(root, depth_counts)
-    get_node_positions(root, depth_counts, np.max(depth_counts))
+    layout = {}
+    get_depths_order_and_labels(root, depth_counts, layout)
+    get_node_positions(root, depth_counts, np.max(depth_counts), layout)
 
     num_nodes = np.sum(depth_counts)
     print(f'with {num_nodes} nodes')
@@ -31,16 +78,16 @@ def render_first_frame(root):
     fig, font_size = prepare_plot(depth_counts)
     plt.cla()
     render_grid(depth_counts)
-    render_edges(root, font_size=font_size)
-    render_points(root, font_size=font_size)
-    render_values(root, font_size=font_size)
+    render_edges(root, layout, font_size=font_size)
+    render_points(root, layout, font_size=font_size)
+    render_values(root, layout, font_size=font_size)
     fig.canvas.draw()
     image = np.frombuffer(fig.canvas.tostring_rgb(), dtype='uint8')
     image = image.reshape(1000, 1000, 3)
-    return image, fig, font_size, depth_counts
+    return image, fig, font_size, depth_counts, layout
 
 
-def frame(root, fig, font_size, depth_counts, visit):
+def frame(root, fig, font_size, depth_counts, layout, visit, wrt):
     """This function renders a frame of our animation based on the given binary tree, the current
        visit node, the figure generated in prepare_plot, the depth_counts, the current visit node
        and the node positions that were cxalculated.
@@ -50,8 +97,10 @@ def frame(root, fig, font_size, depth_counts, visit):
        fig -- a matplotlib figure object
        font_size -- the font size to use for this frame.  This is used to render the edges, values, and nodes
        depth_counts -- a list containing the number of nodes at each depth
+       layout -- the dictionary of NodeLayouts created by render_first_frame
        visit -- The current node to render the legend values for.  The value and all
-       relevant derivatives are taken from the node attributes.
+       relevant derivatives are taken from its layout.
+       wrt -- the list of variables that the derivatives are computed for
        """
 
     images = []
@@ -59,11 +108,11 @@ def frame(root, fig, font_size, depth_counts, visit):
     sys.stdout.flush()
     for inner_frame in np.linspace(0, 1, 4):
         plt.cla()
-        render_grid(depth_counts, visit)
-        render_edges(root, font_size=font_size, visit=visit, inner_frame=inner_frame)
-        render_points(root, font_size=font_size, visit=visit)
-        render_values(root, font_size=font_size, visit=visit, inner_frame=inner_frame)
-        render_legend(visit)
+        render_grid(depth_counts, layout[id(visit)])
+        render_edges(root, layout, font_size=font_size, visit=visit, inner_frame=inner_frame)
+        render_points(root, layout, font_size=font_size, visit=visit)
+        render_values(root, layout, font_size=font_size, visit=visit, inner_frame=inner_frame)
+        render_legend(layout[id(visit)], wrt)
         fig.canvas.draw()
         image = np.frombuffer(fig.canvas.tostring_rgb(), dtype='uint8')
         image = image.reshape(1000, 1000, 3)
@@ -71,17 +120,20 @@ def frame(root, fig, font_size, depth_counts, visit):
     return images
 
 
-def render_legend(visit):
+def render_legend(visit, wrt):
     """This function renders a legend showing the current value and derivatives at the given
       'visit' node.  As the binary tree traversal occurs, the value and the derivatives are updated
       to show the current values.
 
        arguments:
-       visit -- The current node to render the legend values for.  The value and all
-       relevant derivatives are taken from the node attributes.
+       visit -- The layout of the current node to render the legend values for.  The value and all
+       relevant derivatives are taken from it.
+       wrt -- the list of variables that the derivatives are computed for.  These
+       correspond to the lanes of the tangent vector of the node.
        """
-    if visit.deriv:
-        legend_entries = [f'df/d{key} = {value:.3f}' for key, value in visit.deriv.items()]
+    if wrt:
+        derivatives = list(np.broadcast_to(visit.deriv, (len(wrt),)))
+        legend_entries = [f'df/d{key} = {value:.3f}' for key, value in zip(wrt, derivatives)]
         legend_entries.append(f'value: {visit.value:0.3f}')
         legend = plt.legend(legend_entries, loc=0, frameon=True)
         frame = legend.get_frame()
@@ -93,7 +145,7 @@ def render_legend(visit):
             else:
                 text.set_color("pink")
 
-        values_to_display = list(visit.deriv.values())
+        values_to_display = derivatives
         values_to_display.append(visit.value)
         for handle, value in zip(legend.legendHandles, values_to_display):
 
@@ -103,7 +155,7 @@ def render_legend(visit):
                 handle.set_color('lightblue')
 
 
-def get_depths_order_and_labels(root, counts):
+def get_depths_order_and_labels(root, counts, layout):
     """This function assigns a depth to each node based on how many unary or
     binary operations it takes to get to it from variables or constants.  This
     also assigns an order to the node, for the time that it appears at a certain
@@ -113,33 +165,33 @@ def get_depths_order_and_labels(root, counts):
     arguments:
     root -- the root node to start from
     count -- a list of integers for the count of nodes at each depth
+    layout -- the dictionary that the NodeLayouts are added to
     """
-    if root:
-        get_depths_order_and_labels(root.left, counts)
-        get_depths_order_and_labels(root.right, counts)
-        if not root.left and not root.right:
-            root.depth = 0
-        elif not root.right:
-            root.depth = root.left.depth + 1
+    for node in get_order(root):
+        children = get_children(node)
+        is_const = node.type == type(node).CONST
+        item = layout[id(node)] = NodeLayout(node.value if is_const else None)
+        if not children:
+            item.depth = 0
         else:
-            root.depth = max(root.left.depth, root.right.depth) + 1
+            item.depth = max(layout[id(child)].depth for child in children) + 1
 
-        if len(counts) <= root.depth:
+        if len(counts) <= item.depth:
             counts.append(1)
         else:
-            counts[root.depth] += 1
+            counts[item.depth] += 1
 
-        root.order = counts[root.depth] - 1
-        if root.depth > 0:
-            root.label = f'$V_{{{root.depth},{root.order + 1}}}$'
+        item.order = counts[item.depth] - 1
+        if item.depth > 0:
+            item.label = f'$V_{{{item.depth},{item.order + 1}}}$'
         else:
-            if root.type == 'const':
-                root.label = root.value
+            if is_const:
+                item.label = node.value
             else:
-                root.label = root.var_name
+                item.label = node.var_name
 
 
-def get_node_positions(root, counts, max_count):
+def get_node_positions(root, counts, max_count, layout):
     """This function computes node positions given the calculated
     depths and order information.  We create a custom node position
     based on a partial ordering that is computed from the maximum
@@ -151,142 +203,122 @@ def get_node_positions(root, counts, max_count):
     max_count -- the maximum count of nodes in any depth.  This is used to determine
     the ideal positions of the nodes within each depth.  We attempt to scatter the nodes
     so that they don't get in the way of edges.
+    layout -- the dictionary of NodeLayouts
     """
 
-    if root:
-        get_node_positions(root.left, counts, max_count)
-        get_node_positions(root.right, counts, max_count)
-
-        max_order = counts[root.depth]
+    for node in get_order(root):
+        item = layout[id(node)]
+        max_order = counts[item.depth]
         y_min = (max_count - max_order) / 2.0
 
-        root.plot_x = root.depth
-        root.plot_y = root.order + y_min
+        item.plot_x = item.depth
+        item.plot_y = item.order + y_min
 
 
-def render_edges(root, font_size=16, visit=None, inner_frame=1.0):
+def render_edges(root, layout, font_size=16, visit=None, inner_frame=1.0):
     """This function renders the edges of the nodes in our graph.  These are animated
     based on the current node 'visit' and the inner frame from 0 to 1 to show movement
     along the graph.
 
       arguments:
       root -- the root node to start rendering the binary tree from
+      layout -- the dictionary of NodeLayouts
       font_size -- the font size to use for the render.  More complex functions require smaller
                    font sizes for the labeled functions.
       visit -- the currently visited node.  This the child edges attached to this node are
                highlighted and animated based on the inner frame value
       inner_frame -- a value from 0 to 1 used for animating the edges
     """
-    if root:
-        render_edges(root.left, font_size=font_size, visit=visit, inner_frame=inner_frame)
-        render_edges(root.right, font_size=font_size, visit=visit, inner_frame=inner_frame)
-
-        if root == visit:
+    for node in get_order(root):
+        item = layout[id(node)]
+        if node is visit:
             lfont_size = font_size + 2
         else:
             lfont_size = font_size
 
-        if root.value:
+        if item.value:
             edge_color = 'pink'
             edge_weight = 3
         else:
             edge_color = 'w'
             edge_weight = 1
 
-        if root.left:
-            plt.plot((root.plot_x, root.left.plot_x),
-                     (root.plot_y, root.left.plot_y), zorder=-1, c=edge_color, lw=edge_weight)
+        for child in get_children(node):
+            child_item = layout[id(child)]
+            plt.plot((item.plot_x, child_item.plot_x),
+                     (item.plot_y, child_item.plot_y), zorder=-1, c=edge_color, lw=edge_weight)
 
-            if root == visit:
-                plt.plot((root.left.plot_x * (1 - inner_frame) + root.plot_x * (inner_frame), root.left.plot_x),
-                         (root.left.plot_y * (1 - inner_frame) + root.plot_y * (inner_frame), root.left.plot_y),
+            if node is visit:
+                plt.plot((child_item.plot_x * (1 - inner_frame) + item.plot_x * (inner_frame), child_item.plot_x),
+                         (child_item.plot_y * (1 - inner_frame) + item.plot_y * (inner_frame), child_item.plot_y),
                          zorder=-0.5, c='yellow', lw=6)
 
-            if root.function:
+            if node.function:
                 # add a label
-                label_x = .6 * root.plot_x + .4 * root.left.plot_x
-                label_y = .6 * root.plot_y + .4 * root.left.plot_y
-                plt.text(label_x, label_y, root.function_name, fontdict={'size': lfont_size, 'color': 'green'},
+                label_x = .6 * item.plot_x + .4 * child_item.plot_x
+                label_y = .6 * item.plot_y + .4 * child_item.plot_y
+                plt.text(label_x, label_y, node.function_name, fontdict={'size': lfont_size, 'color': 'green'},
                          bbox={'facecolor': 'black', 'alpha': 0.9, 'edgecolor': 'gray', 'pad': 1},
                          ha='center', va='center')
 
-        if root.right:
-            plt.plot((root.plot_x, root.right.plot_x),
-                     (root.plot_y, root.right.plot_y), zorder=-1, c=edge_color, lw=edge_weight)
-
-            if root == visit:
-                plt.plot((root.right.plot_x * (1 - inner_frame) + root.plot_x * (inner_frame), root.right.plot_x),
-                         (root.right.plot_y * (1 - inner_frame) + root.plot_y * (inner_frame), root.right.plot_y),
-                         zorder=-0.5, c='yellow', lw=6)
 
-            if root.function:
-                # add a label
-                label_x = .6 * root.plot_x + .4 * root.right.plot_x
-                label_y = .6 * root.plot_y + .4 * root.right.plot_y
-                plt.text(label_x, label_y, root.function_name, fontdict={'size': lfont_size, 'color': 'green'},
-                         bbox={'facecolor': 'black', 'alpha': 0.9, 'edgecolor': 'gray', 'pad': 1},
-                         ha='center', va='center')
-
-
-def render_values(root, font_size=16, visit=None, inner_frame=1.0):
+def render_values(root, layout, font_size=16, visit=None, inner_frame=1.0):
     """This function renders the values of the nodes if they exist.
 
     arguments:
     root -- the root node to start from
+    layout -- the dictionary of NodeLayouts
     font_size -- the font size to render the values with.  Larger functions need to use a smaller font.
     visit -- the current node to highlight
     inner_frame -- the sub frame of the animation used to render highlighted lines.  The value will only
                     displayed when the inner frame is close to 1.
     """
-    if root:
-        render_values(root.left, font_size=font_size, visit=visit, inner_frame=inner_frame)
-        render_values(root.right, font_size=font_size, visit=visit, inner_frame=inner_frame)
-
-        if root.value:
-            if not (visit == root and inner_frame < 0.95):
-                if isinstance(root.value, int):
-                    text = f'={root.value}'
+    for node in get_order(root):
+        item = layout[id(node)]
+        if item.value:
+            if not (visit is node and inner_frame < 0.95):
+                if isinstance(item.value, int):
+                    text = f'={item.value}'
                 else:
-                    text = f'={root.value:.3f}'
+                    text = f'={item.value:.3f}'
 
-                plt.text(root.plot_x + .2, root.plot_y - .2, text, fontdict={'size': font_size, 'color': 'yellow'},
+                plt.text(item.plot_x + .2, item.plot_y - .2, text, fontdict={'size': font_size, 'color': 'yellow'},
                          bbox={'facecolor': 'black', 'alpha': 0.7, 'edgecolor': 'white', 'pad': 1},
                          ha='center', va='center')
 
 
-def render_points(root, font_size=16, visit=None):
+def render_points(root, layout, font_size=16, visit=None):
     """This function renders the nodes at their calculated positions based on their
     type.
 
     arguments:
     root -- the root node to start from
+    layout -- the dictionary of NodeLayouts
     font_size -- optionally specify the font size to use. For larger functions, we want
                  to use a smaller font size
     visit -- the current node that we are visiting.  This node will be highlighted.
     """
-    if root:
-        render_points(root.left, font_size=font_size, visit=visit)
-        render_points(root.right, font_size=font_size, visit=visit)
-
-        if root == visit:
+    for node in get_order(root):
+        item = layout[id(node)]
+        if node is visit:
             color = 'yellow'
-        if root.type == 'inter':
-            if root != visit:
+        if node.type == type(node).INTER:
+            if node is not visit:
                 color = 'blue'
-            shape = plt.Circle((root.plot_x, root.plot_y), radius=0.2,
+            shape = plt.Circle((item.plot_x, item.plot_y), radius=0.2,
                                fc=color, ec='lightblue', lw=1)
-        elif root.type == 'var':
-            if root != visit:
+        elif node.type == type(node).VAR:
+            if node is not visit:
                 color = 'darkred'
-            shape = plt.Rectangle((root.plot_x - .2, root.plot_y - .2),
+            shape = plt.Rectangle((item.plot_x - .2, item.plot_y - .2),
                                   .4, .4, fc=color, ec='pink', lw=1)
         else:
-            if root != visit:
+            if node is not visit:
                 color = 'purple'
-            shape = plt.Rectangle((root.plot_x - .2, root.plot_y - .2),
+            shape = plt.Rectangle((item.plot_x - .2, item.plot_y - .2),
                                   .4, .4, fc=color, ec='pink', lw=1)
         plt.gca().add_patch(shape)
-        plt.text(root.plot_x, root.plot_y, root.label, fontdict={'size': font_size, 'color': 'white'},
+        plt.text(item.plot_x, item.plot_y, item.label, fontdict={'size': font_size, 'color': 'white'},
                  bbox={'facecolor': 'black', 'alpha': 0.7, 'edgecolor': 'gray', 'pad': 1},
                  ha='center', va='center')
 
@@ -321,7 +353,7 @@ def render_grid(depth_counts, visit=None):
 
     arguments:
     depth_counts -- a list of the number of nodes per each depth
-    visit -- the current visited node used for grid highlighting
+    visit -- the layout of the current visited node used for grid highlighting
     """
 
     max_order = np.max(depth_counts)
@@ -1,5 +1,8 @@
 import pytest
 import math
+import pickle
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import os
 
@@ -118,8 +121,9 @@ def test_tan():
     # test the tangent function
     x = ad.var('x')
     f = ad.tan(x)
-    assert f.evaluate(x=1) == {'value': np.tan(1),
-                               'derivative': {'x': 1 / ((np.cos(1)) ** 2)}}, "Error: incorrect tangent function"
+    results = f.evaluate(x=1)
+    assert results['value'] == np.tan(1), "Error: incorrect tangent function"
+    assert np.isclose(results['derivative']['x'], 1 / ((np.cos(1)) ** 2)), "Error: incorrect tangent function"
 
 def test_arcsin():
     # test the tangent function
@@ -731,4 +735,1425 @@ def test_seed_vector_invalid_type_in_dict():
     y = ad.var('y')
     f = ad.cos(x) + ad.sin(y)
     with pytest.raises(ValueError):
-        f.evaluate(x=.1, y=.1, seed_dict={'x':'cat'})
\ No newline at end of file
+        f.evaluate(x=.1, y=.1, seed_dict={'x':'cat'})
+
+
+# the arguments of the calls of the value and of the derivative of counted
+value_calls = []
+derivative_calls = []
+
+# sin, recording its calls, to count how often the nodes of a graph are evaluated
+counted = ad.get_function('counted', lambda x: value_calls.append(x) or np.sin(x),
+                          lambda x, xp: derivative_calls.append(x) or xp * np.cos(x))
+
+# a function without a second derivative or a Taylor rule
+cube = ad.get_function('cube', lambda a: a ** 3, lambda a, ap: 3 * a ** 2 * ap)
+
+
+@pytest.fixture
+def calls():
+    """This fixture clears and returns the list of the arguments of the calls of the value of counted."""
+    del value_calls[:]
+    return value_calls
+
+
+@pytest.fixture
+def deriv_calls():
+    """This fixture clears and returns the list of the arguments of the calls of the derivative of counted."""
+    del derivative_calls[:]
+    return derivative_calls
+
+
+@pytest.fixture
+def flattening():
+    """This fixture collapses chained + and * operations into n-ary nodes during a test."""
+    ad.set_flatten_reductions(True)
+    yield
+    ad.set_flatten_reductions(False)
+
+
+@pytest.fixture
+def interning():
+    """This fixture interns the nodes that are created during a test."""
+    ad.set_interning(True)
+    yield
+    ad.set_interning(False)
+
+
+def test_shared_subexpressions():
+    # reused nodes should only be evaluated once per call, so deep reuse
+    # does not blow up exponentially
+    x = ad.var('x')
+    y = x
+    for i in range(60):
+        y = y * y
+    results = y.evaluate(x=1.0)
+    assert results['value'] == 1.0 and results['derivative']['x'] == 2.0 ** 60
+
+    # the graph has the variable and one node per multiplication
+    assert len(ad.Node.topological_order(y)) == 61
+    variables = set()
+    ad.Node.get_variables(y, variables)
+    assert variables == {'x'}
+
+
+def test_shared_function_nodes(calls):
+    # a shared function node is evaluated once per call
+    x = ad.var('x')
+    z = counted(x)
+    f = (z + z) * z
+    results = f.evaluate(x=2.0)
+    assert np.isclose(results['value'], 2 * np.sin(2.0) ** 2)
+    assert np.isclose(results['derivative']['x'], 4 * np.sin(2.0) * np.cos(2.0))
+    assert len(calls) == 1
+
+
+def test_evaluate_batch():
+    # evaluate a function and its gradient at many points in a single pass
+    x = ad.var('x')
+    y = ad.var('y')
+    f = ad.sin(x) * y ** 2 + ad.exp(x / y) - (x < y)
+    xs = np.linspace(0.1, 2.0, 50)
+    ys = np.linspace(1.0, 3.0, 50)
+    results = f.evaluate_batch(x=xs, y=ys)
+    assert results['value'].shape == (50,)
+    for i in [0, 17, 49]:
+        single = f.evaluate(x=float(xs[i]), y=float(ys[i]))
+        assert np.isclose(results['value'][i], single['value'])
+        assert np.isclose(results['derivative']['x'][i], single['derivative']['x'])
+        assert np.isclose(results['derivative']['y'][i], single['derivative']['y'])
+
+
+def test_evaluate_batch_broadcasting():
+    # scalars are broadcast against the arrays, and wrt is supported
+    x = ad.var('x')
+    y = ad.var('y')
+    results = (x ** y).evaluate_batch(x=2.0, y=[1.0, 2.0, 3.0], wrt=['y'])
+    assert np.allclose(results['value'], [2, 4, 8])
+    assert np.allclose(results['derivative']['y'], np.log(2) * np.array([2, 4, 8]))
+    assert list(results['derivative'].keys()) == ['y']
+
+    # constant derivatives are broadcast to the batch shape
+    results = (x + 3).evaluate_batch(x=np.zeros((2, 3)))
+    assert results['derivative']['x'].shape == (2, 3) and np.all(results['derivative']['x'] == 1)
+
+
+def test_evaluate_batch_invalid_arguments():
+    x = ad.var('x')
+    y = ad.var('y')
+    f = ad.sin(x) * y
+    xs = np.linspace(0.1, 2.0, 50)
+    with pytest.raises(ValueError):
+        f.evaluate_batch(x=xs, y=np.ones(3))
+    with pytest.raises(ValueError):
+        f.evaluate_batch(x=xs)
+    with pytest.raises(ValueError):
+        f.evaluate_batch(x=xs, y='cat')
+    with pytest.raises(ValueError):
+        ad.sqrt(x).evaluate_batch(x=[1.0, -1.0])
+
+
+def test_reverse_mode():
+    # the reverse mode should match the forward mode
+    x = ad.var('x')
+    y = ad.var('y')
+    z = ad.var('z')
+    functions = [ad.sin(x) * ad.cos(x ** 2) * ad.exp(7 * x) + y / z,
+                 x ** ad.tan(y) - 3 / z + (x < y),
+                 ad.log(x * y, 2) + ad.logistic(z) - ad.sqrt(x * x + y * y) ** z,
+                 -x * x - x + y * z]
+    for f in functions:
+        forward = f.evaluate(x=1.1, y=0.4, z=2.0)
+        reverse = f.evaluate(x=1.1, y=0.4, z=2.0, mode='reverse')
+        assert forward['value'] == reverse['value']
+        for key in ['x', 'y', 'z']:
+            assert np.isclose(forward['derivative'][key], reverse['derivative'][key])
+
+
+def test_reverse_mode_wrt_and_seed():
+    # wrt and seed_dict are supported
+    x = ad.var('x')
+    y = ad.var('y')
+    f = ad.cos(x) + ad.sin(y)
+    results = f.evaluate(x=.1, y=.1, wrt=[y], seed_dict={'y': 0.7}, mode='reverse')
+    assert list(results['derivative'].keys()) == ['y'] and np.isclose(results['derivative']['y'], 0.696503)
+
+    # a negative base is fine as long as we don't differentiate with respect to the exponent
+    results = (x ** y).evaluate(x=-2, y=2, wrt=[x], mode='reverse')
+    assert results['value'] == 4 and results['derivative']['x'] == -4
+
+
+def test_reverse_mode_batches_and_vectors():
+    # the reverse mode also works for batches and vector outputs
+    x = ad.var('x')
+    y = ad.var('y')
+    z = ad.var('z')
+    results = (x ** y).evaluate_batch(x=[1.0, 2.0], y=2, mode='reverse')
+    assert np.allclose(results['derivative']['x'], [2, 4]) and np.allclose(results['derivative']['y'],
+                                                                          [0, 4 * np.log(2)])
+    results = ad.evaluate([x * y, x + z], x=2, y=3, z=4, mode='reverse')
+    assert results[0]['derivative'] == {'x': 3, 'y': 2} and results[1]['derivative'] == {'x': 1, 'z': 1}
+
+
+def test_reverse_mode_invalid_arguments():
+    x = ad.var('x')
+    y = ad.var('y')
+    f = x ** y
+    with pytest.raises(ValueError):
+        f.evaluate(x=1, y=2, mode='sideways')
+    with pytest.raises(ValueError):
+        f.evaluate(x=1, y=2, mode='reverse', plot='reverse.gif')
+
+
+def test_compile():
+    # compiled functions should match the results of evaluate
+    x = ad.var('x')
+    y = ad.var('y')
+    functions = [ad.sin(x) * ad.cos(x ** 2) * ad.exp(7 * x) + y,
+                 x ** ad.tan(y) - 3 / x + (x < y) - ad.arctan(x - y),
+                 ad.log(x * y, 2) + ad.logistic(x) - ad.sqrt(x * x + y * y) ** y]
+    for f in functions:
+        compiled = ad.compile(f)
+        assert compiled.wrt == ['x', 'y']
+        for x0, y0 in [(1.1, 0.4), (0.3, 2.5)]:
+            expected = f.evaluate(x=x0, y=y0)
+            results = compiled(x=x0, y=y0)
+            assert np.isclose(results['value'], expected['value'])
+            assert np.isclose(results['derivative']['x'], expected['derivative']['x'])
+            assert np.isclose(results['derivative']['y'], expected['derivative']['y'])
+
+
+def test_compile_wrt_and_seed():
+    # wrt and seed_dict are fixed at compile time
+    x = ad.var('x')
+    y = ad.var('y')
+    f = ad.cos(x) + ad.sin(y)
+    results = ad.compile(f, wrt=[y], seed_dict={'y': 0.7})(x=.1, y=.1)
+    assert list(results['derivative'].keys()) == ['y'] and np.isclose(results['derivative']['y'], 0.696503)
+
+
+def test_compile_newton_solver():
+    # a compiled function can be used in the newton solver
+    x = ad.var('x')
+    f = 3 * x ** 2 + 5 * x - 4
+    root = newton_solver(ad.compile(f), x, -4, precision=0.01, max_iter=200)
+    assert np.isclose(root, (-5 + np.sqrt(73)) / 6) or np.isclose(root, (-5 - np.sqrt(73)) / 6)
+
+
+def test_compile_invalid_arguments():
+    x = ad.var('x')
+    y = ad.var('y')
+    compiled = ad.compile(ad.sqrt(x) + y)
+    with pytest.raises(ValueError):
+        compiled(x=-1, y=1)
+    with pytest.raises(ValueError):
+        compiled(x=1)
+    with pytest.raises(ValueError):
+        compiled(x=1, z=1)
+    with pytest.raises(ValueError):
+        compiled(x='cat', y=1)
+    with pytest.raises(ValueError):
+        ad.compile(ad.exp(x, y))(x=1, y=2)
+    with pytest.raises(ValueError):
+        ad.compile(x * y, wrt=['k'])
+
+
+def test_deep_graphs():
+    # long chains are much deeper than the recursion limit
+    # and should evaluate without a RecursionError
+    x = ad.var('x')
+    f = x
+    for i in range(5000):
+        f = f + i * x
+    results = f.evaluate(x=2.0)
+    assert results['value'] == 2.0 * (1 + 4999 * 5000 / 2) and results['derivative']['x'] == 1 + 4999 * 5000 / 2
+    results = f.evaluate(x=2.0, mode='reverse')
+    assert results['derivative']['x'] == 1 + 4999 * 5000 / 2
+    assert ad.compile(f)(x=2.0)['derivative']['x'] == 1 + 4999 * 5000 / 2
+
+
+def test_deep_function_chains():
+    # a long chain of functions has one node per function
+    x = ad.var('x')
+    g = x
+    for i in range(50000):
+        g = ad.sin(g)
+    assert len(ad.Node.topological_order(g)) == 50001
+    results = g.evaluate(x=0.5)
+    assert 0 < results['value'] < 0.5 and 0 < results['derivative']['x'] < 1
+
+
+def test_sum_and_prod():
+    # n-ary reductions should match the equivalent chains of binary operations
+    x = ad.var('x')
+    y = ad.var('y')
+    terms = [x, ad.sin(y), x * y, 2, -y]
+    f = ad.sum(terms)
+    g = ad.prod(terms)
+    f_chain = x + ad.sin(y) + x * y + 2 - y
+    g_chain = x * ad.sin(y) * (x * y) * 2 * -y
+    for reduction, chain in [(f, f_chain), (g, g_chain)]:
+        expected = chain.evaluate(x=0.3, y=1.7)
+        for results in [reduction.evaluate(x=0.3, y=1.7), reduction.evaluate(x=0.3, y=1.7, mode='reverse'),
+                        ad.compile(reduction)(x=0.3, y=1.7)]:
+            assert np.isclose(results['value'], expected['value'])
+            assert np.isclose(results['derivative']['x'], expected['derivative']['x'])
+            assert np.isclose(results['derivative']['y'], expected['derivative']['y'])
+        results = reduction.evaluate_batch(x=[0.3, 0.5], y=1.7)
+        assert np.isclose(results['derivative']['x'][0], expected['derivative']['x'])
+
+
+def test_prod_with_zeros_and_repeated_operands():
+    # the product rule works with zeros and repeated operands
+    x = ad.var('x')
+    y = ad.var('y')
+    results = ad.prod([x, x, y]).evaluate(x=0.0, y=3.0)
+    assert results['value'] == 0 and results['derivative']['x'] == 0 and results['derivative']['y'] == 0
+    results = ad.prod([x, x, y]).evaluate(x=2.0, y=3.0, mode='reverse')
+    assert results['derivative']['x'] == 12 and results['derivative']['y'] == 4
+
+
+def test_sum_invalid_arguments():
+    x = ad.var('x')
+    with pytest.raises(ValueError):
+        ad.sum([])
+    with pytest.raises(ValueError):
+        ad.sum(x)
+
+
+def test_import_star_keeps_builtins():
+    # import * does not replace sum and compile, which are exported under other names
+    namespace = {}
+    exec('from autodiff import *', namespace)
+    assert 'sum' not in namespace and 'prod' not in namespace and 'compile' not in namespace
+    assert namespace['add_n'] is ad.sum and namespace['mul_n'] is ad.prod
+    assert namespace['compile_graph'] is ad.compile
+    assert all(name in namespace for name in ad.__all__)
+
+
+def test_flatten_reductions(flattening):
+    # chained + and * can be collapsed into n-ary nodes
+    x = ad.var('x')
+    f = x
+    for i in range(1000):
+        f = f + i * x
+    g = x * 2 * x * 3
+    assert f.function_name == 'sum' and len(f.operands) == 1001
+    assert g.function_name == 'prod' and len(g.operands) == 4
+    results = f.evaluate(x=2.0)
+    assert results['value'] == 2.0 * (1 + 999 * 1000 / 2) and results['derivative']['x'] == 1 + 999 * 1000 / 2
+    results = g.evaluate(x=2.0)
+    assert results['value'] == 24 and results['derivative']['x'] == 24
+
+
+def test_flatten_reductions_share_operands(flattening):
+    # a chain of n additions takes O(n) memory, since the nodes share one operand buffer
+    x = ad.var('x')
+    chain = [x + 1]
+    for i in range(20000):
+        chain.append(chain[-1] + i)
+    buffers = {id(node.operand_buffer): len(node.operand_buffer) for node in chain}
+    assert sum(buffers.values()) < 2 * len(chain)
+
+    # extending a node that was already extended copies its operands
+    h = chain[0] + x
+    assert [len(node.operands) for node in (chain[0], chain[1], h)] == [2, 3, 3]
+    assert h.operands[-1] is x and chain[1].operands[-1] is not x
+    assert h.evaluate(x=2.0)['value'] == 5.0 and chain[1].evaluate(x=2.0)['value'] == 3.0
+    assert len((chain[1] + chain[1]).operands) == 6
+
+
+def test_no_flattening_by_default():
+    # without flattening we get binary nodes
+    x = ad.var('x')
+    assert (x + x + x).function_name == '+'
+
+
+def test_vector_tangents():
+    # the tangents are carried as a single vector with one lane per variable in wrt
+    variables = [ad.var(f'x{i}') for i in range(20)]
+    f = variables[0]
+    for v in variables[1:]:
+        f = ad.sin(f) * v + v
+    values = {f'x{i}': 0.1 * i for i in range(20)}
+    results = f.evaluate(**values)
+    _, derivs, index = ad.Node.eval_post(f, values, sorted(values))
+    assert derivs[index[id(f)]].shape == (20,)
+    assert list(results['derivative'].keys()) == sorted(values.keys())
+
+    reverse = f.evaluate(**values, mode='reverse')
+    for key in values:
+        assert np.isclose(results['derivative'][key], reverse['derivative'][key])
+
+
+def test_vector_tangent_lanes():
+    # the lanes follow the order of wrt, and the seed scales a single lane
+    x = ad.var('x')
+    y = ad.var('y')
+    f = ad.sin(x) * y + y
+    reverse = f.evaluate(x=0.3, y=0.7, mode='reverse')
+    results = f.evaluate(x=0.3, y=0.7, wrt=['y', 'x'], seed_dict={'x': 2.0})
+    assert list(results['derivative'].keys()) == ['y', 'x']
+    assert np.isclose(results['derivative']['x'], 2 * reverse['derivative']['x'])
+    assert np.isclose(results['derivative']['y'], reverse['derivative']['y'])
+
+
+def test_batch_tangents():
+    # batches get an extra axis on the tangents
+    x = ad.var('x')
+    y = ad.var('y')
+    g = ad.prod([x, y, x]) + (x < y)
+    results = g.evaluate_batch(x=[1.0, 2.0, 3.0], y=2.0, seed_dict={'y': 3.0})
+    _, derivs, index = ad.Node.eval_post(g, {'x': np.array([1.0, 2.0, 3.0]), 'y': 2.0}, ['x', 'y'])
+    assert derivs[index[id(g)]].shape == (2, 3)
+    assert np.allclose(results['derivative']['x'], [4, 8, 12]) and np.allclose(results['derivative']['y'], [3, 12, 27])
+
+
+def test_fused_vector_evaluation(calls):
+    # shared intermediates between outputs are computed only once
+    x = ad.var('x')
+    y = ad.var('y')
+    z = ad.var('z')
+    shared = counted(x * y)
+    f = [shared + 1, shared * z, ad.sin(y)]
+    results = ad.evaluate(f, x=0.5, y=2.0, z=3.0)
+    assert len(calls) == 1
+    assert np.isclose(results[1]['value'], 3 * np.sin(1)) and np.isclose(results[1]['derivative']['x'], 6 * np.cos(1))
+    # each output only reports the variables that appear in it
+    assert list(results[0]['derivative'].keys()) == ['x', 'y']
+    assert list(results[2]['derivative'].keys()) == ['y']
+
+
+def test_vector_reverse_mode():
+    # the reverse mode gives the same derivatives for every output
+    x = ad.var('x')
+    y = ad.var('y')
+    z = ad.var('z')
+    shared = ad.exp(x * y)
+    f = [shared + 1, shared * z, ad.sin(y)]
+    forward = ad.evaluate(f, x=0.5, y=2.0, z=3.0)
+    reverse = ad.evaluate(f, x=0.5, y=2.0, z=3.0, mode='reverse')
+    for forward_result, reverse_result in zip(forward, reverse):
+        assert forward_result['derivative'].keys() == reverse_result['derivative'].keys()
+        for key in forward_result['derivative']:
+            assert np.isclose(forward_result['derivative'][key], reverse_result['derivative'][key])
+
+
+def test_vector_array_output():
+    # the Jacobian can be returned as a dense array
+    x = ad.var('x')
+    y = ad.var('y')
+    z = ad.var('z')
+    shared = ad.exp(x * y)
+    f = [shared + 1, shared * z, ad.sin(y)]
+    results = ad.evaluate(f, x=0.5, y=2.0, z=3.0, output='array')
+    assert results['value'].shape == (3,) and results['derivative'].shape == (3, 3)
+    assert np.isclose(results['derivative'][1, 2], np.exp(1)) and results['derivative'][2, 0] == 0
+    assert np.isclose(results['derivative'][2, 1], np.cos(2.0))
+    results = ad.evaluate(f, x=0.5, y=2.0, z=3.0, wrt=[z, x], output='array', mode='reverse')
+    assert results['derivative'].shape == (3, 2) and np.isclose(results['derivative'][1, 1], 6 * np.exp(1))
+
+    with pytest.raises(ValueError):
+        ad.evaluate(f, x=0.5, y=2.0, z=3.0, output='matrix')
+    with pytest.raises(ValueError):
+        f[0].evaluate(x=0.5, y=2.0, output='array')
+
+
+def test_jacobian_out_buffers():
+    # the Jacobian can be written into preallocated arrays
+    x = ad.var('x')
+    y = ad.var('y')
+    f = [x * y, x + y, ad.cos(y - x)]
+    values = np.zeros(3)
+    jacobian = np.zeros((3, 2))
+    for x0 in [0.1, 0.2]:
+        results = ad.evaluate(f, x=x0, y=.1, wrt=[y, x], output='array', out=(values, jacobian))
+        assert results['value'] is values and results['derivative'] is jacobian
+    assert np.allclose(values, [0.02, 0.3, np.cos(-0.1)])
+    assert np.allclose(jacobian, [[0.2, 0.1], [1, 1], [-np.sin(-0.1), np.sin(-0.1)]])
+    results = ad.evaluate(f, x=.2, y=.1, output='array')
+    assert results['derivative'].dtype == np.float64 and np.allclose(results['derivative'], jacobian[:, ::-1])
+
+
+def test_jacobian_out_inactive_rows():
+    # the rows of outputs that don't depend on the variables in wrt are zero in both modes
+    x = ad.var('x')
+    y = ad.var('y')
+    for mode in ['forward', 'reverse']:
+        jacobian = np.full((2, 1), np.nan)
+        results = ad.evaluate([x * 2, y + 1], x=.2, y=.1, wrt=[x], mode=mode, output='array',
+                              out=(np.zeros(2), jacobian))
+        assert np.array_equal(results['derivative'], [[2], [0]])
+
+
+def test_jacobian_out_invalid_buffers():
+    x = ad.var('x')
+    y = ad.var('y')
+    f = [x * y, x + y, ad.cos(y - x)]
+    values = np.zeros(3)
+    with pytest.raises(ValueError):
+        ad.evaluate(f, x=.2, y=.1, output='array', out=(values, np.zeros((3, 3))))
+    with pytest.raises(ValueError):
+        ad.evaluate(f, x=.2, y=.1, output='array', out=(values, np.zeros((3, 2), dtype=int)))
+    with pytest.raises(ValueError):
+        ad.evaluate(f, x=.2, y=.1, output='array', out=values)
+    with pytest.raises(ValueError):
+        ad.evaluate(f, x=.2, y=.1, out=(values, np.zeros((3, 2))))
+
+
+def test_incremental_compile(calls):
+    # only the nodes that depend on changed variables are recomputed
+    variables = [ad.var(f'x{i}') for i in range(10)]
+    f = ad.sum([counted(v) for v in variables]) * variables[0]
+    compiled = ad.compile(f, incremental=True)
+    values = {f'x{i}': 0.1 * i for i in range(10)}
+
+    results = compiled(**values)
+    assert len(calls) == 10
+    results = compiled(**values)
+    assert len(calls) == 10
+
+    values['x3'] = 1.5
+    results = compiled(**values)
+    assert len(calls) == 11
+    expected = f.evaluate(**values)
+    assert np.isclose(results['value'], expected['value'])
+    for key in values:
+        assert np.isclose(results['derivative'][key], expected['derivative'][key])
+
+
+def test_incremental_compile_several_changes(calls):
+    # the nodes that depend on any of the changed variables are recomputed
+    variables = [ad.var(f'x{i}') for i in range(10)]
+    f = ad.sum([counted(v) for v in variables]) * variables[0]
+    compiled = ad.compile(f, incremental=True)
+    values = {f'x{i}': 0.1 * i for i in range(10)}
+    compiled(**values)
+
+    values['x0'] = 0.7
+    values['x9'] = -0.2
+    del calls[:]
+    results = compiled(**values)
+    assert len(calls) == 2
+    assert np.isclose(results['value'], f.evaluate(**values)['value'])
+
+
+def test_incremental_compile_after_error():
+    # a failed evaluation drops the cache
+    x = ad.var('x')
+    y = ad.var('y')
+    g = ad.compile(ad.sqrt(x) + counted(y), incremental=True)
+    g(x=1.0, y=1.0)
+    with pytest.raises(ValueError):
+        g(x=-1.0, y=1.0)
+    assert np.isclose(g(x=4.0, y=1.0)['value'], 2 + np.sin(1.0))
+
+
+def test_incremental_compile_signed_zero():
+    # a change of sign of zero is a change of input
+    x = ad.var('x')
+    h = ad.compile(1 / x, incremental=True)
+    assert h(x=0.0)['value'] == np.inf
+    assert h(x=-0.0)['value'] == -np.inf
+    assert h(x=-0.0)['value'] == -np.inf
+
+
+def test_cached_variable_sets():
+    # the variables of each node are known when it is built
+    x = ad.var('x')
+    y = ad.var('y')
+    f = ad.sin(x) * 2 + ad.exp(y)
+    vars = set()
+    ad.Node.get_variables(f, vars)
+    assert vars == {'x', 'y'}
+    assert ad.Node.get_mask_variables((ad.sin(x) * 2).var_mask) == {'x'}
+    assert ad.const(3).var_mask == 0
+
+
+def test_inactive_derivatives(deriv_calls):
+    # the derivatives of subtrees that don't depend on wrt are not computed
+    x = ad.var('x')
+    y = ad.var('y')
+    g = counted(x) + counted(y) * y
+    results = g.evaluate(x=0.5, y=0.3, wrt=['y'])
+    assert len(deriv_calls) == 1
+    assert np.isclose(results['derivative']['y'], np.cos(0.3) * 0.3 + np.sin(0.3))
+
+    del deriv_calls[:]
+    results = ad.compile(g, wrt=['x'])(x=0.5, y=0.3)
+    assert len(deriv_calls) == 1
+    assert np.isclose(results['derivative']['x'], np.cos(0.5))
+
+
+def unmasked_variables(monkeypatch, prefix, count):
+    """This function returns new variables that have no bit in the variable masks, since
+    mask_max_bits names already have a bit.
+
+    arguments:
+    monkeypatch -- the monkeypatch fixture of the test
+    prefix -- the prefix of the names of the variables
+    count -- the number of variables
+    """
+    monkeypatch.setattr(ad, 'mask_max_bits', len(ad.variable_names))
+    return [ad.var(f'{prefix}{i}') for i in range(count)]
+
+
+def test_bounded_variable_masks(monkeypatch):
+    # once mask_max_bits names have a bit, the variables are found by traversal instead,
+    # so the masks don't grow with the number of variables
+    x = ad.var('x')
+    wide = unmasked_variables(monkeypatch, 'wide', 500)
+    assert all(v.var_mask is None for v in wide)
+    h = x
+    for v in wide:
+        h = h + v
+    assert h.var_mask is None and (ad.sin(x) * 2).var_mask is not None
+    vars = set()
+    ad.Node.get_variables(h * ad.sin(x), vars)
+    assert vars == {'x'} | {f'wide{i}' for i in range(500)}
+
+
+def test_unmasked_inactive_derivatives(monkeypatch, deriv_calls):
+    # the derivatives of subtrees without a mask are skipped in every mode
+    x = ad.var('x')
+    y = ad.var('y')
+    u, v = unmasked_variables(monkeypatch, 'unmasked', 2)
+    k = counted(u) * ad.exp(y) + counted(x) * v
+    point = {'x': 0.5, 'y': 0.3, 'unmasked0': 0.2, 'unmasked1': 0.7}
+    for wrt, count in [(['y'], 0), (['unmasked1'], 0), (['unmasked0', 'x'], 2)]:
+        for function in [lambda: k.evaluate(wrt=wrt, **point), lambda: k.evaluate(wrt=wrt, mode='reverse', **point),
+                         lambda: ad.compile(k, wrt=wrt)(**point)]:
+            del deriv_calls[:]
+            results = function()
+            assert len(deriv_calls) == count
+            assert set(results['derivative']) == set(wrt)
+    expected = {'x': np.cos(0.5) * 0.7, 'y': np.sin(0.2) * np.exp(0.3), 'unmasked0': np.cos(0.2) * np.exp(0.3),
+                'unmasked1': np.sin(0.5)}
+    results = k.evaluate(**point)
+    assert all(np.isclose(results['derivative'][key], expected[key]) for key in expected)
+
+
+def test_unmasked_second_order(monkeypatch):
+    # the Hessian and the sparse Jacobian work with variables without a mask
+    y = ad.var('y')
+    u, v = unmasked_variables(monkeypatch, 'unmasked', 2)
+    point = {'y': 0.3, 'unmasked0': 0.2, 'unmasked1': 0.7}
+    assert np.isclose(ad.hessian(ad.cos(u) * ad.exp(y), unmasked0=0.2, y=0.3)['hessian']['unmasked0']['y'],
+                      -np.sin(0.2) * np.exp(0.3))
+    outputs = [ad.sin(u) * ad.exp(y) + v, v * y]
+    assert np.allclose(ad.sparse_jacobian(outputs, **point)['derivative'].toarray(),
+                       ad.evaluate(outputs, output='array', **point)['derivative'])
+
+
+def test_inactive_subtrees():
+    # nodes that don't depend on wrt only compute their value and store no tangent
+    x = ad.var('x')
+    y = ad.var('y')
+    inactive = ad.exp(ad.sin(y) * 3)
+    f = x * inactive + ad.ln(x)
+    results = f.evaluate(x=2.0, y=0.5, wrt=['x'])
+    values, derivs, index = ad.Node.eval_post(f, {'x': 2.0, 'y': 0.5}, ['x'])
+    assert values[index[id(inactive)]] == np.exp(np.sin(0.5) * 3)
+    assert isinstance(derivs[index[id(inactive)]], int) and derivs[index[id(inactive)]] == 0
+    assert np.isclose(results['derivative']['x'], np.exp(np.sin(0.5) * 3) + 0.5)
+
+    # the zero tangents broadcast against batches
+    results = f.evaluate_batch(x=[1.0, 2.0], y=[0.5, 0.25], wrt=['x'])
+    assert np.allclose(results['derivative']['x'], np.exp(np.sin([0.5, 0.25]) * 3) + [1.0, 0.5])
+    assert results['derivative']['x'].shape == (2,)
+
+
+def test_interning(interning):
+    # with interning, structurally identical nodes are only created once
+    x = ad.var('x')
+    assert ad.var('x') is x
+    assert ad.sin(x) is ad.sin(x)
+    assert (x * 2) is (x * 2)
+    assert (x - 2) is not (2 - x)
+    assert ad.const(0.0) is not ad.const(-0.0)
+
+
+def test_interned_graphs(interning):
+    # interned graphs evaluate like the others
+    x = ad.var('x')
+    f = ad.sin(x) * ad.sin(x)
+    assert f.left is f.right
+    results = f.evaluate(x=0.5)
+    assert results['value'] == np.sin(0.5) * np.sin(0.5)
+    assert np.isclose(results['derivative']['x'], 2 * np.sin(0.5) * np.cos(0.5))
+    results = ad.evaluate([ad.sin(x), ad.sin(x)], x=0.5)
+    assert results[0]['value'] == results[1]['value'] == np.sin(0.5)
+
+
+def test_no_interning_by_default():
+    # without interning every call creates a new node
+    x = ad.var('x')
+    assert ad.sin(x) is not ad.sin(x)
+
+
+def test_cse(calls):
+    # cse merges the identical nodes of an existing graph
+    x = ad.var('x')
+    y = ad.var('y')
+    g = (counted(x) + y) * (counted(x) + y) + ad.var('x')
+    expected = g.evaluate(x=0.3, y=0.2)
+    del calls[:]
+    h = ad.cse(g)
+    results = h.evaluate(x=0.3, y=0.2)
+    assert len(calls) == 1
+    assert h.left.left is h.left.right
+    assert results['value'] == expected['value']
+    assert results['derivative'] == expected['derivative']
+
+
+def test_cse_returns_new_graph():
+    # the given graph and the graphs that share its nodes are not changed
+    x = ad.var('x')
+    y = ad.var('y')
+    g = (ad.sin(x) + y) * (ad.sin(x) + y) + x
+    other = g.left.left * 2
+    records = [ad.Node.to_records(g), ad.Node.to_records(other)]
+    ad.cse(g)
+    assert [ad.Node.to_records(g), ad.Node.to_records(other)] == records
+    assert g.left.left is not g.left.right
+    with pytest.raises(ValueError):
+        ad.cse(1.0)
+
+
+def test_simplify():
+    # constant subtrees are folded and identity operations are removed
+    x = ad.var('x')
+    y = ad.var('y')
+    f = 2 * 3 * x * 1 + y ** 1 / 1 - 0 + ad.sin(ad.const(0.5) * 2)
+    g = ad.simplify(f)
+    assert len(ad.Node.topological_order(g)) < len(ad.Node.topological_order(f))
+    for values in [{'x': 0.3, 'y': -1.7}, {'x': -0.0, 'y': 1e300}, {'x': 5, 'y': 2}]:
+        expected = f.evaluate(**values)
+        results = g.evaluate(**values)
+        assert np.array_equal(np.float64(results['value']), np.float64(expected['value']))
+        assert results['derivative'] == expected['derivative']
+
+    compiled = ad.compile(f, optimize=True)
+    assert compiled(x=0.3, y=-1.7)['value'] == f.evaluate(x=0.3, y=-1.7)['value']
+
+
+def test_simplify_identities():
+    # operations that don't change their input are removed
+    x = ad.var('x')
+    y = ad.var('y')
+    assert ad.simplify(x * 1) is x
+    assert ad.simplify(-(-x)) is x
+    assert ad.simplify(x + ad.const(-0.0)) is x
+    assert ad.simplify(x + 0) is not x
+    assert ad.simplify(x - x + y).evaluate(x=1.0, y=2.0)['value'] == 2.0
+
+
+def test_simplify_keeps_variables():
+    # x - x is kept if x would disappear from the graph
+    x = ad.var('x')
+    y = ad.var('y')
+    h = ad.simplify(x - x + y)
+    vars = set()
+    ad.Node.get_variables(h, vars)
+    assert vars == {'x', 'y'}
+    h = ad.simplify(ad.sin(y) * (x - x) + x)
+    assert h.left.right.type == ad.Node.CONST
+
+
+def test_simplify_keeps_errors():
+    # functions are not cancelled, since they can raise an error
+    x = ad.var('x')
+    g = ad.sqrt(x) - ad.sqrt(x) + x
+    assert ad.simplify(g).left.op == '__sub__'
+    with pytest.raises(ValueError):
+        ad.simplify(g).evaluate(x=-1.0)
+    with pytest.raises(ValueError):
+        ad.compile(g, optimize=True)(x=-1.0)
+
+    # invalid constant subtrees are left for the evaluation to report
+    g = ad.simplify(ad.sqrt(ad.const(-1.0)) + x)
+    with pytest.raises(ValueError):
+        g.evaluate(x=1.0)
+    with pytest.raises(ValueError):
+        ad.simplify(2.0)
+
+
+def test_value_and_derivative_kernels():
+    # a kernel computes the value and the derivative of a node in a single call
+    calls = []
+
+    def kernel(x, xp):
+        calls.append(x)
+        value = np.exp(x)
+        return value, xp * value
+
+    fused = ad.get_function('fused', np.exp, value_and_derivative=kernel)
+    x = ad.var('x')
+    y = ad.var('y')
+    f = fused(x) * y
+    results = f.evaluate(x=0.5, y=2.0)
+    assert len(calls) == 1
+    assert results['value'] == np.exp(0.5) * 2 and results['derivative']['x'] == np.exp(0.5) * 2
+
+    # the function is used when only the value is needed
+    results = f.evaluate(x=0.5, y=2.0, wrt=['y'])
+    assert len(calls) == 1 and results['derivative']['y'] == np.exp(0.5)
+
+    # the derivative is taken from the kernel in the reverse mode
+    results = f.evaluate(x=0.5, y=2.0, mode='reverse')
+    assert np.isclose(results['derivative']['x'], np.exp(0.5) * 2)
+    results = ad.compile(f)(x=0.5, y=2.0)
+    assert results['derivative']['x'] == np.exp(0.5) * 2
+
+
+def test_builtin_kernels():
+    # the built-in functions give the same results as before
+    x = ad.var('x')
+    y = ad.var('y')
+    z = ad.logistic(x) + ad.log(x, y) + ad.sqrt(x) + x ** y
+    results = z.evaluate(x=1.5, y=3.0)
+    assert np.isclose(results['derivative']['x'], np.exp(1.5) / (1 + np.exp(1.5)) ** 2 + 1 / (1.5 * np.log(3.0))
+                      + 0.5 / np.sqrt(1.5) + 3.0 * 1.5 ** 2)
+
+
+def test_missing_derivative():
+    with pytest.raises(ValueError):
+        ad.get_function('missing', np.exp)
+
+
+def build_graph(constant):
+    """This function builds a graph with a shared node, a reduction and a constant.
+
+    arguments:
+    constant -- the constant to use in the graph
+    """
+    x = ad.var('x')
+    y = ad.var('y')
+    shared = ad.exp(x * y)
+    return ad.sum([shared, shared * constant, ad.sqrt(y) * 1]) + x ** 2
+
+
+def test_pickle():
+    # graphs refer to their operations by name, so they can be pickled
+    x = ad.var('x')
+    y = ad.var('y')
+    shared = ad.exp(x / y)
+    f = ad.sum([shared, -shared, x ** 2, 3 - y]) + ad.logistic(x) * (x < y)
+    g = pickle.loads(pickle.dumps(f))
+    assert g is not f
+    assert g.evaluate(x=0.5, y=2.0) == f.evaluate(x=0.5, y=2.0)
+    assert len(ad.Node.topological_order(g)) == len(ad.Node.topological_order(f))
+
+
+def test_pickle_deep_graphs():
+    # deep graphs don't hit the recursion limit
+    x = ad.var('x')
+    h = x
+    for i in range(5000):
+        h = h + 1
+    assert pickle.loads(pickle.dumps(h)).evaluate(x=1.0)['value'] == 5001.0
+
+
+def test_evaluate_many():
+    # the points are evaluated in worker processes
+    f = build_graph(2.0)
+    points = [{'x': 0.1 * i, 'y': 1.0 + i} for i in range(20)]
+    results = ad.evaluate_many(f, points, max_workers=2, wrt=['x'])
+    assert len(results) == 20
+    for point, result in zip(points, results):
+        assert result == f.evaluate(**point, wrt=['x'])
+    assert ad.evaluate_many(f, []) == []
+
+
+def test_evaluate_many_invalid_arguments():
+    f = build_graph(2.0)
+    with pytest.raises(ValueError):
+        ad.evaluate_many(f, [{'x': 1.0}], max_workers=1)
+    with pytest.raises(ValueError):
+        ad.evaluate_many(f, [{'x': 1.0, 'y': 2.0}], plot='test.gif')
+
+
+def replace_cube_field(records, position, value):
+    """This function returns the records of a graph with one field of the records of cube replaced.
+
+    arguments:
+    records -- the records of the graph, see Node.to_records
+    position -- the position of the field in the records
+    value -- the new value of the field
+    """
+    return [record[:position] + (value,) + record[position + 1:] if record[0] == 'op' and record[1] == 'cube'
+            else record for record in records]
+
+
+def test_changed_operations_in_records():
+    # operations that aren't registered in the same way are reported
+    x = ad.var('x')
+    records = ad.Node.to_records(cube(x) + 1)
+    assert ad.Node.from_records(records).evaluate(x=2.0)['value'] == 9.0
+    with pytest.raises(ValueError):
+        ad.Node.from_records(replace_cube_field(records, 5, 'changed'))
+    with pytest.raises(ValueError):
+        ad.Node.from_records(replace_cube_field(records, 1, 'unknown'))
+
+
+def test_unknown_operations_in_worker(monkeypatch):
+    # a worker that can't rebuild the graph reports the error for every chunk
+    x = ad.var('x')
+    unknown = replace_cube_field(ad.Node.to_records(cube(x) + 1), 1, 'unknown')
+    monkeypatch.setattr(ad, 'worker_error', None)
+    ad._init_worker(unknown)
+    with pytest.raises(ValueError):
+        ad._evaluate_points([{'x': 1.0}], {})
+
+
+def test_concurrent_evaluation():
+    # the evaluation state is kept out of the graph, so threads can share a graph
+    x = ad.var('x')
+    y = ad.var('y')
+    f = x
+    for i in range(200):
+        f = ad.sin(f) * y + x
+    points = [{'x': 0.01 * i, 'y': 0.5 + 0.01 * i} for i in range(40)]
+    expected = [f.evaluate(**point) for point in points]
+    assert f.value is None
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda point: f.evaluate(**point), points))
+        batches = list(executor.map(lambda scale: f.evaluate_batch(x=np.linspace(0, scale, 50), y=0.5,
+                                                                   mode='reverse'), [1.0, 2.0] * 4))
+    assert results == expected
+    for batch, scale in zip(batches, [1.0, 2.0] * 4):
+        assert np.array_equal(batch['value'], f.evaluate_batch(x=np.linspace(0, scale, 50), y=0.5)['value'])
+
+
+def cached_product(maxsize=2):
+    """This function returns counted(x) * y with the evaluation cache enabled.
+
+    arguments:
+    maxsize -- the number of results to keep in the cache
+    """
+    f = counted(ad.var('x')) * ad.var('y')
+    f.enable_cache(maxsize=maxsize)
+    return f
+
+
+def test_evaluation_cache(calls):
+    # repeated calls with the same arguments are returned from the cache
+    f = cached_product()
+    first = f.evaluate(x=0.5, y=2.0)
+    assert f.evaluate(x=0.5, y=2.0) == first
+    assert len(calls) == 1
+    assert f.cache_info() == {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1, 'maxsize': 2}
+
+
+def test_evaluation_cache_keys(calls):
+    # the other arguments are part of the key, and the oldest results are evicted
+    f = cached_product()
+    f.evaluate(x=0.5, y=2.0)
+    f.evaluate(x=0.5, y=2.0, wrt=['x'])
+    f.evaluate(x=0.5, y=2, wrt=['x'])
+    assert len(calls) == 3
+    assert f.cache_info()['evictions'] == 1 and f.cache_info()['size'] == 2
+
+
+def test_evaluation_cache_copies_results(calls):
+    # changing a result doesn't change the cache
+    f = cached_product()
+    result = f.evaluate(x=0.5, y=2, wrt=['x'])
+    result['derivative']['x'] = 0
+    assert f.evaluate(x=0.5, y=2, wrt=['x'])['derivative']['x'] == 2 * np.cos(0.5)
+    assert len(calls) == 1
+
+
+def test_evaluation_cache_signed_zero():
+    # 0.0 and -0.0 compare equal, but give results with different signs
+    x = ad.var('x')
+    g = x * 2.0
+    g.enable_cache()
+    assert not np.signbit(g.evaluate(x=0.0)['value'])
+    assert np.signbit(g.evaluate(x=-0.0)['value'])
+    assert g.cache_info()['size'] == 2
+
+
+def test_clear_and_disable_cache(calls):
+    f = cached_product()
+    f.evaluate(x=0.5, y=2, wrt=['x'])
+    f.clear_cache()
+    f.evaluate(x=0.5, y=2, wrt=['x'])
+    assert len(calls) == 2 and f.cache_info()['size'] == 1
+
+    f.disable_cache()
+    f.evaluate(x=0.5, y=2, wrt=['x'])
+    assert len(calls) == 3
+    with pytest.raises(ValueError):
+        f.cache_info()
+    with pytest.raises(ValueError):
+        f.enable_cache(maxsize=0)
+
+
+def test_structural_hash():
+    # graphs that are built in the same way have the same hash
+    assert ad.structural_hash(build_graph(2.0)) == ad.structural_hash(build_graph(2.0))
+    assert ad.structural_hash(build_graph(2.0)) != ad.structural_hash(build_graph(2))
+    x = ad.var('x')
+    assert ad.structural_hash(x - 2) != ad.structural_hash(2 - x)
+
+
+def test_compiled_cache(tmp_path):
+    # the first compile stores the compiled function, and the second one loads it
+    f = build_graph(2.0)
+    expected = f.evaluate(x=0.5, y=1.5)
+    compiled = ad.compile(f, optimize=True, incremental=True, cache=True, cache_dir=str(tmp_path))
+    entries = list(tmp_path.iterdir())
+    assert len(entries) == 1
+    loaded = ad.load_cached(str(entries[0]))
+    for function in [compiled, loaded, ad.compile(build_graph(2.0), optimize=True, incremental=True,
+                                                   cache=True, cache_dir=str(tmp_path))]:
+        results = function(x=0.5, y=1.5)
+        assert np.isclose(results['value'], expected['value'])
+        for key in expected['derivative']:
+            assert np.isclose(results['derivative'][key], expected['derivative'][key])
+        assert np.isclose(function(x=0.5, y=2.5)['value'], f.evaluate(x=0.5, y=2.5)['value'])
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # other arguments give other entries
+    ad.compile(f, wrt=['y'], cache=True, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_compiled_cache_concurrent_eviction(tmp_path, monkeypatch):
+    # an entry that is evicted by another process while it is loaded is still returned
+    def evicted(path, *args):
+        raise FileNotFoundError(path)
+
+    ad.compile(build_graph(2.0), cache=True, cache_dir=str(tmp_path))
+    entry = str(next(tmp_path.iterdir()))
+    monkeypatch.setattr(ad.os, 'utime', evicted)
+    assert ad.load_cached(entry) is not None
+
+
+def test_compiled_cache_stale_entries(tmp_path):
+    # entries of a changed operation are stale and removed
+    ad.compile(build_graph(2.0), cache=True, cache_dir=str(tmp_path))
+    entry = next(tmp_path.iterdir())
+    arrays = dict(np.load(str(entry)))
+    arrays['fingerprints'] = np.array(['changed'] * len(arrays['fingerprints']))
+    np.savez(str(entry), **arrays)
+    assert ad.load_cached(str(entry)) is None
+    assert not entry.exists()
+
+
+def test_compiled_cache_eviction(tmp_path):
+    # the least recently used entries are evicted
+    f = build_graph(2.0)
+    ad.compile(f, wrt=['y'], cache=True, cache_dir=str(tmp_path))
+    oldest = next(tmp_path.iterdir())
+    ad.compile(f, wrt=['x'], cache=True, cache_dir=str(tmp_path))
+    os.utime(str(oldest), (0, 0))
+    ad.evict_cache(str(tmp_path), max(entry.stat().st_size for entry in tmp_path.iterdir()))
+    assert not oldest.exists() and len(list(tmp_path.iterdir())) == 1
+
+
+def saved_graph(tmp_path):
+    """This function saves a graph and returns the graph and the path of the file.
+
+    arguments:
+    tmp_path -- the directory to save the graph in
+    """
+    x = ad.var('x')
+    y = ad.var('y')
+    f = ad.sum([ad.sin(x * y), ad.exp(x) / 2, -y ** 3, 2.5 * x]) + ad.tan(y - 1)
+    path = str(tmp_path / 'graph.npz')
+    ad.save(f, path)
+    return f, path
+
+
+def test_save_and_load(tmp_path):
+    # the loaded graph gives the same results without creating any nodes
+    f, path = saved_graph(tmp_path)
+    stored = ad.load(path)
+    assert len(stored) == len(ad.Node.topological_order(f))
+    assert stored.variables == {'x', 'y'}
+    assert not any(stored.nodes)
+
+    expected = f.evaluate(x=0.3, y=1.7)
+    for results in [stored.evaluate(x=0.3, y=1.7), stored.compile()(x=0.3, y=1.7)]:
+        assert np.isclose(results['value'], expected['value'])
+        for key in expected['derivative']:
+            assert np.isclose(results['derivative'][key], expected['derivative'][key])
+
+
+def test_compile_stored_graph(tmp_path):
+    # stored graphs are compiled directly from the arrays
+    f, path = saved_graph(tmp_path)
+    stored = ad.load(path)
+    expected = f.evaluate(x=0.3, y=1.7)
+    assert stored.compile(wrt=['y'], seed_dict={'y': 2})(x=0.3, y=1.7)['derivative']['y'] == \
+        pytest.approx(2 * expected['derivative']['y'])
+    with pytest.raises(ValueError):
+        stored.compile(wrt=['z'])
+
+
+def test_stored_graph_nodes(tmp_path):
+    # only the nodes that are needed are created, and constants keep their type
+    f, path = saved_graph(tmp_path)
+    stored = ad.load(path)
+    power = stored.node(next(i for i in range(len(stored)) if stored.get_children(i) and
+                             stored.ops[stored.op_indices[i]] == '__pow__'))
+    assert sum(node is not None for node in stored.nodes) == 3
+    assert power.right.value == 3 and isinstance(power.right.value, int)
+
+
+def test_save_and_load_invalid_graphs(tmp_path):
+    # array constants can't be saved, and changed operations can't be loaded
+    _, path = saved_graph(tmp_path)
+    with pytest.raises(ValueError):
+        ad.save(ad.var('x') + np.ones(2), path)
+    arrays = dict(np.load(path))
+    arrays['fingerprints'] = np.array(['changed'] * len(arrays['fingerprints']))
+    np.savez(path, **arrays)
+    with pytest.raises(ValueError):
+        ad.load(path)
+
+
+def test_compact_nodes():
+    # nodes have slots, and integer types instead of strings
+    x = ad.var('x')
+    y = ad.var('y')
+    assert not hasattr(x, '__dict__')
+    assert (x.type, ad.const(2).type, (x * y).type) == (ad.Node.VAR, ad.Node.CONST, ad.Node.INTER)
+    assert not hasattr(x * y, 'depth') and not hasattr(x * y, 'deriv')
+
+    # functions are resolved through the operation registry instead of stored per node
+    assert 'function' not in ad.Node.__slots__ and 'partials' not in ad.Node.__slots__
+    assert (x * y).function is ad.operations['__mul__'][0] and x.function is None
+
+
+def test_node_memory():
+    # measure the bytes per node of a long chain of nodes and of its stored arrays
+    x = ad.var('x')
+    y = ad.var('y')
+    tracemalloc.start()
+    f = x
+    for i in range(2000):
+        f = ad.sin(f * y + i)
+    node_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    stored = ad.StoredGraph.from_node(f)
+    assert node_bytes / len(stored) < 150
+    assert stored.nbytes / len(stored) < 40
+
+
+def test_stored_graph_views():
+    # handles read the arrays without creating nodes
+    x = ad.var('x')
+    y = ad.var('y')
+    f = x
+    for i in range(2000):
+        f = ad.sin(f * y + i)
+    stored = ad.StoredGraph.from_node(f)
+    root = stored.view()
+    assert root == stored.view(len(stored) - 1) and root.op == 'sin' and root.right is None
+    assert root.left.op == '__add__' and root.left.right.value == 1999
+    assert stored.view(0).type == ad.Node.VAR and stored.view(0).var_name == 'x'
+    assert not any(stored.nodes)
+    assert root.node().evaluate(x=0.3, y=0.2) == f.evaluate(x=0.3, y=0.2)
+    with pytest.raises(ValueError):
+        stored.view(len(stored))
+
+
+def test_registered_operations_are_reused():
+    # registering the same functions again does not grow the registry
+    kernel = lambda x, xp: (np.sin(x), xp * np.cos(x))
+    count = len(ad.operations)
+    functions = [ad.get_function('reused', np.sin, value_and_derivative=kernel) for i in range(5)]
+    x = ad.var('x')
+    nodes = [function(x) for function in functions]
+    assert len(ad.operations) == count + 1
+    assert len({node.op for node in nodes}) == 1
+
+    # nodes built directly from the functions of an operation reuse it
+    direct = [ad.Node(function=nodes[0].function, derivative=nodes[0].derivative, function_name='reused')
+              for i in range(5)]
+    assert len(ad.operations) == count + 1
+    assert all(node.op == nodes[0].op for node in direct)
+
+
+def second_order_function():
+    """This function returns a function of x and y that uses operations with second derivatives
+    of every kind: unary, binary and reductions."""
+    x = ad.var('x')
+    y = ad.var('y')
+    return ad.sin(x * y) + ad.exp(x) / y - ad.ln(y) * x ** 3 + ad.prod([x, y, y]) + ad.log(x, y)
+
+
+def test_hessian():
+    # compare to central differences of the gradient
+    f = second_order_function()
+    point = {'x': 0.7, 'y': 1.3}
+    result = ad.hessian(f, output='array', **point)
+    expected = np.zeros((2, 2))
+    for j, key in enumerate(['x', 'y']):
+        step = 1e-6
+        plus = f.evaluate(**dict(point, **{key: point[key] + step}))['derivative']
+        minus = f.evaluate(**dict(point, **{key: point[key] - step}))['derivative']
+        expected[:, j] = [(plus[k] - minus[k]) / (2 * step) for k in ['x', 'y']]
+    assert np.allclose(result['hessian'], expected, atol=1e-6)
+    assert np.allclose(result['hessian'], result['hessian'].T)
+    assert np.isclose(result['value'], f.evaluate(**point)['value'])
+    assert np.allclose(result['derivative'], [f.evaluate(**point)['derivative'][k] for k in ['x', 'y']])
+
+
+def test_hvp():
+    # the Hessian-vector product matches the product with the full Hessian
+    f = second_order_function()
+    point = {'x': 0.7, 'y': 1.3}
+    hessian = ad.hessian(f, output='array', **point)['hessian']
+    product = ad.hvp(f, {'x': 0.5, 'y': -2.0}, **point)['hvp']
+    assert np.allclose([product['x'], product['y']], hessian @ [0.5, -2.0])
+    assert ad.hvp(f, {}, **point)['hvp'] == {'x': 0, 'y': 0}
+
+
+def test_hessian_dictionaries():
+    # dictionaries, wrt, and powers at their singular points
+    x = ad.var('x')
+    y = ad.var('y')
+    assert ad.hessian(x ** 2 * y, x=3.0, y=2.0)['hessian'] == {'x': {'x': 4.0, 'y': 6.0}, 'y': {'x': 6.0, 'y': 0.0}}
+    assert ad.hessian(x ** 2 * y, x=3.0, y=2.0, wrt=['y'])['hessian'] == {'y': {'y': 0.0}}
+    assert ad.hessian(x ** 1, x=0.0)['hessian']['x']['x'] == 0.0
+
+
+def test_hessian_invalid_arguments():
+    x = ad.var('x')
+    y = ad.var('y')
+    f = ad.sin(x * y)
+    with pytest.raises(ValueError):
+        ad.hessian(f, x=0.7)
+    with pytest.raises(ValueError):
+        ad.hvp(f, {'z': 1.0}, x=0.7, y=1.3)
+    with pytest.raises(ValueError):
+        ad.hessian(cube(x), x=1.0)
+
+
+def test_taylor_mode():
+    # closed forms of the derivatives
+    x = ad.var('x')
+    y = ad.var('y')
+    result = ad.exp(2 * x).evaluate(x=0.0, order=4, direction={'x': 1.0})
+    assert result == {'value': 1.0, 'derivative': {1: 2.0, 2: 4.0, 3: 8.0, 4: 16.0}}
+    assert (1 / (1 - x)).evaluate(x=0.0, order=5, direction={'x': 1})['derivative'] == \
+        {1: 1.0, 2: 2.0, 3: 6.0, 4: 24.0, 5: 120.0}
+    assert (x ** 3).evaluate(x=0.0, order=4, direction={'x': 1})['derivative'] == {1: 0, 2: 0, 3: 6.0, 4: 0}
+    assert ad.tan(x).evaluate(x=0.0, order=5, direction={'x': 1})['derivative'][5] == pytest.approx(16.0)
+    assert (x ** y).evaluate(x=2.0, y=3.0, order=2, direction={'y': 1})['derivative'][2] == \
+        pytest.approx(8 * np.log(2) ** 2)
+
+
+def test_taylor_mode_values():
+    # the values match the other modes exactly, and large arguments don't overflow
+    x = ad.var('x')
+    assert ad.tan(x).evaluate(x=1.0, order=2, direction={'x': 1})['value'] == ad.tan(x).evaluate(x=1.0)['value']
+    assert ad.tanh(x).evaluate(x=800.0, order=2, direction={'x': 1}) == {'value': 1.0, 'derivative': {1: 0.0, 2: 0.0}}
+    assert ad.tanh(x).evaluate(x=0.3, order=3, direction={'x': 1})['derivative'][3] == \
+        pytest.approx(-2 * (1 - np.tanh(0.3) ** 2) * (1 - 3 * np.tanh(0.3) ** 2))
+
+
+def taylor_function():
+    """This function returns a function of x and y that uses every operation with a Taylor rule."""
+    x = ad.var('x')
+    y = ad.var('y')
+    return ad.sin(x * y) + ad.sqrt(x) * ad.logistic(y) - ad.log(x, y) + ad.arctan(x / y) + ad.prod([x, y, 3]) + \
+        ad.cosh(x) * ad.tanh(y) + ad.arcsin(y / 4) ** 2 / ad.arccos(x / 3) - ad.sum([x, ad.ln(y)]) + (x < y)
+
+
+def test_taylor_mode_second_order():
+    # the first and second orders match the gradient and the Hessian
+    f = taylor_function()
+    point = {'x': 0.7, 'y': 1.3}
+    direction = {'x': 0.3, 'y': -0.2}
+    result = f.evaluate(order=2, direction=direction, **point)
+    expected = ad.hessian(f, **point)
+    assert result['value'] == f.evaluate(**point)['value']
+    assert np.isclose(result['derivative'][1], sum(expected['derivative'][k] * direction[k] for k in point))
+    assert np.isclose(result['derivative'][2], sum(expected['hessian'][j][k] * direction[j] * direction[k]
+                                                   for j in point for k in point))
+
+
+def test_taylor_mode_third_order():
+    # the third order matches differences of the second order
+    f = taylor_function()
+    point = {'x': 0.7, 'y': 1.3}
+    direction = {'x': 0.3, 'y': -0.2}
+    result = f.evaluate(order=3, direction=direction, **point)
+    step = 1e-5
+    second = [f.evaluate(order=2, direction=direction, **{k: point[k] + t * direction[k] for k in point})
+              for t in (step, -step)]
+    assert np.isclose(result['derivative'][3], (second[0]['derivative'][2] - second[1]['derivative'][2]) / (2 * step))
+
+
+def test_taylor_mode_invalid_arguments():
+    x = ad.var('x')
+    y = ad.var('y')
+    f = ad.sin(x * y)
+    point = {'x': 0.7, 'y': 1.3}
+    direction = {'x': 0.3, 'y': -0.2}
+    with pytest.raises(ValueError):
+        f.evaluate(order=2, **point)
+    with pytest.raises(ValueError):
+        f.evaluate(order=0, direction=direction, **point)
+    with pytest.raises(ValueError):
+        f.evaluate(order=2, direction={'z': 1.0}, **point)
+    with pytest.raises(ValueError):
+        f.evaluate(order=2, direction=direction, mode='reverse', **point)
+    with pytest.raises(ValueError):
+        ad.evaluate([f], order=2, direction=direction, **point)
+    with pytest.raises(ValueError):
+        (x ** 0.5).evaluate(x=0.0, order=2, direction={'x': 1.0})
+    with pytest.raises(ValueError):
+        cube(x).evaluate(x=1.0, order=2, direction={'x': 1.0})
+
+
+def banded_outputs(n):
+    """This function returns the outputs of a function with a banded Jacobian, with an extra
+    output that depends on one variable and one that is constant, and a point to evaluate them at.
+
+    arguments:
+    n -- the number of variables
+    """
+    xs = [ad.var(f'x{i:02d}') for i in range(n)]
+    outputs = [ad.sin(xs[i]) * xs[(i + 1) % n] + xs[i - 1] ** 2 for i in range(n)] + [ad.exp(xs[0]), ad.const(2.0) * 1]
+    values = {f'x{i:02d}': 0.1 + 0.02 * i for i in range(n)}
+    return outputs, values
+
+
+def test_sparse_jacobian():
+    # the compressed Jacobian matches the dense one in both modes
+    n = 30
+    outputs, values = banded_outputs(n)
+    expected = ad.evaluate(outputs, output='array', **values)
+    for mode in ['forward', 'reverse']:
+        result = ad.sparse_jacobian(outputs, mode=mode, **values)
+        jacobian = result['derivative']
+        assert result['colors'] < n // 4
+        assert jacobian.shape == (n + 2, n) and jacobian.nnz == 3 * n + 1
+        assert np.array_equal(jacobian.indptr, np.cumsum([0] + [3] * n + [1, 0]))
+        assert np.allclose(jacobian.toarray(), expected['derivative'])
+        assert np.allclose(result['value'], expected['value'])
+
+
+def test_sparse_jacobian_wrt():
+    # only the columns in wrt are computed
+    outputs, values = banded_outputs(30)
+    point = {key: values[key] for key in ['x00', 'x01', 'x02', 'x03', 'x29']}
+    result = ad.sparse_jacobian(outputs[:3], wrt=['x01', 'x00'], **point)
+    expected = ad.evaluate(outputs[:3], wrt=['x01', 'x00'], output='array', **point)
+    assert np.allclose(result['derivative'].toarray(), expected['derivative'])
+
+
+def test_color_columns():
+    # two columns that share a row never share a color
+    colors, count = ad.color_columns([[0, 1], [1, 2], [2, 0]], 3)
+    assert count == 3 and len(set(colors)) == 3
+
+
+def test_sparse_jacobian_to_scipy():
+    outputs, values = banded_outputs(30)
+    jacobian = ad.sparse_jacobian(outputs, **values)['derivative']
+    try:
+        import scipy.sparse
+    except ImportError:
+        with pytest.raises(ImportError):
+            jacobian.to_scipy()
+    else:
+        assert np.allclose(jacobian.to_scipy().toarray(), jacobian.toarray())
+
+
+def test_sparse_jacobian_invalid_arguments():
+    outputs, values = banded_outputs(30)
+    with pytest.raises(ValueError):
+        ad.sparse_jacobian(outputs, output='array', **values)
+    with pytest.raises(ValueError):
+        ad.sparse_jacobian(outputs, x00=1.0)
+
+
+def seeded_function():
+    """This function returns a function of x and y, a seed matrix with three directions, and the
+    directional derivatives of the function in these directions at x=0.3 and y=0.7."""
+    x = ad.var('x')
+    y = ad.var('y')
+    f = ad.sin(x) * y + ad.exp(x * y)
+    directions = [(1.0, 0.0), (0.0, 1.0), (2.0, -1.0)]
+    expected = [f.evaluate(x=0.3, y=0.7, seed_dict={'x': dx, 'y': dy}) for dx, dy in directions]
+    expected = np.array([result['derivative']['x'] + result['derivative']['y'] for result in expected])
+    return f, np.array(directions).T, expected
+
+
+def test_seed_matrix():
+    # the rows of the seed matrix follow the order of wrt
+    f, matrix, expected = seeded_function()
+    for mode in ['forward', 'reverse']:
+        result = f.evaluate(x=0.3, y=0.7, seed_dict=matrix, mode=mode)
+        assert result['derivative'].shape == (3,)
+        assert np.allclose(result['derivative'], expected)
+        result = f.evaluate(x=0.3, y=0.7, seed_dict={'x': [1, 0, 2], 'y': [0, 1, -1]}, mode=mode)
+        assert np.allclose(result['derivative'], expected)
+    result = f.evaluate(x=0.3, y=0.7, seed_dict=matrix[::-1], wrt=['y', 'x'])
+    assert np.allclose(result['derivative'], expected)
+
+
+def test_seed_matrix_missing_variables():
+    # missing variables get zero seeds
+    f, matrix, expected = seeded_function()
+    result = f.evaluate(x=0.3, y=0.7, seed_dict={'x': [1, 2]})
+    assert np.allclose(result['derivative'], expected[0] * np.array([1, 2]))
+
+
+def test_seed_matrix_batches():
+    # batches put the directions along the first axis
+    f, matrix, expected = seeded_function()
+    xs = np.linspace(0.1, 0.5, 4)
+    for mode in ['forward', 'reverse']:
+        batch = f.evaluate_batch(x=xs, y=0.7, seed_dict=matrix, mode=mode)
+        assert batch['derivative'].shape == (3, 4)
+        full = f.evaluate_batch(x=xs, y=0.7)['derivative']
+        assert np.allclose(batch['derivative'], matrix.T @ np.array([full['x'], full['y']]))
+
+
+def test_seed_matrix_vector_outputs():
+    # the derivative of vector valued functions has one column per direction
+    f, matrix, expected = seeded_function()
+    x = ad.var('x')
+    y = ad.var('y')
+    outputs = [f, x * y, ad.const(3.0) + 0]
+    jacobian = ad.evaluate(outputs, x=0.3, y=0.7, output='array')['derivative']
+    for mode in ['forward', 'reverse']:
+        result = ad.evaluate(outputs, x=0.3, y=0.7, seed_dict=matrix, mode=mode, output='array')
+        assert result['derivative'].shape == (3, 3)
+        assert np.allclose(result['derivative'], jacobian @ matrix)
+        results = ad.evaluate(outputs, x=0.3, y=0.7, seed_dict=matrix, mode=mode)
+        assert np.allclose([r['derivative'] for r in results], jacobian @ matrix)
+    out = (np.empty(3), np.empty((3, 3)))
+    result = ad.evaluate(outputs, x=0.3, y=0.7, seed_dict=matrix, output='array', out=out)
+    assert result['derivative'] is out[1]
+
+
+def test_seed_matrix_not_cached():
+    # the results are not cached
+    f, matrix, expected = seeded_function()
+    f.enable_cache()
+    f.evaluate(x=0.3, y=0.7, seed_dict={'x': (1, 0), 'y': (0, 1)})
+    assert f.cache_info()['size'] == 0
+
+
+def test_seed_matrix_invalid_arguments():
+    f, matrix, expected = seeded_function()
+    with pytest.raises(ValueError):
+        f.evaluate(x=0.3, y=0.7, seed_dict=np.ones((3, 2)))
+    with pytest.raises(ValueError):
+        f.evaluate(x=0.3, y=0.7, seed_dict={'x': [1, 0], 'y': [1, 0, 0]})
+    with pytest.raises(ValueError):
+        f.evaluate(x=0.3, y=0.7, seed_dict={'x': [1, 0], 'y': 1})
+    with pytest.raises(ValueError):
+        f.evaluate(x=0.3, y=0.7, seed_dict=np.ones((2, 2)), plot='test.gif')
+    with pytest.raises(ValueError):
+        ad.evaluate([f, f * 2], x=0.3, y=0.7, seed_dict=np.ones(2))